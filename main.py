@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import multiprocessing
 import sys
 
 py_major, py_minor, _, _, _ = sys.version_info
@@ -21,4 +22,6 @@ def main(argv: list[str]) -> int:
 
 
 if __name__ == "__main__":
+    # required for the detection process pool in frozen (pyinstaller) executables
+    multiprocessing.freeze_support()
     sys.exit(main(sys.argv))
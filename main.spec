@@ -1,5 +1,6 @@
 import os
 import sys
+from PyInstaller.utils.hooks import collect_submodules
 sys.setrecursionlimit(5000)
 
 ROOT = os.path.abspath('.')
@@ -9,7 +10,8 @@ a = Analysis(['main.py'],
              pathex=[ROOT],
              binaries=[],
              datas=[],
-             hiddenimports=[],
+             # watchdog selects the observer for the platform at runtime
+             hiddenimports=collect_submodules('watchdog.observers'),
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
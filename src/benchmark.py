@@ -0,0 +1,344 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+import cv2
+import numpy
+
+from . import detector
+
+
+DEFAULT_SIZES = ((1920, 1080), (4000, 3000), (6000, 4000))
+
+# 計測する段階（`detect_meteor()`の処理順）
+STAGES = ("decode", "threshold", "area", "fill", "hough", "detect")
+
+# 差がこれ未満の場合は回帰とみなさない[s]
+MIN_REGRESSION = 0.0005
+
+Segment = tuple[int, int, int, int]
+
+
+def synthesize_frame(width: int, height: int, seed: int, meteor: bool = True) -> tuple[numpy.array, typing.Optional[Segment]]:
+    """
+    夜空の合成画像の生成
+    光害のグラデーション・ノイズ・星・明るい雲・木のシルエットと、流星の光跡を描画する
+    同じ引数からは同じ画像が得られる
+    :param width: 幅
+    :param height: 高さ
+    :param seed: 乱数シード
+    :param meteor: 流星を描画するか
+    :return: (BGR画像, 流星の端点`(x0, y0, x1, y1)` or None)
+    """
+    rng = numpy.random.default_rng(seed)
+    area = width * height
+    # 地平線側が明るい空とセンサーノイズ
+    gradient = numpy.linspace(15, 45, height, dtype=numpy.float32)[:, numpy.newaxis]
+    img = rng.normal(0, 4, (height, width)).astype(numpy.float32)
+    img += gradient
+    # 月明かりに照らされた雲（低周波ノイズを拡大）
+    clouds = rng.random((height // 64 + 2, width // 64 + 2), dtype=numpy.float32)
+    clouds = cv2.resize(clouds, (width, height), interpolation=cv2.INTER_CUBIC)
+    img += numpy.clip((clouds - 0.6) * 2.5, 0, 1) * float(rng.uniform(60, 160))
+    # 星
+    for _ in range(area // 4000):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.choice((1, 1, 1, 2, 2, 3)))
+        cv2.circle(img, (x, y), radius, float(rng.integers(80, 255)), -1, cv2.LINE_AA)
+    # 流星
+    segment = None
+    if meteor:
+        diagonal = (width ** 2 + height ** 2) ** 0.5
+        length = diagonal * rng.uniform(0.08, 0.2)
+        angle = rng.uniform(0, numpy.pi)
+        x0 = rng.uniform(0.1, 0.9) * width
+        y0 = rng.uniform(0.05, 0.6) * height
+        x1 = numpy.clip(x0 + length * numpy.cos(angle), 0, width - 1)
+        y1 = numpy.clip(y0 + length * numpy.sin(angle), 0, height - 1)
+        segment = (int(x0), int(y0), int(x1), int(y1))
+        thickness = max(1, round(min(width, height) / 2000))
+        cv2.line(img, segment[:2], segment[2:], float(rng.integers(200, 255)), thickness, cv2.LINE_AA)
+    # 画面下部の木のシルエット
+    xs = numpy.linspace(0, width, 101)
+    ys = height * (1 - numpy.abs(numpy.cumsum(rng.normal(0, 0.01, xs.size))) - 0.05)
+    polygon = numpy.concatenate([numpy.stack([xs, ys], axis=1), [[width, height], [0, height]]]).astype(numpy.int32)
+    cv2.fillPoly(img, [polygon], 5.0)
+    gray = numpy.clip(img, 0, 255).astype(numpy.uint8)
+    # わずかに色味を付ける
+    bgr = cv2.merge([cv2.add(gray, 4), gray, cv2.subtract(gray, 2)])
+    return bgr, segment
+
+
+def generate_frames(directory: str, width: int, height: int, count: int, seed: int = 0) -> list[tuple[str, typing.Optional[Segment]]]:
+    """
+    合成画像のJPEGファイルの生成（生成済みのものは再利用する）
+    偶数番目の画像に流星を描画する
+    :param directory: 出力ディレクトリ
+    :param width: 幅
+    :param height: 高さ
+    :param count: 枚数
+    :param seed: 乱数シード
+    :return: (ファイルパス, 流星の端点 or None) のリスト
+    """
+    frames = []
+    for i in range(count):
+        frame_seed = int(numpy.random.SeedSequence((seed, width, height, i)).generate_state(1)[0])
+        meteor = i % 2 == 0
+        filepath = os.path.join(directory, "synthetic_{}x{}_{}_{:04d}.jpg".format(width, height, seed, i))
+        labelpath = filepath + ".json"
+        if os.path.exists(filepath) and os.path.exists(labelpath):
+            with open(labelpath) as f:
+                segment = json.load(f)["meteor"]
+            frames.append((filepath, tuple(segment) if segment else None))
+            continue
+        img, segment = synthesize_frame(width, height, frame_seed, meteor)
+        cv2.imwrite(filepath, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        with open(labelpath, "w") as f:
+            json.dump({"meteor": segment}, f)
+        frames.append((filepath, segment))
+    return frames
+
+
+def time_stages(filepath: str, params: dict) -> dict[str, float]:
+    """
+    1枚の画像の段階ごとの処理時間の計測
+    :param filepath: 入力ファイルパス
+    :param params: `detect_meteor()`のパラメーター
+    :return: 段階名 → 処理時間[s]
+    """
+    timer = time.perf_counter
+    result = {}
+    t = timer()
+    img = detector.load_image(filepath)
+    result["decode"] = timer() - t
+    t = timer()
+    img = detector.binarize(img, params["input_threshold"], params["input_maxvalue"])
+    result["threshold"] = timer() - t
+    t = timer()
+    contours = detector.detect_area(img, params["area_threshold"], params["area_method"])
+    result["area"] = timer() - t
+    t = timer()
+    if contours:
+        img = detector.fill_area(img, contours, buffer_ratio=params["buffer_ratio"], color=0)
+    result["fill"] = timer() - t
+    t = timer()
+    detector.detect_segments(img, 1)
+    result["hough"] = timer() - t
+    t = timer()
+    detector.detect_meteor(filepath, **params)
+    result["detect"] = timer() - t
+    return result
+
+
+def peak_memory(filepath: str, params: dict) -> int:
+    """
+    :param filepath: 入力ファイルパス
+    :param params: `detect_meteor()`のパラメーター
+    :return: `detect_meteor()`のnumpy配列等の最大確保量[byte]（OpenCV内部の一時領域は含まない）
+    """
+    tracemalloc.start()
+    try:
+        detector.detect_meteor(filepath, **params)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    values = numpy.asarray(values)
+    return dict(
+        median=float(numpy.median(values)),
+        mean=float(values.mean()),
+        min=float(values.min()),
+        p90=float(numpy.percentile(values, 90)),
+        max=float(values.max()),
+    )
+
+
+def run(sizes: typing.Iterable[tuple[int, int]], frames: int, repeat: int, params: dict, directory: str, seed: int = 0, progress: typing.Callable[[str], None] = None) -> dict:
+    """
+    ベンチマークの実行
+    :param sizes: 画像サイズ`(width, height)`のリスト
+    :param frames: サイズごとの枚数
+    :param repeat: 繰り返し回数
+    :param params: `detect_meteor()`のパラメーター
+    :param directory: 合成画像の保存先
+    :param seed: 乱数シード
+    :param progress: 進捗表示
+    :return: 計測結果（`save()`で保存する形式）
+    """
+    results = []
+    for width, height in sizes:
+        name = "{}x{}".format(width, height)
+        if progress is not None:
+            progress("generating {} frames of {}".format(frames, name))
+        labeled = generate_frames(directory, width, height, frames, seed)
+        times = {x: [] for x in STAGES}
+        for _ in range(repeat):
+            for filepath, _ in labeled:
+                for stage, value in time_stages(filepath, params).items():
+                    times[stage].append(value)
+        # 検出結果の確認とメモリ使用量の計測（計測の影響を受けないよう時間とは別に行う）
+        detected = false_positives = 0
+        peak = 0
+        for filepath, segment in labeled:
+            lines, _, _ = detector.detect_meteor(filepath, **params)
+            if lines is not None:
+                if segment is None:
+                    false_positives += 1
+                else:
+                    detected += 1
+            peak = max(peak, peak_memory(filepath, params))
+        stages = {x: summarize(v) for x, v in times.items()}
+        result = dict(
+            size=name,
+            frames=frames,
+            repeat=repeat,
+            stages=stages,
+            fps=len(times["detect"]) / sum(times["detect"]),
+            peak_memory=peak,
+            meteors=sum(1 for _, x in labeled if x is not None),
+            detected=detected,
+            false_positives=false_positives,
+        )
+        results.append(result)
+        if progress is not None:
+            progress(format_result(result))
+    return dict(
+        created=datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        environment=dict(
+            python=platform.python_version(),
+            platform=platform.platform(),
+            machine=platform.machine(),
+            cpu_count=os.cpu_count(),
+            numpy=numpy.__version__,
+            opencv=cv2.__version__,
+        ),
+        params=params,
+        seed=seed,
+        results=results,
+    )
+
+
+def format_result(result: dict) -> str:
+    lines = ["{size}: {fps:.2f} frames/s, peak {memory:.1f} MiB, detected {detected}/{meteors}, false positives {false_positives}".format(
+        memory=result["peak_memory"] / 1024 / 1024, **result)]
+    for stage, stats in result["stages"].items():
+        lines.append("  {:<10} median {:9.2f} ms  p90 {:9.2f} ms  min {:9.2f} ms".format(
+            stage, stats["median"] * 1000, stats["p90"] * 1000, stats["min"] * 1000))
+    return "\n".join(lines)
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.1) -> list[str]:
+    """
+    基準の計測結果との比較
+    :param current: 今回の計測結果
+    :param baseline: 基準の計測結果
+    :param tolerance: 許容する処理時間の増加率
+    :return: 回帰の内容のリスト
+    """
+    regressions = []
+    previous = {x["size"]: x for x in baseline["results"]}
+    for result in current["results"]:
+        base = previous.get(result["size"])
+        if base is None:
+            continue
+        for stage, stats in result["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            before = base["stages"][stage]["median"]
+            after = stats["median"]
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION:
+                regressions.append("{} {}: {:.2f} ms -> {:.2f} ms ({:+.0%})".format(
+                    result["size"], stage, before * 1000, after * 1000, after / before - 1))
+        if result["detected"] < base["detected"] or result["false_positives"] > base["false_positives"]:
+            regressions.append("{} detection: {}/{} (fp {}) -> {}/{} (fp {})".format(
+                result["size"], base["detected"], base["meteors"], base["false_positives"],
+                result["detected"], result["meteors"], result["false_positives"]))
+    return regressions
+
+
+def save(filepath: str, result: dict) -> None:
+    with open(filepath, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+def load(filepath: str) -> dict:
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    try:
+        width, height = (int(x) for x in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("size must be WIDTHxHEIGHT: {}".format(value))
+    return width, height
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="benchmark the detection pipeline on synthetic night-sky frames")
+    parser.add_argument("--size", type=parse_size, action="append", dest="sizes", help="frame size WIDTHxHEIGHT (repeatable, default: {})".format(
+        ", ".join("{}x{}".format(*x) for x in DEFAULT_SIZES)))
+    parser.add_argument("--frames", type=int, default=4, help="frames per size")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed passes over the frames")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="keep the generated frames in this directory (default: temporary)")
+    parser.add_argument("--input-threshold", type=float, default=127)
+    parser.add_argument("--input-maxvalue", type=float, default=255)
+    parser.add_argument("--area-threshold", type=float, default=0.0001)
+    parser.add_argument("--buffer-ratio", type=float, default=1.1)
+    parser.add_argument("--line-threshold", type=float, default=100)
+    parser.add_argument("--area-method", choices=detector.AREA_METHODS, default="contour")
+    parser.add_argument("--prescreen", type=int, choices=detector.PRESCREEN_SCALES, default=1)
+    parser.add_argument("-o", "--output", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="compare against the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline (0.1: 10%%)")
+
+    args = parser.parse_args(argv[1:])
+    params = dict(
+        input_threshold=args.input_threshold,
+        input_maxvalue=args.input_maxvalue,
+        area_threshold=args.area_threshold,
+        buffer_ratio=args.buffer_ratio,
+        line_threshold=args.line_threshold,
+        area_method=args.area_method,
+        prescreen=args.prescreen
+    )
+    sizes = args.sizes or DEFAULT_SIZES
+
+    def progress(message: str):
+        print(message, file=sys.stderr, flush=True)
+
+    if args.workdir is not None:
+        os.makedirs(args.workdir, exist_ok=True)
+        result = run(sizes, args.frames, args.repeat, params, args.workdir, args.seed, progress)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run(sizes, args.frames, args.repeat, params, workdir, args.seed, progress)
+    if args.output is not None:
+        save(args.output, result)
+
+    if args.baseline is not None:
+        baseline = load(args.baseline)
+        if baseline["params"] != result["params"] or baseline["seed"] != result["seed"]:
+            progress("warning: the baseline was measured with different parameters")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("regressions:")
+            for line in regressions:
+                print(line)
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import typing
+import zlib
+
+import numpy
+
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1GiB
+
+# 参照日時の更新をまとめる件数
+COMMIT_INTERVAL = 100
+
+
+def default_cache_path() -> str:
+    """
+    既定のキャッシュファイルパス
+    :return: プラットフォームのキャッシュディレクトリ以下のパス
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "MeteorDetector", "results.sqlite3")
+
+
+def file_identity(filepath: str) -> typing.Optional[tuple[str, int, int]]:
+    """
+    ファイルの同一性判定用の値
+    :param filepath: ファイルパス
+    :return: (絶対パス, サイズ, 更新日時[ns]) or None（ファイルが存在しない場合）
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+
+def params_key(params: dict) -> str:
+    """
+    検出パラメーターのキャッシュキー
+    :param params: `detect_meteor()`のパラメーター
+    :return: キー文字列
+    """
+    return json.dumps(params, sort_keys=True)
+
+
+def simplify_contour(contour: numpy.array) -> numpy.array:
+    """
+    輪郭から直線上の中間点を取り除く（`cv2.CHAIN_APPROX_SIMPLE`相当）
+    面積・凸包・描画結果は変わらない
+    :param contour: `[N, 1, 2]`形式の輪郭
+    :return: 簡略化した輪郭
+    """
+    points = contour.reshape(-1, 2)
+    if len(points) < 3:
+        return contour
+    # 前後の点への移動方向が同じ点は直線上の中間点
+    forward = numpy.roll(points, -1, axis=0) - points
+    backward = points - numpy.roll(points, 1, axis=0)
+    keep = numpy.any(forward != backward, axis=1)
+    if not keep.any():
+        return contour
+    return points[keep].reshape(-1, 1, 2)
+
+
+def pack_lines(lines: typing.Optional[numpy.array]) -> bytes:
+    """
+    :param lines: `cv2.HoughLinesP()`の検出直線リスト or None
+    :return: 保存用データ（None の場合は空）
+    """
+    if lines is None:
+        return b""
+    return numpy.asarray(lines, dtype=numpy.int32).reshape(-1, 4).tobytes()
+
+
+def unpack_lines(data: bytes) -> typing.Optional[numpy.array]:
+    """
+    :param data: `pack_lines()`の保存用データ
+    :return: `[N, 1, 4]`形式の直線リスト or None
+    """
+    if not data:
+        return None
+    return numpy.frombuffer(data, dtype=numpy.int32).copy().reshape(-1, 1, 4)
+
+
+def pack_area(contours: list[numpy.array], shape: tuple[int, int]) -> bytes:
+    """
+    :param contours: 領域リスト
+    :param shape: 画像サイズ`(height, width)`
+    :return: 保存用データ
+    """
+    contours = [simplify_contour(x) for x in contours]
+    counts = numpy.array([len(x) for x in contours], dtype=numpy.int32)
+    if contours:
+        points = numpy.concatenate([x.reshape(-1, 2) for x in contours]).astype(numpy.int32)
+    else:
+        points = numpy.zeros((0, 2), dtype=numpy.int32)
+    height, width = shape
+    header = numpy.array([height, width, len(counts)], dtype=numpy.int32)
+    return zlib.compress(header.tobytes() + counts.tobytes() + points.tobytes())
+
+
+def unpack_area(data: bytes) -> tuple[list[numpy.array], tuple[int, int]]:
+    """
+    :param data: `pack_area()`の保存用データ
+    :return: (領域リスト, 画像サイズ)
+    """
+    buffer = numpy.frombuffer(zlib.decompress(data), dtype=numpy.int32).copy()
+    height, width, size = buffer[:3]
+    counts = buffer[3:3 + size]
+    points = buffer[3 + size:].reshape(-1, 1, 2)
+    contours = numpy.split(points, numpy.cumsum(counts)[:-1]) if size else []
+    return contours, (int(height), int(width))
+
+
+class ResultCache:
+    """
+    検出処理の段階ごとの結果の永続キャッシュ
+    ファイルの(パス, サイズ, 更新日時)・段階名・その段階が依存するパラメーターをキーとしてSQLiteに保存する
+    複数プロセスから同時に読み書きできるよう、書き込みは1件ごとにコミットする
+    """
+
+    def __init__(self, filepath: typing.Optional[str] = None, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        :param filepath: キャッシュファイルパス（未指定の場合は`default_cache_path()`）
+        :param max_size: キャッシュの最大サイズ[byte]。`trim()`で最終参照の古いものから削除する
+        """
+        if filepath is None:
+            filepath = default_cache_path()
+        dirname = os.path.dirname(filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.filepath = filepath
+        self.max_size = max_size
+        self.connection = sqlite3.connect(filepath, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS stages (
+                path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                params TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (path, stage, params)
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS stages_accessed ON stages (accessed)")
+        # 参照日時の更新は書き込みロックを取らないよう`flush()`でまとめて行う
+        self.touched = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def flush(self) -> None:
+        if not self.touched:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "UPDATE stages SET accessed = ? WHERE path = ? AND stage = ? AND params = ?",
+                ((now, ) + x for x in self.touched)
+            )
+        self.touched = []
+
+    def get(self, identity: tuple[str, int, int], stage: str, params: dict) -> typing.Optional[bytes]:
+        """
+        :param identity: `file_identity()`の値
+        :param stage: 段階名
+        :param params: その段階が依存するパラメーター
+        :return: 保存データ or None（キャッシュが無い、または古い場合）
+        """
+        path, size, mtime = identity
+        key = params_key(params)
+        row = self.connection.execute(
+            "SELECT data FROM stages WHERE path = ? AND stage = ? AND params = ? AND size = ? AND mtime = ?",
+            (path, stage, key, size, mtime)
+        ).fetchone()
+        if row is None:
+            return None
+        self.touched.append((path, stage, key))
+        if len(self.touched) >= COMMIT_INTERVAL:
+            self.flush()
+        return row[0]
+
+    def contains(self, identity: tuple[str, int, int], stage: str, params: dict) -> bool:
+        """
+        :param identity: `file_identity()`の値
+        :param stage: 段階名
+        :param params: その段階が依存するパラメーター
+        :return: 有効なキャッシュが存在するか
+        """
+        path, size, mtime = identity
+        row = self.connection.execute(
+            "SELECT 1 FROM stages WHERE path = ? AND stage = ? AND params = ? AND size = ? AND mtime = ?",
+            (path, stage, params_key(params), size, mtime)
+        ).fetchone()
+        return row is not None
+
+    def put(self, identity: tuple[str, int, int], stage: str, params: dict, data: bytes) -> None:
+        """
+        :param identity: `file_identity()`の値
+        :param stage: 段階名
+        :param params: その段階が依存するパラメーター
+        :param data: 保存データ
+        """
+        path, size, mtime = identity
+        self.connection.execute(
+            "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, stage, params_key(params), size, mtime, data, len(path) + len(data), time.time())
+        )
+
+    def size(self) -> int:
+        """
+        :return: 保存データの合計サイズ[byte]
+        """
+        return self.connection.execute("SELECT COALESCE(SUM(nbytes), 0) FROM stages").fetchone()[0]
+
+    def trim(self) -> int:
+        """
+        最大サイズを超えている場合に、最大サイズの9割まで削除する
+        :return: 削除件数
+        """
+        if self.size() <= self.max_size:
+            return 0
+        return self.evict(self.max_size * 9 // 10)
+
+    def evict(self, size: int) -> int:
+        """
+        最終参照の古いものから削除する
+        :param size: 削除後の目標サイズ[byte]
+        :return: 削除件数
+        """
+        self.flush()
+        total = self.size()
+        rowids = []
+        for rowid, nbytes in self.connection.execute("SELECT rowid, nbytes FROM stages ORDER BY accessed").fetchall():
+            if total <= size:
+                break
+            rowids.append((rowid,))
+            total -= nbytes
+        if rowids:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("DELETE FROM stages WHERE rowid = ?", rowids)
+        return len(rowids)
+
+    def invalidate(self, directory: typing.Optional[str] = None) -> int:
+        """
+        キャッシュの削除
+        :param directory: 削除対象のディレクトリ（未指定の場合は全て）
+        :return: 削除件数
+        """
+        self.touched = []
+        if directory is None:
+            cursor = self.connection.execute("DELETE FROM stages")
+        else:
+            prefix = os.path.join(os.path.abspath(directory), "")
+            # `LIKE`はASCIIの大文字・小文字を区別しないため、先頭の文字列をそのまま比較する
+            cursor = self.connection.execute("DELETE FROM stages WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        return cursor.rowcount
+
+    def info(self) -> tuple[int, int]:
+        """
+        :return: (件数, サイズ[byte])
+        """
+        count = self.connection.execute("SELECT COUNT(*) FROM stages").fetchone()[0]
+        return count, self.size()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="manage the detection result cache")
+    parser.add_argument("--cache", default=None, help="cache file (default: {})".format(default_cache_path()))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="show number of entries and size")
+    clear = subparsers.add_parser("clear", help="invalidate cached results")
+    clear.add_argument("directory", nargs="?", default=None, help="invalidate only the results under this directory")
+    evict = subparsers.add_parser("evict", help="evict least recently used results")
+    evict.add_argument("size", type=float, help="target size [MiB]")
+
+    args = parser.parse_args(argv[1:])
+
+    with ResultCache(args.cache) as cache:
+        if args.command == "info":
+            count, size = cache.info()
+            print("{}: {} entries, {:.1f} MiB".format(cache.filepath, count, size / 1024 / 1024))
+        elif args.command == "clear":
+            print("removed: {}".format(cache.invalidate(args.directory)))
+        elif args.command == "evict":
+            print("removed: {}".format(cache.evict(int(args.size * 1024 * 1024))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,115 @@
+import json
+import typing
+
+
+class Config:
+    def __init__(self, input_threshold: float = 127,
+                 area_threshold: float = 0.0001,
+                 buffer_ratio: float = 1.1,
+                 line_threshold: float = 100,
+                 jobs: int = 0,
+                 area_method: str = "contour",
+                 prescreen: int = 1,
+                 read_ahead: int = 4,
+                 read_ahead_memory: int = 256,
+                 mask: typing.Optional[str] = None,
+                 min_pixels: int = 0,
+                 min_residual: int = 0,
+                 min_change: int = 0):
+        self.input_threshold = input_threshold
+        self.input_maxvalue = 255
+        self.mask = mask  # None: whole frame
+        self.area_threshold = area_threshold
+        self.buffer_ratio = buffer_ratio
+        self.area_method = area_method
+        self.line_threshold = line_threshold
+        self.min_pixels = min_pixels  # 0: off
+        self.min_residual = min_residual  # 0: off
+        self.min_change = min_change  # 0: off
+        self.jobs = jobs  # 0: auto
+        self.prescreen = prescreen  # 1: off
+        self.read_ahead = read_ahead  # 0: off
+        self.read_ahead_memory = read_ahead_memory  # MiB
+
+    def clone(self):
+        return Config(
+            input_threshold=self.input_threshold,
+            area_threshold=self.area_threshold,
+            buffer_ratio=self.buffer_ratio,
+            line_threshold=self.line_threshold,
+            jobs=self.jobs,
+            area_method=self.area_method,
+            prescreen=self.prescreen,
+            read_ahead=self.read_ahead,
+            read_ahead_memory=self.read_ahead_memory,
+            mask=self.mask,
+            min_pixels=self.min_pixels,
+            min_residual=self.min_residual,
+            min_change=self.min_change
+        )
+
+    def load(self, filepath: str):
+        data = json.load(open(filepath))
+        if type(data) is not dict:
+            return
+        self.input_threshold = data.get("input", {}).get("threshold", 127)
+        self.input_maxvalue = data.get("input", {}).get("maxvalue", 255)
+        self.mask = data.get("input", {}).get("mask", None)
+        self.area_threshold = data.get("area", {}).get("threshold", 0.0001)
+        self.buffer_ratio = data.get("area", {}).get("buffer", 1.1)
+        self.area_method = data.get("area", {}).get("method", "contour")
+        self.line_threshold = data.get("line", {}).get("threshold", 100)
+        self.min_pixels = data.get("cascade", {}).get("min_pixels", 0)
+        self.min_residual = data.get("cascade", {}).get("min_residual", 0)
+        self.min_change = data.get("cascade", {}).get("min_change", 0)
+        self.jobs = data.get("process", {}).get("jobs", 0)
+        self.prescreen = data.get("process", {}).get("prescreen", 1)
+        self.read_ahead = data.get("process", {}).get("readahead", 4)
+        self.read_ahead_memory = data.get("process", {}).get("readahead_memory", 256)
+
+    def save(self, filepath: str):
+        config = {
+            "input": {
+                "threshold": self.input_threshold,
+                "maxvalue": self.input_maxvalue,
+                "mask": self.mask,
+            },
+            "area": {
+                "threshold": self.area_threshold,
+                "buffer": self.buffer_ratio,
+                "method": self.area_method,
+            },
+            "line": {
+                "threshold": self.line_threshold,
+            },
+            "cascade": {
+                "min_pixels": self.min_pixels,
+                "min_residual": self.min_residual,
+                "min_change": self.min_change,
+            },
+            "process": {
+                "jobs": self.jobs,
+                "prescreen": self.prescreen,
+                "readahead": self.read_ahead,
+                "readahead_memory": self.read_ahead_memory,
+            },
+        }
+        with open(filepath, "w") as fp:
+            json.dump(config, fp)
+
+    def reset(self):
+        init = Config()
+        self.input_threshold = init.input_threshold
+        self.input_maxvalue = init.input_maxvalue
+        self.mask = init.mask
+        self.area_threshold = init.area_threshold
+        self.buffer_ratio = init.buffer_ratio
+        self.area_method = init.area_method
+        self.line_threshold = init.line_threshold
+        self.min_pixels = init.min_pixels
+        self.min_residual = init.min_residual
+        self.min_change = init.min_change
+        self.jobs = init.jobs
+        self.prescreen = init.prescreen
+        self.read_ahead = init.read_ahead
+        self.read_ahead_memory = init.read_ahead_memory
@@ -1,4 +1,3 @@
-import json
 import typing
 
 from PySide2.QtCore import Slot
@@ -10,64 +9,12 @@ from PySide2.QtWidgets import QMessageBox
 from PySide2.QtWidgets import QPushButton
 from PySide2.QtWidgets import QWidget
 
+from .config import Config
+from .detector import AREA_METHODS
+from .detector import PRESCREEN_SCALES
 from .ui.configdialog import Ui_ConfigDialog
 
 
-class Config:
-    def __init__(self, input_threshold: float = 127,
-                 area_threshold: float = 0.0001,
-                 buffer_ratio: float = 1.1,
-                 line_threshold: float = 100):
-        self.input_threshold = input_threshold
-        self.input_maxvalue = 255
-        self.area_threshold = area_threshold
-        self.buffer_ratio = buffer_ratio
-        self.line_threshold = line_threshold
-
-    def clone(self):
-        return Config(
-            input_threshold=self.input_threshold,
-            area_threshold=self.area_threshold,
-            buffer_ratio=self.buffer_ratio,
-            line_threshold=self.line_threshold
-        )
-
-    def load(self, filepath: str):
-        data = json.load(open(filepath))
-        if type(data) is not dict:
-            return
-        self.input_threshold = data.get("input", {}).get("threshold", 127)
-        self.input_maxvalue = data.get("input", {}).get("maxvalue", 255)
-        self.area_threshold = data.get("area", {}).get("threshold", 0.0001)
-        self.buffer_ratio = data.get("area", {}).get("buffer", 1.1)
-        self.line_threshold = data.get("line", {}).get("threshold", 100)
-
-    def save(self, filepath: str):
-        config = {
-            "input": {
-                "threshold": self.input_threshold,
-                "maxvalue": self.input_maxvalue,
-            },
-            "area": {
-                "threshold": self.area_threshold,
-                "buffer": self.buffer_ratio,
-            },
-            "line": {
-                "threshold": self.line_threshold,
-            },
-        }
-        with open(filepath, "w") as fp:
-            json.dump(config, fp)
-
-    def reset(self):
-        init = Config()
-        self.input_threshold = init.input_threshold
-        self.input_maxvalue = init.input_maxvalue
-        self.area_threshold = init.area_threshold
-        self.buffer_ratio = init.buffer_ratio
-        self.line_threshold = init.line_threshold
-
-
 class ConfigDialog(QDialog):
     def __init__(self, parent: typing.Optional[QWidget] = None):
         super().__init__(parent)
@@ -81,6 +28,7 @@ class ConfigDialog(QDialog):
         self.saveButton.clicked.connect(self.saveConfig)
         self.loadButton.clicked.connect(self.loadConfig)
         resetButton.clicked.connect(self.reset)
+        self.ui.toolButton_threshold_mask.clicked.connect(self.selectMask)
         self.config = Config()
         self.updateUi()
 
@@ -92,9 +40,18 @@ class ConfigDialog(QDialog):
             config = self.config
         self.ui.spinBox_threshold_threshold.setValue(config.input_threshold)
         self.ui.spinBox_threshold_maxvalue.setValue(config.input_maxvalue)
+        self.ui.lineEdit_threshold_mask.setText(config.mask or "")
         self.ui.doubleSpinBox_fillarea_areathreshold.setValue(config.area_threshold * 100)
         self.ui.doubleSpinBox_fillarea_fillbuffer.setValue(config.buffer_ratio)
+        self.ui.comboBox_fillarea_method.setCurrentIndex(AREA_METHODS.index(config.area_method))
         self.ui.doubleSpinBox_meteordetection_linethreshold.setValue(config.line_threshold)
+        self.ui.spinBox_meteordetection_minpixels.setValue(config.min_pixels)
+        self.ui.spinBox_meteordetection_minresidual.setValue(config.min_residual)
+        self.ui.spinBox_meteordetection_minchange.setValue(config.min_change)
+        self.ui.spinBox_process_jobs.setValue(config.jobs)
+        self.ui.comboBox_process_prescreen.setCurrentIndex(PRESCREEN_SCALES.index(config.prescreen))
+        self.ui.spinBox_process_readahead.setValue(config.read_ahead)
+        self.ui.spinBox_process_readaheadmemory.setValue(config.read_ahead_memory)
 
     def updateConfig(self):
         """
@@ -102,13 +59,29 @@ class ConfigDialog(QDialog):
         """
         self.config.input_threshold = self.ui.spinBox_threshold_threshold.value()
         self.config.input_maxvalue = self.ui.spinBox_threshold_maxvalue.value()
+        self.config.mask = self.ui.lineEdit_threshold_mask.text() or None
         self.config.area_threshold = self.ui.doubleSpinBox_fillarea_areathreshold.value() / 100  # % -> ratio
         self.config.buffer_ratio = self.ui.doubleSpinBox_fillarea_fillbuffer.value()
+        self.config.area_method = AREA_METHODS[self.ui.comboBox_fillarea_method.currentIndex()]
         self.config.line_threshold = self.ui.doubleSpinBox_meteordetection_linethreshold.value()
+        self.config.min_pixels = self.ui.spinBox_meteordetection_minpixels.value()
+        self.config.min_residual = self.ui.spinBox_meteordetection_minresidual.value()
+        self.config.min_change = self.ui.spinBox_meteordetection_minchange.value()
+        self.config.jobs = self.ui.spinBox_process_jobs.value()
+        self.config.prescreen = PRESCREEN_SCALES[self.ui.comboBox_process_prescreen.currentIndex()]
+        self.config.read_ahead = self.ui.spinBox_process_readahead.value()
+        self.config.read_ahead_memory = self.ui.spinBox_process_readaheadmemory.value()
 
     def getConfig(self):
         return self.config
 
+    @Slot()
+    def selectMask(self):
+        filepath, _ = QFileDialog.getOpenFileName(self, self.tr("Open mask"), self.ui.lineEdit_threshold_mask.text(), self.tr("Images(*.png *.bmp *.jpg *.jpeg)"))
+        if not filepath:
+            return
+        self.ui.lineEdit_threshold_mask.setText(filepath)
+
     @Slot()
     def loadConfig(self):
         filepath, _ = QFileDialog.getOpenFileName(self, self.tr("Open config"), "", self.tr("Config.json(*.json)"))
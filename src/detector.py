@@ -1,6 +1,14 @@
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import io
+import json
 import math
 import os
+import signal
+import struct
 import sys
 import typing
 
@@ -8,41 +16,396 @@ import cv2
 import numpy
 
 
-def load_binary(filepath: str, input_threshold: float = 127, input_maxvalue: float = 255) -> numpy.array:
+PRESCREEN_SCALES = (1, 2, 4, 8)
+
+_IMREAD_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _stage(profile, name: str, scale: int = 1):
     """
-    しきい値適用済み2値画像読み込み
+    :param profile: 計測結果の記録先（`profiling.FrameProfile`、None の場合は計測しない）
+    :param name: 段階名
+    :param scale: 縮小率
+    :return: 囲んだ処理の時間を計測するコンテキスト
+    """
+    if profile is None:
+        return _NULL_STAGE
+    return profile.stage(name, scale)
+
+
+def load_image(filepath: str, scale: int = 1, data: typing.Optional[bytes] = None) -> numpy.array:
+    """
+    グレースケール画像読み込み
+    :param filepath: 入力ファイルパス
+    :param scale: 縮小率（`PRESCREEN_SCALES`のいずれか）。JPEGは縮小しながらデコードするため高速
+    :param data: 読み込み済みのファイルの内容（指定した場合はファイルを読まずにデコードする）
+    :return: グレースケール画像データ（デコードできない場合は`ValueError`を送出）
+    """
+    flags = _IMREAD_FLAGS[scale] | cv2.IMREAD_IGNORE_ORIENTATION
+    if data is not None:
+        img = cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8), flags)
+    else:
+        img = cv2.imread(str(filepath), flags)
+    if img is None:
+        raise ValueError("cannot decode the image: {}".format(filepath))
+    return img
+
+
+def image_shape(filepath: str, data: typing.Optional[bytes] = None) -> typing.Optional[tuple[int, int]]:
+    """
+    JPEGのヘッダー（SOFセグメント）からの画像サイズの取得（デコードしない）
+    :param filepath: 入力ファイルパス
+    :param data: 読み込み済みのファイルの内容（指定した場合はファイルを読まない）
+    :return: `(height, width)` or None（JPEGでない・読み込めない場合）
+    """
+    try:
+        with io.BytesIO(data) if data is not None else open(filepath, "rb") as f:
+            if f.read(2) != b"\xff\xd8":
+                return None
+            while True:
+                header = f.read(4)
+                if len(header) < 4 or header[0] != 0xFF:
+                    return None
+                marker = header[1]
+                if marker == 0xFF:
+                    # 詰め物
+                    f.seek(-3, io.SEEK_CUR)
+                    continue
+                if marker == 0xDA:
+                    # 画像データの開始
+                    return None
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    # SOF0-15（DHT・JPG・DACを除く）: 精度, 高さ, 幅
+                    frame = f.read(5)
+                    if len(frame) < 5:
+                        return None
+                    _, height, width = struct.unpack(">BHH", frame)
+                    return height, width
+                length, = struct.unpack(">H", header[2:])
+                f.seek(length - 2, io.SEEK_CUR)
+    except OSError:
+        return None
+
+
+def full_shape(shape: tuple[int, int], scale: int, filepath: str, data: typing.Optional[bytes] = None) -> tuple[int, int]:
+    """
+    縮小画像のサイズからの原寸の画像サイズの取得
+    縮小デコードは端数を切り上げるため、縮小率を掛けると原寸より大きくなりうる。JPEGはヘッダーの値を使う
+    :param shape: 縮小画像のサイズ`(height, width)`
+    :param scale: 縮小率
     :param filepath: 入力ファイルパス
+    :param data: 読み込み済みのファイルの内容
+    :return: 原寸の画像サイズ`(height, width)`
+    """
+    height, width = shape
+    if scale == 1:
+        return height, width
+    return image_shape(filepath, data) or (height * scale, width * scale)
+
+
+def binarize(img: numpy.array, input_threshold: float = 127, input_maxvalue: float = 255) -> numpy.array:
+    """
+    しきい値処理
+    :param img: グレースケール画像
     :param input_threshold: 入力閾値
     :param input_maxvalue: 閾値最大値
     :return: 2値画像データ
     """
-    filepath = str(filepath)
-    img = cv2.imread(filepath, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
     _, thr = cv2.threshold(img, input_threshold, 255, cv2.ADAPTIVE_THRESH_MEAN_C)
     return thr
 
 
-def detect_lines(img: numpy.array, min_length: float = 20, line_gap: float = 3) -> list[numpy.array]:
+def load_binary(filepath: str, input_threshold: float = 127, input_maxvalue: float = 255, scale: int = 1, data: typing.Optional[bytes] = None) -> numpy.array:
+    """
+    しきい値適用済み2値画像読み込み
+    :param filepath: 入力ファイルパス
+    :param input_threshold: 入力閾値
+    :param input_maxvalue: 閾値最大値
+    :param scale: 縮小率（`load_image()`参照）
+    :param data: 読み込み済みのファイルの内容（`load_image()`参照）
+    :return: 2値画像データ
+    """
+    return binarize(load_image(filepath, scale, data), input_threshold, input_maxvalue)
+
+
+class SkyMask:
+    """
+    処理する領域（空）のマスク
+    マスク画像の0以外の画素のみを処理する。二値化以降の処理はその外接矩形に切り抜いた画像で行い、
+    検出結果の座標は元の画像の座標に戻す
+    """
+
+    def __init__(self, mask: numpy.array):
+        """
+        :param mask: マスク画像（グレースケール、0以外が処理する領域）
+        """
+        self.shape = mask.shape
+        points = cv2.findNonZero(mask)
+        if points is None:
+            self.rect = (0, 0, 0, 0)
+        else:
+            self.rect = cv2.boundingRect(points)
+        x, y, width, height = self.rect
+        self.full = numpy.where(mask > 0, 255, 0).astype(numpy.uint8)
+        crop = self.full[y:y + height, x:x + width]
+        # 外接矩形内が全て処理する領域の場合は切り抜きのみ行う
+        self.crop = None if cv2.countNonZero(crop) == width * height else crop
+
+    @property
+    def offset(self) -> tuple[int, int]:
+        return self.rect[0], self.rect[1]
+
+    def apply(self, img: numpy.array) -> numpy.array:
+        """
+        :param img: グレースケール画像（マスクと同じサイズ）
+        :return: 外接矩形に切り抜き、領域外を0にした画像
+        """
+        if img.shape != self.shape:
+            raise ValueError("mask size {} does not match the image size {}".format(self.shape[::-1], img.shape[::-1]))
+        x, y, width, height = self.rect
+        img = img[y:y + height, x:x + width]
+        if self.crop is not None:
+            img = cv2.bitwise_and(img, self.crop)
+        return img
+
+    def mask(self, img: numpy.array) -> numpy.array:
+        """
+        :param img: グレースケール画像（マスクと同じサイズ）
+        :return: 切り抜かずに領域外を0にした画像
+        """
+        return cv2.bitwise_and(img, self.full)
+
+    def area_threshold(self, area_threshold: float) -> float:
+        """
+        :param area_threshold: 画像全体に対する面積閾値
+        :return: 切り抜いた画像に対する同じ面積の閾値
+        """
+        _, _, width, height = self.rect
+        if width * height == 0:
+            return area_threshold
+        return area_threshold * self.shape[0] * self.shape[1] / (width * height)
+
+    def restore_contours(self, contours: list[numpy.array]) -> list[numpy.array]:
+        """
+        :param contours: 切り抜いた画像の領域リスト
+        :return: 元の画像の座標の領域リスト
+        """
+        offset = numpy.array(self.offset, dtype=numpy.int32)
+        return [x + offset for x in contours]
+
+    def crop_contours(self, contours: list[numpy.array]) -> list[numpy.array]:
+        """
+        :param contours: 元の画像の座標の領域リスト
+        :return: 切り抜いた画像の座標の領域リスト
+        """
+        offset = numpy.array(self.offset, dtype=numpy.int32)
+        return [x - offset for x in contours]
+
+    def restore_lines(self, lines):
+        """
+        :param lines: 切り抜いた画像の直線リスト（`cv2.HoughLinesP()`の返り値またはその一部） or None
+        :return: 元の画像の座標の直線リスト or None
+        """
+        if lines is None:
+            return None
+        offset = numpy.array(self.offset * 2, dtype=numpy.int32)
+        if isinstance(lines, numpy.ndarray):
+            return lines + offset
+        return [x + offset for x in lines]
+
+
+# プロセスごとに読み込んだマスク（パス・更新日時・画像サイズごと）
+_masks = {}
+
+
+def load_mask(filepath: str, shape: tuple[int, int]) -> SkyMask:
+    """
+    マスク画像の読み込み
+    画像サイズの異なるマスク（縮小画像用等）は最近傍補間で拡大縮小する
+    :param filepath: マスク画像ファイルパス（白が処理する領域、黒が除外する領域）
+    :param shape: 適用する画像のサイズ`(height, width)`
+    :return: マスク
+    """
+    key = (filepath, os.stat(filepath).st_mtime_ns, tuple(shape))
+    mask = _masks.get(key)
+    if mask is not None:
+        return mask
+    img = cv2.imread(str(filepath), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("cannot read the mask image: {}".format(filepath))
+    if img.shape != tuple(shape):
+        img = cv2.resize(img, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    mask = SkyMask(img)
+    # 更新されたマスクの古いものは破棄する
+    for x in [x for x in _masks if x[0] == filepath and x[1] != key[1]]:
+        del _masks[x]
+    _masks[key] = mask
+    return mask
+
+
+# 画像間の変化の判定に使うブロックの大きさ（原寸の画素数）
+CHANGE_BLOCK = 8
+
+# 同じプロセスで処理した直近の画像の変化判定用の縮小画像（次の画像との比較用）
+_signatures = collections.OrderedDict()
+_SIGNATURE_LIMIT = 8
+
+
+def change_signature(img: numpy.array, scale: int = 1) -> numpy.array:
+    """
+    画像間の変化の判定用の縮小画像
+    :param img: 2値画像
+    :param scale: 入力画像の縮小率
+    :return: `CHANGE_BLOCK`画素四方のブロックごとに明るい画素を含むかの画像（255 or 0）
+    """
+    block = max(CHANGE_BLOCK // scale, 1)
+    if block > 1:
+        # 左上を基準にしたブロック内の最大値
+        kernel = numpy.ones((block, block), dtype=numpy.uint8)
+        img = cv2.dilate(img, kernel, anchor=(0, 0))[::block, ::block]
+    _, signature = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY)
+    return signature
+
+
+def changed_blocks(signature: numpy.array, previous: numpy.array) -> int:
+    """
+    :param signature: 画像の`change_signature()`
+    :param previous: 前の画像の`change_signature()`
+    :return: 前の画像で明るかったブロックとその周囲以外で、新たに明るくなったブロックの数
+    """
+    # 星の日周運動等による1ブロック程度のずれは変化とみなさない
+    grown = cv2.dilate(previous, numpy.ones((3, 3), dtype=numpy.uint8))
+    return cv2.countNonZero(cv2.subtract(signature, grown))
+
+
+def check_change(filepath: str, previous: typing.Optional[str], img: numpy.array, scale: int, key: tuple, min_change: int, profile=None) -> bool:
+    """
+    前の画像からの変化による事前判定
+    画像の`change_signature()`を記録し、前の画像を同じプロセス・同じ条件で処理済みの場合のみ比較する（未処理の場合は判定しない）
+    :param filepath: 入力画像ファイルパス
+    :param previous: 前の画像のファイルパス（None の場合は判定しない）
+    :param img: 2値画像
+    :param scale: 入力画像の縮小率
+    :param key: 2値画像の条件（しきい値・マスク等）
+    :param min_change: 新たに明るくなったブロックの数の下限
+    :param profile: 計測結果の記録先
+    :return: 検出処理を続けるか（変化が下限未満の場合は False）
+    """
+    with _stage(profile, "cascade", scale):
+        signature = change_signature(img, scale)
+        reference = None
+        try:
+            current = (filepath, os.stat(filepath).st_mtime_ns, scale) + key
+            if previous is not None:
+                reference = _signatures.get((previous, os.stat(previous).st_mtime_ns, scale) + key)
+        except OSError:
+            current = None
+        if current is not None:
+            _signatures[current] = signature
+            _signatures.move_to_end(current)
+            while len(_signatures) > _SIGNATURE_LIMIT:
+                _signatures.popitem(last=False)
+        if reference is None or reference.shape != signature.shape:
+            if profile is not None:
+                profile.count("change_unchecked", 1)
+            return True
+        changed = changed_blocks(signature, reference)
+    if changed < min_change:
+        if profile is not None:
+            profile.count("rejected_change", 1)
+        return False
+    return True
+
+
+def detect_lines(img: numpy.array, min_length: float = 20, line_gap: float = 3, threshold: int = 200) -> list[numpy.array]:
     """
     直線検出
     :param img: 入力画像（2値画像）
+    :param min_length: 最小の線分長
+    :param line_gap: 同一線分とみなす最大の間隔
+    :param threshold: 投票数の閾値
     :return: 検出直線リスト
     """
-    lines = cv2.HoughLinesP(img, rho=1, theta=math.pi/180, threshold=200, minLineLength=min_length, maxLineGap=line_gap)
+    lines = cv2.HoughLinesP(img, rho=1, theta=math.pi/180, threshold=threshold, minLineLength=min_length, maxLineGap=line_gap)
     return lines
 
 
-def detect_area(img: numpy.array, area_threshold: float = 0.0001) -> list[numpy.array]:
+def detect_segments(img: numpy.array, scale: int = 1) -> typing.Optional[numpy.array]:
+    """
+    流星検出用の直線検出
+    `detect_lines()`の各パラメーターを画像の縮小率に合わせて補正する
+    :param img: 入力画像（2値画像）
+    :param scale: 入力画像の縮小率
+    :return: 検出直線リスト or None
+    """
+    return detect_lines(img, min_length=20 / scale, line_gap=max(3 / scale, 1), threshold=max(200 // scale, 1))
+
+
+AREA_METHODS = ("contour", "components")
+
+
+def detect_area_components(img: numpy.array, area_threshold: float = 0.0001, profile=None) -> tuple[numpy.array, numpy.array, numpy.array, numpy.array]:
+    """
+    閾値を超える面積を持つ連結成分の検出
+    輪郭の点列を作らず、連結成分の統計量（ピクセル数）でまとめて判定する
+    :param img: 入力画像（2値画像）
+    :param area_threshold: 面積閾値（画像全体の何%を`(0, 1]`で指定）
+    :param profile: 計測結果の記録先（`detect_meteor()`参照）
+    :return: (ラベル画像, 閾値を超えた成分のラベル`[N]`, 面積`[N]`, 外接矩形`[N, (x, y, width, height)]`)
+    """
+    height, width = img.shape
+    img_area = width * height
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(img, connectivity=8)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    keep = (areas / img_area) > area_threshold
+    # label 0 is background
+    keep[0] = False
+    if profile is not None:
+        profile.count("contours_found", len(areas) - 1)
+        profile.allocate("area", labels)
+    return labels, numpy.flatnonzero(keep), areas[keep], stats[keep, :cv2.CC_STAT_AREA]
+
+
+def detect_area(img: numpy.array, area_threshold: float = 0.0001, method: str = "contour", profile=None) -> list[numpy.array]:
     """
     閾値を超える面積を持つ輪郭の検出
     :param img: 入力画像
     :param area_threshold: 面積閾値（画像全体の何%を`(0, 1]`で指定）
+    :param method: 検出方法
+        * `"contour"`: `cv2.findContours()`による輪郭
+        * `"components"`: 連結成分のピクセル数で判定した領域の外周（`detect_area_components()`参照）
+    :param profile: 計測結果の記録先（`detect_meteor()`参照）
     :return: 閾値を超えた面積の領域リスト
     """
-    height, width = img.shape
-    img_area = width * height
-    contours, _ = cv2.findContours(img, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
-    contours = [cnt for cnt in contours if (cv2.contourArea(cnt) / img_area) > area_threshold]
+    if method == "components":
+        labels, indices, _, boxes = detect_area_components(img, area_threshold, profile)
+        # 残した成分のみ、外接矩形内を切り出して外周をたどる（画像全体の走査はラベリングの1回のみ）
+        contours = []
+        for index, (x, y, w, h) in zip(indices, boxes.tolist()):
+            roi = (labels[y:y + h, x:x + w] == index).view(numpy.uint8)
+            found, _ = cv2.findContours(roi, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+            contours.extend(found)
+        # 幅1画素の線状の成分は外周の面積が0で塗りつぶせないため、`contour`と同様に除く
+        contours = [cnt for cnt in contours if cv2.contourArea(cnt) > 0]
+    elif method == "contour":
+        height, width = img.shape
+        img_area = width * height
+        contours, _ = cv2.findContours(img, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+        if profile is not None:
+            profile.count("contours_found", len(contours))
+            profile.allocate("area", list(contours))
+        contours = [cnt for cnt in contours if (cv2.contourArea(cnt) / img_area) > area_threshold]
+    else:
+        raise ValueError("unknown area method: {}".format(method))
+    if profile is not None:
+        profile.count("contours_kept", len(contours))
     return contours
 
 
@@ -64,9 +427,39 @@ def clamp(v: T, min_v: T, max_v: T) -> T:
 BoundingRect = tuple[tuple[float, float], tuple[float, float]]
 
 
+def _isolated(boxes: numpy.array, width: int, height: int, shift: int = 3) -> numpy.array:
+    """
+    外接矩形が他のどの矩形とも重ならないかの判定
+    `2 ** shift`ピクセル単位の格子で重なりを数えるため、近接しているだけの矩形も重なりとみなす（安全側の判定）
+    :param boxes: 外接矩形`[[min_x, min_y, max_x, max_y], ...]`（両端を含む）
+    :param width: 画像幅
+    :param height: 画像高さ
+    :param shift: 格子サイズ（2の冪の指数）
+    :return: 矩形ごとの判定結果
+    """
+    grid_w = (width >> shift) + 2
+    grid_h = (height >> shift) + 2
+    x0, y0, x1, y1 = (boxes >> shift).T
+    x1 = x1 + 1
+    y1 = y1 + 1
+    # 矩形ごとの被覆数を差分配列の累積和で求める
+    coverage = numpy.zeros((grid_h + 1, grid_w + 1), dtype=numpy.int32)
+    numpy.add.at(coverage, (y0, x0), 1)
+    numpy.add.at(coverage, (y0, x1), -1)
+    numpy.add.at(coverage, (y1, x0), -1)
+    numpy.add.at(coverage, (y1, x1), 1)
+    coverage = coverage.cumsum(axis=0).cumsum(axis=1)
+    # 被覆数の2次元累積和から矩形内の総和を求め、全格子が被覆数1なら孤立している
+    total = numpy.zeros((grid_h + 2, grid_w + 2), dtype=numpy.int64)
+    total[1:, 1:] = coverage.cumsum(axis=0).cumsum(axis=1)
+    inside = total[y1, x1] - total[y0, x1] - total[y1, x0] + total[y0, x0]
+    return inside == (x1 - x0) * (y1 - y0)
+
+
 def fill_area(img: numpy.array, contours: list[numpy.array], buffer_ratio: float = 1.1, color: typing.Optional[float] = None) -> numpy.array:
     """
     領域の外接矩形で塗りつぶす
+    各領域の凸包を重心中心に`buffer_ratio`倍へ拡張した多角形で塗りつぶす
     :param img: 入力画像
     :param contours: 領域リスト
     :param buffer_ratio: バッファ拡張率
@@ -74,26 +467,39 @@ def fill_area(img: numpy.array, contours: list[numpy.array], buffer_ratio: float
     :return: 塗りつぶし後の画像
     """
     height, width = img.shape
-    x_buffer = int(width * buffer_ratio)
-    y_buffer = int(height * buffer_ratio)
     # detect fill color
     if color is None:
         color = numpy.median(img)
-    # fill bounding rect
-    for cnt in contours:
-        hull = cv2.convexHull(cnt)
+    if len(contours) == 0:
+        return img
+    # expand convex hulls about their centroids
+    hulls = [cv2.convexHull(cnt) for cnt in contours]
+    centers = []
+    for hull in hulls:
         M = cv2.moments(hull)
-        cx = M["m10"] / M["m00"]
-        cy = M["m01"] / M["m00"]
-        temp = []
-        for c in hull:
-            x, y = c[0]
-            vx = x - cx
-            vy = y - cy
-            x = clamp(vx * buffer_ratio + cx, 0, width)
-            y = clamp(vy * buffer_ratio + cy, 0, height)
-            temp.append([int(x), int(y)])
-        img = cv2.fillPoly(img, pts=[numpy.asarray(temp)], color=(color,))
+        if M["m00"] == 0:
+            # 面積の無い領域（キャッシュに残った古い結果等）は点の平均を中心とする
+            centers.append(tuple(hull.reshape(-1, 2).mean(axis=0)))
+            continue
+        centers.append((M["m10"] / M["m00"], M["m01"] / M["m00"]))
+    counts = numpy.array([len(hull) for hull in hulls])
+    points = numpy.concatenate(hulls).reshape(-1, 2)
+    center = numpy.repeat(numpy.array(centers), counts, axis=0)
+    points = (points - center) * buffer_ratio + center
+    numpy.clip(points, 0, (width, height), out=points)
+    points = points.astype(numpy.int32)
+    # bounding boxes of the expanded polygons
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+    boxes = numpy.concatenate((numpy.minimum.reduceat(points, offsets), numpy.maximum.reduceat(points, offsets)), axis=1)
+    polygons = numpy.split(points, offsets[1:])
+    # `cv2.fillPoly()` fills overlapping polygons by the even-odd rule,
+    # so only polygons which never overlap each other are filled in one call
+    isolated = _isolated(boxes, width, height)
+    batch = [x for x, y in zip(polygons, isolated) if y]
+    if batch:
+        img = cv2.fillPoly(img, pts=batch, color=(color,))
+    for polygon in (x for x, y in zip(polygons, isolated) if not y):
+        img = cv2.fillPoly(img, pts=[polygon], color=(color,))
     return img
 
 
@@ -111,7 +517,79 @@ def line_length(line: numpy.array) -> float:
     return math.sqrt(dx * dx + dy * dy)
 
 
-def detect_meteor(filepath: str, input_threshold: float = 127, input_maxvalue: float = 255, area_threshold: float = 0.0001, buffer_ratio: float = 1.1, line_threshold: float = 100) -> typing.Optional[tuple[list[numpy.array], list[BoundingRect], tuple[int, int]]]:
+def filter_lines(lines: typing.Optional[numpy.array], line_threshold: float = 100, scale: int = 1) -> typing.Optional[list[numpy.array]]:
+    """
+    流星と判定する長さの直線の抽出
+    :param lines: `cv2.HoughLinesP()`の検出直線リスト
+    :param line_threshold: 検出した直線を流星と判定する最小の長さ（原寸換算）
+    :param scale: 直線を検出した画像の縮小率
+    :return: 閾値より長い直線リスト or None
+    """
+    if lines is None:
+        return None
+    line_threshold = line_threshold / scale
+    line_lengthes = [line_length(x) for x in lines]
+    length = max(line_lengthes)
+    if length > line_threshold:
+        return [x for x, y in zip(lines, line_lengthes) if y > line_threshold]
+    return None
+
+
+def check_pixels(img: numpy.array, min_pixels: int, scale: int = 1, name: str = "pixels", profile=None) -> bool:
+    """
+    明るい画素数による事前判定
+    :param img: 2値画像
+    :param min_pixels: 明るい画素数の下限（原寸換算、縮小画像では直線の画素数に合わせて縮小率で割る。0の場合は判定しない）
+    :param scale: 入力画像の縮小率
+    :param name: 判定名（計測結果の`rejected_{name}`に棄却数を記録する）
+    :param profile: 計測結果の記録先
+    :return: 検出処理を続けるか（下限未満の場合は False）
+    """
+    if min_pixels <= 0:
+        return True
+    with _stage(profile, "cascade", scale):
+        count = cv2.countNonZero(img)
+    if count < min_pixels / scale:
+        if profile is not None:
+            profile.count("rejected_" + name, 1)
+        return False
+    return True
+
+
+def detect_meteor_image(img: numpy.array, area_threshold: float = 0.0001, buffer_ratio: float = 1.1, line_threshold: float = 100, area_method: str = "contour", scale: int = 1, profile=None, min_pixels: int = 0, min_residual: int = 0) -> tuple[typing.Optional[list[numpy.array]], list[numpy.array], tuple[int, int]]:
+    """
+    2値画像からの流星の検出
+    :param img: 入力画像（2値画像、塗りつぶしにより内容は変更される）
+    :param area_threshold: 面積のある領域検知用閾値
+    :param buffer_ratio: 面積拡張率
+    :param line_threshold: 検出した直線を流星と判定する最小の長さ（原寸換算）
+    :param area_method: 面積のある領域の検出方法
+    :param scale: 入力画像の縮小率。長さに関するパラメーターを縮小率に合わせて補正する
+    :param profile: 計測結果の記録先（`detect_meteor()`参照）
+    :param min_pixels: 2値画像の明るい画素数の下限（`check_pixels()`参照、下回る場合は以降の処理を省略する）
+    :param min_residual: 塗りつぶし後に残った明るい画素数の下限（下回る場合は直線検出を省略する）
+    :return: (検出した直線 or None, 塗りつぶした領域, 画像サイズ)
+    """
+    if not check_pixels(img, min_pixels, scale, "pixels", profile):
+        return None, [], img.shape
+    with _stage(profile, "area", scale):
+        area_contours = detect_area(img, area_threshold, area_method, profile)
+    if area_contours:
+        with _stage(profile, "fill", scale):
+            img = fill_area(img, area_contours, buffer_ratio=buffer_ratio, color=0)
+    if not check_pixels(img, min_residual, scale, "residual", profile):
+        return None, area_contours, img.shape
+    with _stage(profile, "hough", scale):
+        lines = detect_segments(img, scale)
+    with _stage(profile, "filter", scale):
+        lines_filtered = filter_lines(lines, line_threshold, scale)
+    if profile is not None:
+        profile.count("segments", 0 if lines is None else len(lines))
+        profile.count("lines", 0 if lines_filtered is None else len(lines_filtered))
+    return lines_filtered, area_contours, img.shape
+
+
+def detect_meteor(filepath: str, input_threshold: float = 127, input_maxvalue: float = 255, area_threshold: float = 0.0001, buffer_ratio: float = 1.1, line_threshold: float = 100, area_method: str = "contour", prescreen: int = 1, profile=None, data: typing.Optional[bytes] = None, mask: typing.Optional[str] = None, min_pixels: int = 0, min_residual: int = 0, min_change: int = 0, previous: typing.Optional[str] = None) -> typing.Optional[tuple[list[numpy.array], list[BoundingRect], tuple[int, int]]]:
     """
     流星の検出
     :param str filepath: 入力画像ファイルパス
@@ -120,24 +598,235 @@ def detect_meteor(filepath: str, input_threshold: float = 127, input_maxvalue: f
     :param float area_threshold: 面積のある領域検知用閾値（`detect_area()`関数`threshold`参照）
     :param float buffer_ratio: 面積拡張率
     :param float line_threshold: 検出した直線を流星と判定する最小の長さ
+    :param str area_method: 面積のある領域の検出方法（`detect_area()`関数`method`参照）
+    :param int prescreen: 事前判定の縮小率（1の場合は事前判定なし）
+        縮小画像で流星候補とならなかった画像は原寸での処理を省略し、縮小画像の結果を原寸に換算して返す
+    :param profile: 段階ごとの処理時間・件数・配列サイズの記録先（`profiling.FrameProfile`、None の場合は計測しない）
+    :param data: 先読みしたファイルの内容（`load_image()`参照）
+    :param str mask: 処理する領域のマスク画像ファイルパス（`load_mask()`参照、None の場合は画像全体を処理する）
+    :param int min_pixels: 2値画像の明るい画素数の下限（`check_pixels()`参照、0の場合は判定しない）
+    :param int min_residual: 塗りつぶし後に残った明るい画素数の下限（0の場合は判定しない）
+    :param int min_change: 前の画像から新たに明るくなったブロックの数の下限（`check_change()`参照、0の場合は判定しない）
+    :param str previous: 前の画像のファイルパス（`min_change`の判定用）
     :return: (検出した直線 or None, 塗りつぶした領域 or None)
     """
-    img = load_binary(filepath, input_threshold, input_maxvalue)
-    area_contours = detect_area(img, area_threshold)
-    if area_contours:
-        img = fill_area(img, area_contours, buffer_ratio=buffer_ratio, color=0)
-    lines = detect_lines(img)
-    if lines is not None:
-        line_lengthes = [line_length(x) for x in lines]
-        length = max(line_lengthes)
-        if length > line_threshold:
-            filtered_lines = [x for x, y in zip(lines, line_lengthes) if y > line_threshold]
-            return filtered_lines, area_contours, img.shape
-    return None, area_contours, img.shape
+    params = dict(area_threshold=area_threshold, buffer_ratio=buffer_ratio, line_threshold=line_threshold, area_method=area_method, profile=profile, min_pixels=min_pixels, min_residual=min_residual)
+
+    def unchanged(img: numpy.array, scale: int) -> bool:
+        return min_change > 0 and not check_change(filepath, previous, img, scale, (input_threshold, input_maxvalue, mask), min_change, profile)
+
+    if prescreen > 1:
+        img, sky = _load_binary(filepath, input_threshold, input_maxvalue, prescreen, profile, data, mask)
+        if unchanged(img, prescreen):
+            return None, [], full_shape(_frame_shape(img, sky), prescreen, filepath, data)
+        lines, area_contours, shape = _detect_masked(img, sky, scale=prescreen, **params)
+        if lines is None:
+            return None, [x * prescreen for x in area_contours], full_shape(shape, prescreen, filepath, data)
+        img, sky = _load_binary(filepath, input_threshold, input_maxvalue, 1, profile, data, mask)
+    else:
+        img, sky = _load_binary(filepath, input_threshold, input_maxvalue, 1, profile, data, mask)
+        if unchanged(img, 1):
+            return None, [], _frame_shape(img, sky)
+    return _detect_masked(img, sky, **params)
+
+
+def _frame_shape(img: numpy.array, sky: typing.Optional[SkyMask]) -> tuple[int, int]:
+    height, width = sky.shape if sky is not None else img.shape
+    return height, width
+
+
+def _load_binary(filepath: str, input_threshold: float, input_maxvalue: float, scale: int, profile, data: typing.Optional[bytes], mask: typing.Optional[str] = None) -> tuple[numpy.array, typing.Optional[SkyMask]]:
+    with _stage(profile, "decode", scale):
+        img = load_image(filepath, scale, data)
+    if profile is not None:
+        profile.allocate("decode", img)
+    with _stage(profile, "threshold", scale):
+        sky = None
+        if mask is not None:
+            sky = load_mask(mask, img.shape)
+            img = sky.apply(img)
+        return binarize(img, input_threshold, input_maxvalue), sky
+
+
+def _detect_masked(img: numpy.array, sky: typing.Optional[SkyMask], area_threshold: float = 0.0001, **kwargs) -> tuple[typing.Optional[list[numpy.array]], list[numpy.array], tuple[int, int]]:
+    """
+    切り抜いた2値画像からの流星の検出（`detect_meteor_image()`参照）
+    :param img: 2値画像（`SkyMask.apply()`で切り抜いたもの）
+    :param sky: マスク（None の場合は切り抜いていない）
+    :param area_threshold: 元の画像全体に対する面積閾値
+    :param kwargs: `detect_meteor_image()`のその他のパラメーター
+    :return: 元の画像の座標の(検出した直線 or None, 塗りつぶした領域, 画像サイズ)
+    """
+    if sky is None:
+        return detect_meteor_image(img, area_threshold=area_threshold, **kwargs)
+    lines, area_contours, _ = detect_meteor_image(img, area_threshold=sky.area_threshold(area_threshold), **kwargs)
+    return sky.restore_lines(lines), sky.restore_contours(area_contours), sky.shape
+
+
+def prescreen_recall(filepath: str, prescreen: int = 2, input_threshold: float = 127, input_maxvalue: float = 255, mask: typing.Optional[str] = None, **kwargs) -> tuple[bool, bool]:
+    """
+    事前判定による見逃しの確認用に、原寸と縮小画像の両方で判定する
+    :param filepath: 入力画像ファイルパス
+    :param prescreen: 事前判定の縮小率
+    :param input_threshold: 画像のしきい値処理
+    :param input_maxvalue: 画像のしきい値処理最大値
+    :param mask: 処理する領域のマスク画像ファイルパス
+    :param kwargs: `detect_meteor_image()`のパラメーター
+    :return: (原寸で検出されたか, 事前判定で候補となったか)
+    """
+    img, sky = _load_binary(filepath, input_threshold, input_maxvalue, 1, None, None, mask)
+    full, _, _ = _detect_masked(img, sky, **kwargs)
+    img, sky = _load_binary(filepath, input_threshold, input_maxvalue, prescreen, None, None, mask)
+    candidate, _, _ = _detect_masked(img, sky, scale=prescreen, **kwargs)
+    return full is not None, candidate is not None
+
+
+R = typing.TypeVar("R")
+
+
+def _init_worker() -> None:
+    """
+    並列処理用ワーカープロセスの初期化
+    プロセス数×OpenCV内部スレッド数で過剰にスレッドが立たないよう、OpenCV側を1スレッドに制限する
+    Ctrl+Cは親プロセスのみで受け取り、ワーカーは処理中のファイルを終えてから終了する（ワーカーごとのトレースバックを出さない）
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+
+
+def _call_chunk(func: typing.Callable[[str], R], items: list[tuple[str, dict]], return_exceptions: bool) -> list[typing.Union[R, Exception]]:
+    """
+    連続する複数ファイルの処理（`map_files()`用、同じワーカープロセスで順に処理する）
+    :param func: 処理関数
+    :param items: (ファイルパス, 処理関数の引数)のリスト
+    :param return_exceptions: `True`の場合は処理中の例外を送出せず処理結果として返す
+    :return: ファイルごとの処理結果
+    """
+    results = []
+    for filepath, kwargs in items:
+        try:
+            results.append(func(filepath, **kwargs))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def create_pool(jobs: int, mp_context=None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    `map_files()`用のプロセスプールの作成
+    :param jobs: 並列数
+    :param mp_context: `multiprocessing`のコンテキスト（未指定の場合はプラットフォーム既定）
+    :return: プロセスプール
+    """
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context, initializer=_init_worker)
+
+
+def map_files(func: typing.Callable[[str], R], filepaths: typing.Iterable[str], jobs: int = 1, ordered: bool = True, backlog: typing.Optional[int] = None, mp_context=None, return_exceptions: bool = False, read_ahead=None, arguments: typing.Optional[typing.Callable[[str], dict]] = None, chunk_size: int = 1, executor: typing.Optional[concurrent.futures.Executor] = None) -> typing.Iterator[tuple[str, typing.Union[R, Exception]]]:
+    """
+    ファイル単位の処理をプロセスプールで並列実行する
+    投入済みで未回収の処理数を`backlog`までに制限するため、入力が大量でもメモリ使用量は一定に収まる
+    :param func: 処理関数（プロセス間で受け渡すためpickle可能であること）
+    :param filepaths: 入力ファイルパス
+    :param jobs: 並列数（1以下の場合はプロセスを使わず逐次実行）
+    :param ordered: `True`の場合は入力順、`False`の場合は完了順に結果を返す
+    :param backlog: 同時に投入しておく最大数（`chunk_size`件ずつの単位、未指定の場合は`jobs`の2倍）
+    :param mp_context: `multiprocessing`のコンテキスト（未指定の場合はプラットフォーム既定）
+    :param return_exceptions: `True`の場合は処理中の例外を送出せず処理結果として返す
+    :param read_ahead: ファイルの先読み（`reader.ReadAhead`）。指定した場合、読み込めたファイルは
+        `func(filepath, data=ファイルの内容)`として呼び出す
+    :param arguments: ファイルパスを受け取り、処理関数に追加で渡す引数を返す関数（入力順に呼び出す）
+    :param chunk_size: 同じワーカープロセスで続けて処理する連続したファイルの数（前の画像の結果を使う処理用）
+    :param executor: 使い回すプロセスプール（未指定の場合は`jobs`個のプロセスで作成し、終了時に破棄する）
+    :return: `(ファイルパス, 処理結果)`のイテレーター
+    """
+    def options(filepath: str, data: typing.Optional[bytes]) -> dict:
+        # 読み込めなかった場合は処理関数自身に開かせる
+        kwargs = {} if arguments is None else arguments(filepath)
+        if data is not None:
+            kwargs["data"] = data
+        return kwargs
+
+    if read_ahead is None:
+        items = ((x, None) for x in filepaths)
+    else:
+        items = read_ahead.read(filepaths)
+    try:
+        if jobs <= 1:
+            for filepath, data in items:
+                try:
+                    value = func(filepath, **options(filepath, data))
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    value = e
+                yield filepath, value
+            return
+
+        def chunks():
+            chunk = []
+            for filepath, data in items:
+                chunk.append((filepath, options(filepath, data)))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        def results(chunk: list[tuple[str, dict]], future: concurrent.futures.Future):
+            e = future.exception()
+            if e is not None:
+                if not return_exceptions:
+                    raise e
+                values = [e] * len(chunk)
+            else:
+                values = future.result()
+            for (filepath, _), value in zip(chunk, values):
+                yield filepath, value
+
+        if backlog is None:
+            backlog = jobs * 2
+        backlog = max(backlog, jobs)
+        owned = executor is None
+        if owned:
+            executor = create_pool(jobs, mp_context)
+        queue = collections.deque()
+        running = {}
+        try:
+            if ordered:
+                for chunk in chunks():
+                    queue.append((chunk, executor.submit(_call_chunk, func, chunk, return_exceptions)))
+                    if len(queue) >= backlog:
+                        yield from results(*queue.popleft())
+                while queue:
+                    yield from results(*queue.popleft())
+            else:
+                for chunk in chunks():
+                    running[executor.submit(_call_chunk, func, chunk, return_exceptions)] = chunk
+                    if len(running) >= backlog:
+                        done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            yield from results(running.pop(future), future)
+                for future in concurrent.futures.as_completed(list(running)):
+                    yield from results(running.pop(future), future)
+        finally:
+            # 途中で打ち切られた場合は未着手の処理を破棄し、実行中の処理の完了を待つ
+            if owned:
+                executor.shutdown(wait=True, cancel_futures=True)
+            else:
+                futures = [x for _, x in queue] + list(running)
+                for future in futures:
+                    future.cancel()
+                concurrent.futures.wait(futures)
+    finally:
+        items.close()
 
 
 def main(argv: list[str]) -> int:
     from tqdm import tqdm
+    from .output import FORMATS as OUTPUT_FORMATS
+    from .sequence import SEQUENCE_METHODS
     parser = argparse.ArgumentParser()
     parser.add_argument("directory")
     parser.add_argument("--input-threshold", type=float, default=127)
@@ -145,35 +834,328 @@ def main(argv: list[str]) -> int:
     parser.add_argument("--area-threshold", type=float, default=0.0001)
     parser.add_argument("--buffer-ratio", type=float, default=1.1)
     parser.add_argument("--line-threshold", type=float, default=100)
+    parser.add_argument("--area-method", choices=AREA_METHODS, default="contour")
+    parser.add_argument("--mask", default=None, help="mask image of the sky region (white: processed, black: ignored)")
+    parser.add_argument("--min-pixels", type=int, default=0, help="skip frames with fewer bright pixels after thresholding (0: off)")
+    parser.add_argument("--min-residual", type=int, default=0, help="skip line detection on frames with fewer bright pixels left after filling (0: off)")
+    parser.add_argument("--min-change", type=int, default=0, help="skip frames with fewer %dx%d blocks newly bright since the previous frame (0: off)" % (CHANGE_BLOCK, CHANGE_BLOCK))
+    parser.add_argument("--sequence", choices=SEQUENCE_METHODS, default=None, help="process frames in capture order and detect lines on the difference from a rolling background (previous frame, running median or max)")
+    parser.add_argument("--sequence-length", type=int, default=5, help="number of frames of the running median/max of --sequence")
+    parser.add_argument("--sequence-contrast", type=float, default=32, help="minimum brightness above the background of --sequence")
+    parser.add_argument("--sequence-margin", type=int, default=2, help="pixels of star drift between frames ignored by --sequence")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (0: number of CPUs)")
+    parser.add_argument("--prescreen", type=int, choices=PRESCREEN_SCALES, default=1, help="pre-screen frames at 1/N scale and confirm candidates at full resolution")
+    parser.add_argument("--prescreen-recall", action="store_true", help="process every frame at both scales and report frames missed by the pre-screen")
+    parser.add_argument("--cache", default=None, help="result cache file (default: platform cache directory)")
+    parser.add_argument("--cache-size", type=float, default=1024, help="maximum result cache size [MiB]")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    parser.add_argument("--watch", action="store_true", help="keep watching the directory and report detections in new images as they are written")
+    parser.add_argument("--json", action="store_true", help="report detections while watching as JSON lines")
+    parser.add_argument("--profile", action="store_true", help="report per-stage timings, counts and the slowest files")
+    parser.add_argument("--read-ahead", type=int, default=4, help="number of files read ahead on I/O threads (0: off)")
+    parser.add_argument("--read-ahead-memory", type=float, default=256, help="maximum size of files read ahead [MiB]")
+    parser.add_argument("--io-threads", type=int, default=2, help="number of threads reading files ahead")
+    parser.add_argument("--output", choices=OUTPUT_FORMATS, default=None, help="write one record per image (path, shape, lines, filled ratio, timings) as soon as it is processed")
+    parser.add_argument("--output-file", default="-", help="file of the --output records (default: standard output)")
+    parser.add_argument("--sweep", action="append", default=[], metavar="NAME=V1,V2,...", help="detect with every combination of the given values (e.g. line_threshold=50,100,150) and report detections per combination")
+    parser.add_argument("--sweep-matrix", default=None, help="write the number of lines per image and combination of --sweep to a CSV file")
 
     args = parser.parse_args(argv[1:])
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if args.watch and args.prescreen_recall:
+        parser.error("--watch cannot be combined with --prescreen-recall")
+    if args.output is not None and args.prescreen_recall:
+        parser.error("--output cannot be combined with --prescreen-recall")
+    if args.sequence is not None and (args.watch or args.prescreen_recall or args.sweep):
+        parser.error("--sequence cannot be combined with --watch, --prescreen-recall or --sweep")
+    if args.sequence_length < 1:
+        parser.error("--sequence-length must be positive")
+    if args.mask is not None and cv2.imread(args.mask, cv2.IMREAD_GRAYSCALE) is None:
+        parser.error("--mask: cannot read the mask image: {}".format(args.mask))
+    grid = {}
+    for item in args.sweep:
+        name, _, values = item.partition("=")
+        name = name.replace("-", "_")
+        try:
+            grid[name] = [_sweep_value(name, x) for x in values.split(",")]
+        except ValueError as e:
+            parser.error("--sweep {}: {}".format(item, e))
+    if grid and (args.watch or args.prescreen_recall or args.output is not None):
+        parser.error("--sweep cannot be combined with --watch, --prescreen-recall or --output")
+
+    watcher = None
+    if args.watch:
+        # 一覧の作成中に追加された画像も取りこぼさないよう、先に監視を始める
+        from .watch import FolderWatcher
+        watcher = FolderWatcher(args.directory)
+
+    # 拡張子が`.jpg`の画像を走査しながら処理する（一覧の作成完了を待たない）
+    from .scan import scan_jpegs
+    # 監視する場合のみ、処理済みの画像を監視対象から除くために記録する
+    scanned = [] if watcher is not None else None
+    total = 0
+    bar = None
 
-    # 拡張子が`.jpg`の画像リストを作成
-    image_list = []
-    for dirname, _, filenames in os.walk(args.directory):
-        image_list.extend([os.path.join(dirname, x) for x in filenames if x.lower().endswith(".jpg") or x.lower().endswith(".jpeg")])
-    image_list.sort()
+    def listing():
+        nonlocal total
+        for x in scan_jpegs(args.directory):
+            total += 1
+            if scanned is not None:
+                scanned.append(x)
+            if bar is not None:
+                # 走査は処理より先に進むため、見つかった画像数を総数として進捗と残り時間を表示する
+                bar.total = total
+            yield x
+
+    def progress(results):
+        nonlocal bar
+        bar = tqdm(results, total=total, unit="img", dynamic_ncols=True)
+        return bar
+
+    params = dict(
+        input_threshold=args.input_threshold,
+        input_maxvalue=args.input_maxvalue,
+        area_threshold=args.area_threshold,
+        buffer_ratio=args.buffer_ratio,
+        line_threshold=args.line_threshold,
+        area_method=args.area_method,
+        mask=args.mask,
+        min_pixels=args.min_pixels,
+        min_residual=args.min_residual
+    )
+
+    if args.prescreen_recall:
+        # 事前判定の見逃し確認
+        prescreen = args.prescreen if args.prescreen > 1 else 2
+        recall = functools.partial(prescreen_recall, prescreen=prescreen, **params)
+        detected = []
+        missed = []
+        candidates = 0
+        for filepath, (full, candidate) in progress(map_files(recall, listing(), jobs=jobs)):
+            candidates += candidate
+            if full:
+                detected.append(filepath)
+                if not candidate:
+                    missed.append(filepath)
+        print("prescreen 1/{}: candidates: {}/{}".format(prescreen, candidates, total))
+        print("recall: {}/{}".format(len(detected) - len(missed), len(detected)))
+        if missed:
+            print("missed:")
+            for filepath in missed:
+                print(filepath)
+        return 0
+
+    params["prescreen"] = args.prescreen
+    params["min_change"] = args.min_change
+    if grid:
+        # パラメーターの組み合わせごとの検出数
+        from .pipeline import map_sweep
+        from .pipeline import param_grid
+        cache = None
+        if not args.no_cache:
+            from .cache import ResultCache
+            cache = ResultCache(args.cache, max_size=int(args.cache_size * 1024 * 1024))
+        configs = param_grid(params, grid)
+        print("sweep: {} combinations".format(len(configs)), file=sys.stderr)
+        try:
+            results = progress(map_sweep(listing(), configs, cache, jobs=jobs))
+            counts = sweep(results, len(configs), args.sweep_matrix)
+        finally:
+            if cache is not None:
+                cache.trim()
+                cache.close()
+        print("images: {}".format(total))
+        names = list(grid)
+        widths = [max(len(x), max(len(str(v)) for v in grid[x])) for x in names]
+        print("  ".join(["{:>5}".format("#")] + ["{:>{}}".format(x, w) for x, w in zip(names, widths)] + ["detected"]))
+        for i, (config, count) in enumerate(zip(configs, counts)):
+            print("  ".join(["{:>5}".format(i)] + ["{:>{}}".format(str(config[x]), w) for x, w in zip(names, widths)] + ["{:>8}".format(count)]))
+        return 0
 
     # 流星の写っていると思われる画像を抽出
     result = []
-    for filepath in tqdm(image_list):
-        filepath = str(filepath)
-        lines, _, _ = detect_meteor(
-            filepath,
-            args.input_threshold,
-            args.input_maxvalue,
-            args.area_threshold,
-            args.buffer_ratio,
-            args.line_threshold
-        )
-        if lines is not None:
-            result.append((filepath, lines))
-    print("detected: {}/{}".format(len(result), len(image_list)))
-    if result:
-        print("files:")
-        for filepath, lines in result:
-            print(filepath)
+    cache = None
+    # 背景差分の結果は前の画像に依存するためキャッシュしない
+    if not args.no_cache and args.sequence is None:
+        from .cache import ResultCache
+        cache = ResultCache(args.cache, max_size=int(args.cache_size * 1024 * 1024))
+    from .pipeline import map_detect
+    profiler = None
+    if args.profile:
+        from .profiling import Profiler
+        profiler = Profiler()
+    sink = profiler
+    cascade = None
+    if args.sequence is not None:
+        # 背景差分では前の画像との比較は不要
+        params["min_change"] = 0
+    if args.min_pixels > 0 or args.min_residual > 0 or params["min_change"] > 0:
+        # 事前判定ごとの棄却数の集計
+        from .profiling import CountTotals
+        cascade = CountTotals(profiler)
+        sink = cascade
+    read_ahead = None
+    if args.read_ahead > 0 and args.sequence is None:
+        from .reader import ReadAhead
+        read_ahead = ReadAhead(args.read_ahead, int(args.read_ahead_memory * 1024 * 1024), args.io_threads)
+    writer = None
+    output = None
+    report = sys.stdout
+    if args.output is not None:
+        # 1枚ごとに書き出し、検出した画像の一覧は保持しない
+        from .output import RecordWriter
+        if args.output_file == "-":
+            output = sys.stdout
+            # 記録と混ざらないよう、集計は標準エラー出力に表示する
+            report = sys.stderr
+        else:
+            output = open(args.output_file, "w", encoding="utf-8", newline="")
+        writer = RecordWriter(output, args.output, sink)
+    try:
+        # 出力する場合は画像ごとの処理時間も計測する
+        if args.sequence is not None:
+            # 撮影順に並べるため、一覧の作成を待ってから処理する
+            from .sequence import map_sequence
+            from .sequence import order_frames
+            results = map_sequence(order_frames(listing()), params, args.sequence, args.sequence_length, args.sequence_contrast, args.sequence_margin,
+                                   jobs=jobs, profiler=writer or sink, return_exceptions=writer is not None)
+        else:
+            results = map_detect(listing(), params, cache, jobs=jobs, profiler=writer or sink, read_ahead=read_ahead, return_exceptions=writer is not None)
+        detected = 0
+        try:
+            for filepath, detection in progress(results):
+                if writer is not None:
+                    detected += writer.write(filepath, detection).get("detected", False)
+                    continue
+                lines, _, _ = detection
+                if lines is not None:
+                    detected += 1
+                    result.append(filepath)
+        finally:
+            if cache is not None:
+                cache.trim()
+                cache.close()
+        print("detected: {}/{}".format(detected, total), file=report)
+        if result:
+            print("files:", file=report)
+            for filepath in result:
+                print(filepath, file=report)
+        if cascade is not None:
+            print(cascade_summary(cascade, params["min_change"] > 0, args.min_pixels > 0, args.min_residual > 0), file=report)
+        if profiler is not None:
+            print("profile:", file=report)
+            print(profiler.summary(), file=report)
+            if read_ahead is not None:
+                print("read-ahead: {} files, {:.1f} MiB, stalled {:.2f} s".format(read_ahead.files, read_ahead.bytes / 1024 / 1024, read_ahead.stalled), file=report)
+        if watcher is not None:
+            watcher.discard(scanned)
+            return watch(watcher, params, jobs, args.json, writer)
+    finally:
+        if output is not None and output is not sys.stdout:
+            output.close()
+
+    return 0
+
+
+def cascade_summary(totals, change: bool = True, pixels: bool = True, residual: bool = True) -> str:
+    """
+    :param totals: `profiling.CountTotals`
+    :param change: 前の画像からの変化による判定の結果を表示するか
+    :param pixels: 明るい画素数による判定の結果を表示するか
+    :param residual: 塗りつぶし後の画素数による判定の結果を表示するか
+    :return: 事前判定ごとの棄却数の表示（キャッシュの結果で判定できた画像は事前判定を行わない）
+    """
+    lines = ["cascade: {} images".format(totals.frames)]
+    if change:
+        lines.append("  change:   rejected {} (not compared: {})".format(totals.counts.get("rejected_change", 0), totals.counts.get("change_unchecked", 0)))
+    if pixels:
+        lines.append("  pixels:   rejected {}".format(totals.counts.get("rejected_pixels", 0)))
+    if residual:
+        lines.append("  residual: rejected {}".format(totals.counts.get("rejected_residual", 0)))
+    return "\n".join(lines)
 
+
+def _sweep_value(name: str, value: str):
+    if name == "area_method":
+        if value not in AREA_METHODS:
+            raise ValueError("unknown area method: {}".format(value))
+        return value
+    if name == "prescreen":
+        if int(value) not in PRESCREEN_SCALES:
+            raise ValueError("unsupported prescreen scale: {}".format(value))
+        return int(value)
+    if name in ("min_pixels", "min_residual"):
+        return int(value)
+    if name not in ("input_threshold", "input_maxvalue", "area_threshold", "buffer_ratio", "line_threshold"):
+        raise ValueError("unknown parameter: {}".format(name))
+    return float(value)
+
+
+def sweep(results: typing.Iterable[tuple[str, list]], count: int, matrix: typing.Optional[str] = None) -> list[int]:
+    """
+    パラメーターの組み合わせごとの検出数の集計
+    :param results: `pipeline.map_sweep()`の結果
+    :param count: パラメーターの組み合わせの数
+    :param matrix: 画像ごと・組み合わせごとの直線数を書き出すCSVファイル（None の場合は書き出さない）
+    :return: 組み合わせごとの検出した画像数
+    """
+    import csv
+    detected = [0] * count
+    with contextlib.ExitStack() as stack:
+        writer = None
+        if matrix is not None:
+            f = stack.enter_context(open(matrix, "w", encoding="utf-8", newline=""))
+            writer = csv.writer(f)
+            writer.writerow(["path"] + list(range(count)))
+        for filepath, lines in results:
+            for i, x in enumerate(lines):
+                if x is not None:
+                    detected[i] += 1
+            if writer is not None:
+                writer.writerow([filepath] + [0 if x is None else len(x) for x in lines])
+    return detected
+
+
+def watch(watcher, params: dict, jobs: int = 1, as_json: bool = False, writer=None) -> int:
+    """
+    監視中のディレクトリに追加された画像の流星検出（Ctrl+Cで終了）
+    :param watcher: `FolderWatcher`
+    :param params: `detect_meteor()`のパラメーター
+    :param jobs: 並列数
+    :param as_json: 検出結果をJSON Lines形式で出力するか
+    :param writer: 全画像の処理結果の出力先（`output.RecordWriter`、指定した場合は`as_json`を無視する）
+    :return: 終了コード
+    """
+    from .watch import map_watch
+    from .watch import with_previous
+    print("watching: {}".format(watcher.directory), file=sys.stderr, flush=True)
+    # 直前に書き込まれた画像と比較する（`min_change`）
+    arguments = with_previous() if params.get("min_change", 0) > 0 else None
+    count = 0
+    detected = 0
+    try:
+        for filepath, result in map_watch(functools.partial(detect_meteor, **params), watcher, jobs=jobs, return_exceptions=True, arguments=arguments):
+            count += 1
+            if writer is not None:
+                detected += writer.write(filepath, result).get("detected", False)
+                continue
+            if isinstance(result, Exception):
+                print("{}: {}".format(filepath, result), file=sys.stderr, flush=True)
+                continue
+            lines, _, shape = result
+            if lines is None:
+                continue
+            detected += 1
+            if as_json:
+                record = dict(path=filepath, shape=list(shape), lines=numpy.asarray(lines).reshape(-1, 4).tolist())
+                print(json.dumps(record), flush=True)
+            else:
+                print(filepath, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    print("detected: {}/{}".format(detected, count), file=sys.stderr)
     return 0
 
 
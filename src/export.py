@@ -0,0 +1,186 @@
+import concurrent.futures
+import errno
+import filecmp
+import os
+import shutil
+import sys
+import threading
+import typing
+
+
+COPY = "copy"
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+MOVE = "move"
+MODES = (COPY, HARDLINK, REFLINK, MOVE)
+
+# 結果
+COPIED = "copied"
+LINKED = "linked"
+MOVED = "moved"
+SKIPPED = "skipped"
+
+DEFAULT_THREADS = 4
+
+# Linuxの`FICLONE`（`ioctl(dst, FICLONE, src)`でファイル全体を共有する）
+FICLONE = 0x40049409
+
+# リンクできないファイルシステム・組み合わせの場合のエラー（コピーで代替する）
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY, errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+
+def is_identical(src: str, dst: str, shallow: bool = True) -> bool:
+    """
+    出力先に同じファイルが既にあるか
+    サイズが同じで、同一ファイル（ハードリンク）の場合は内容を比較せずに同じとみなす
+    :param src: 入力ファイルパス
+    :param dst: 出力ファイルパス
+    :param shallow: 更新日時も同じ場合は内容を比較せずに同じとみなすか（入力を削除する場合は`False`にする）
+    :return: 同じファイルか
+    """
+    try:
+        s = os.stat(src)
+        d = os.stat(dst)
+    except OSError:
+        return False
+    if s.st_size != d.st_size:
+        return False
+    if (s.st_dev, s.st_ino) == (d.st_dev, d.st_ino) or (shallow and s.st_mtime_ns == d.st_mtime_ns):
+        return True
+    return filecmp.cmp(src, dst, shallow=False)
+
+
+def _reflink(src: str, dst: str) -> None:
+    if sys.platform != "linux":
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform", dst)
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _place(src: str, dst: str, mode: str) -> str:
+    """
+    一時ファイルに書き出してから置き換える（中断しても書きかけのファイルを残さない）
+    """
+    temp = "{}.{}.part".format(dst, threading.get_ident())
+    try:
+        status = COPIED
+        if mode in (HARDLINK, REFLINK):
+            try:
+                if mode == HARDLINK:
+                    os.link(src, temp)
+                else:
+                    _reflink(src, temp)
+                status = LINKED
+            except OSError as e:
+                if e.errno not in _LINK_UNSUPPORTED:
+                    raise
+                # 別のファイルシステム等: コピーする
+                if os.path.exists(temp):
+                    os.remove(temp)
+        if status == COPIED:
+            shutil.copy2(src, temp)
+        if os.path.lexists(dst):
+            # 書き出し中に作られたファイルも上書きしない
+            raise _exists(dst)
+        os.replace(temp, dst)
+        return status
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _exists(dst: str) -> FileExistsError:
+    return FileExistsError(errno.EEXIST, "a different file already exists", dst)
+
+
+def export_file(src: str, dest: str, mode: str = COPY) -> tuple[str, str]:
+    """
+    1ファイルの書き出し
+    :param src: 入力ファイルパス
+    :param dest: 出力ディレクトリ
+    :param mode: 書き出し方法
+        * `"copy"`: コピー（更新日時も複製する）
+        * `"hardlink"`: ハードリンク（できない場合はコピー）
+        * `"reflink"`: 内容を共有するコピー（Btrfs・XFS等。できない場合はコピー）
+        * `"move"`: 移動
+    出力先に内容の異なる同名のファイルがある場合は上書きせずに`FileExistsError`とする
+    :return: (出力ファイルパス, 結果)
+    """
+    if mode not in MODES:
+        raise ValueError("unknown export mode: {}".format(mode))
+    dst = os.path.join(dest, os.path.basename(src))
+    if not os.path.exists(src):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), src)
+    if os.path.lexists(dst):
+        if mode == MOVE:
+            # 入力を削除するため、内容まで比較する
+            if is_identical(src, dst, shallow=False):
+                if not os.path.samefile(src, dst):
+                    os.remove(src)
+                    return dst, MOVED
+                return dst, SKIPPED
+        elif is_identical(src, dst):
+            return dst, SKIPPED
+        raise _exists(dst)
+    if mode == MOVE:
+        try:
+            os.replace(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # 別のファイルシステム: コピーしてから削除する
+            _place(src, dst, COPY)
+            os.remove(src)
+        return dst, MOVED
+    return dst, _place(src, dst, mode)
+
+
+def export_files(filepaths: typing.Iterable[str], dest: str, mode: str = COPY, threads: int = DEFAULT_THREADS, stop: typing.Optional[threading.Event] = None) -> typing.Iterator[tuple[str, typing.Union[tuple[str, str], Exception]]]:
+    """
+    複数ファイルの並列書き出し
+    同じファイル名の入力が複数ある場合は、最初のもの以外を`FileExistsError`とする
+    :param filepaths: 入力ファイルパス
+    :param dest: 出力ディレクトリ
+    :param mode: 書き出し方法（`export_file()`参照）
+    :param threads: 並列数
+    :param stop: 設定されたら未着手のファイルを書き出さずに終了する
+    :return: `(入力ファイルパス, (出力ファイルパス, 結果) or 例外)`の完了順のイテレーター
+    """
+    os.makedirs(dest, exist_ok=True)
+    threads = max(threads, 1)
+    # 処理待ちは並列数の2倍までとし、入力を一度に投入しない
+    backlog = threads * 2
+    names = {}
+    executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="export")
+    running = {}
+    iterator = iter(filepaths)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) < backlog and not (stop is not None and stop.is_set()):
+                filepath = next(iterator, None)
+                if filepath is None:
+                    exhausted = True
+                    break
+                name = os.path.normcase(os.path.basename(filepath))
+                if name in names:
+                    yield filepath, FileExistsError(errno.EEXIST, "same name as {}".format(names[name]), filepath)
+                    continue
+                names[name] = filepath
+                running[executor.submit(export_file, filepath, dest, mode)] = filepath
+            if stop is not None and stop.is_set():
+                for future in running:
+                    future.cancel()
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                filepath = running.pop(future)
+                if future.cancelled():
+                    continue
+                yield filepath, future.exception() or future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
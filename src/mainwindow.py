@@ -1,5 +1,7 @@
-import os
+import html
 import shutil
+import sqlite3
+import types
 
 import cv2
 
@@ -11,28 +13,35 @@ from PySide2.QtCore import QMetaObject
 from PySide2.QtCore import QModelIndex
 from PySide2.QtCore import QObject
 from PySide2.QtCore import QThread
-from PySide2.QtGui import QColor
 from PySide2.QtGui import QImage
-from PySide2.QtGui import QPen
 from PySide2.QtGui import QPixmap
 from PySide2.QtWidgets import QApplication
 from PySide2.QtWidgets import QDialog
 from PySide2.QtWidgets import QFileDialog
 from PySide2.QtWidgets import QGraphicsPixmapItem
 from PySide2.QtWidgets import QGraphicsScene
+from PySide2.QtWidgets import QInputDialog
+from PySide2.QtWidgets import QLabel
 from PySide2.QtWidgets import QTreeView
 from PySide2.QtWidgets import QMainWindow
 from PySide2.QtWidgets import QMessageBox
 from PySide2.QtWidgets import QProgressBar
 
 
+from . import export
+from .cache import ResultCache
 from .configdialog import ConfigDialog
-from . import detector
 from .event import JPEGFilesDragAndDropFilter
 from .model import JPEGFileListModel
+from .overlay import OverlayItem
+from . import preview
+from .result import ImageResult
+from .thumbnail import ThumbnailLoader
 from .ui.mainwindow import Ui_MainWindow
-from .worker import FileCopyWorker
+from .worker import DirectoryScanWorker
+from .worker import FileExportWorker
 from .worker import MeteorDetectWorker
+from .worker import MeteorWatchWorker
 
 
 class MainWindow(QMainWindow):
@@ -44,29 +53,56 @@ class MainWindow(QMainWindow):
         # model & view
         self.imageListModel = JPEGFileListModel()
         self.ui.treeView.setModel(self.imageListModel)
+        self.ui.treeView.selectionModel().currentRowChanged.connect(self.treeView_currentRowChanged)
         self.dndFilter = JPEGFilesDragAndDropFilter()
         self.ui.treeView.installEventFilter(self.dndFilter)
+        # thumbnail grid shares the current row with the list
+        self.ui.listView.setModel(self.imageListModel)
+        self.ui.listView.setSelectionModel(self.ui.treeView.selectionModel())
+        self.ui.listView.installEventFilter(self.dndFilter)
+        self.ui.listView.hide()
+        self.thumbnailLoader = None
         # status
         self.progressBar = QProgressBar(self.ui.statusbar)
         self.progressBar.setValue(0)
         self.ui.statusbar.addWidget(self.progressBar)
+        self.profileLabel = QLabel(self.ui.statusbar)
+        self.ui.statusbar.addPermanentWidget(self.profileLabel)
         # workers
         self.detectorThread = QThread(self)
         self.detectorWorker = None
-        self.fileCopyThread = QThread(self)
-        self.fileCopyWorker = None
+        self.exportThread = QThread(self)
+        self.exportWorker = None
+        self.scanThread = QThread(self)
+        self.scanWorker = None
         # image view
         self.hideDetected = False
         self.currentImagePath = None
         self.temp = None
+        self.previewCache = preview.PreviewCache()
 
     def closeEvent(self, event):
+        if self.detectorWorker is not None:
+            self.detectorWorker.cancel()
         if self.detectorThread.isRunning():
             self.detectorThread.exit()
             self.detectorThread.wait()
-        if self.fileCopyThread.isRunning():
-            self.fileCopyThread.exit()
-            self.fileCopyThread.wait()
+        if self.exportWorker is not None:
+            self.exportWorker.cancel()
+        if self.exportThread.isRunning():
+            self.exportThread.exit()
+            self.exportThread.wait()
+        if self.scanWorker is not None:
+            self.scanWorker.cancel()
+        if self.scanThread.isRunning():
+            self.scanThread.exit()
+            self.scanThread.wait()
+        self.previewCache.close()
+        if self.thumbnailLoader is not None:
+            self.thumbnailLoader.close()
+            if self.thumbnailLoader.cache is not None:
+                self.thumbnailLoader.cache.trim()
+                self.thumbnailLoader.cache.close()
         # TODO: ask continue
         event.accept()
 
@@ -81,10 +117,62 @@ class MainWindow(QMainWindow):
             return
         self.imageListModel.addFiles(filelist)
 
+    @Slot()
+    def on_actionAddFolder_triggered(self):
+        if self.scanWorker is not None:
+            # already running
+            return
+        dirname = QFileDialog.getExistingDirectory(self, self.tr("Add folder"))
+        if not dirname:
+            return
+        # rows are added page by page while the folder is scanned
+        self.scanWorker = DirectoryScanWorker(dirname)
+        self.scanWorker.filesFound.connect(self.imageListModel.addFiles)
+        self.scanWorker.message.connect(self.ui.statusbar.showMessage)
+        self.scanWorker.done.connect(self.scanWorker_finished)
+        self.scanWorker.aborted.connect(self.scanWorker_finished)
+        self.scanWorker.moveToThread(self.scanThread)
+        self.scanThread.start()
+        QMetaObject.invokeMethod(self.scanWorker, "run")
+        self.updateDetectorActions()
+
+    @Slot()
+    def scanWorker_finished(self):
+        self.scanThread.exit()
+        self.scanThread.wait()
+        worker = self.scanWorker
+        self.scanWorker = None
+        self.updateDetectorActions()
+        text = self.tr("Found {} files.").format(worker.count)
+        if worker.isCancelled():
+            text = self.tr("Cancelled.") + " " + text
+        if worker.failures:
+            text += " " + self.tr("{} folders could not be read.").format(len(worker.failures))
+        self.ui.statusbar.showMessage(text)
+
     @Slot()
     def on_actionClear_triggered(self):
         self.imageListModel.clear()
 
+    @Slot(bool)
+    def on_actionThumbnails_triggered(self, checked: bool):
+        if checked:
+            if self.thumbnailLoader is None:
+                try:
+                    cache = ResultCache()
+                except (OSError, sqlite3.Error):
+                    cache = None
+                self.thumbnailLoader = ThumbnailLoader(cache)
+            self.imageListModel.setThumbnails(self.thumbnailLoader)
+            self.ui.treeView.hide()
+            self.ui.listView.show()
+            self.ui.listView.scrollTo(self.ui.listView.currentIndex())
+        else:
+            self.imageListModel.setThumbnails(None)
+            self.ui.listView.hide()
+            self.ui.treeView.show()
+            self.ui.treeView.scrollTo(self.ui.treeView.currentIndex())
+
     @Slot()
     def on_actionConfig_triggered(self):
         self.config.updateUi()
@@ -101,19 +189,85 @@ class MainWindow(QMainWindow):
         filelist = self.imageListModel.fileList()
         if not filelist:
             return
-        self.detectorWorker = MeteorDetectWorker(filelist, self.config.getConfig())
+        self.startDetectorWorker(MeteorDetectWorker(filelist, self.config.getConfig(), self.ui.actionProfile.isChecked()))
+
+    @Slot()
+    def on_actionWatch_triggered(self):
+        if self.detectorWorker is not None:
+            # already running
+            return
+        dirname = QFileDialog.getExistingDirectory(self, self.tr("Watch directory"))
+        if not dirname:
+            return
+        worker = MeteorWatchWorker(dirname, self.config.getConfig(), self.ui.actionProfile.isChecked())
+        worker.filesAdded.connect(self.detectorWorker_filesAdded)
+        self.startDetectorWorker(worker)
+        self.ui.statusbar.showMessage(self.tr("Watching: {}").format(dirname))
+
+    def startDetectorWorker(self, worker: MeteorDetectWorker):
+        self.detectorWorker = worker
         self.detectorWorker.initializeProgress.connect(self.progressBar.setRange)
         self.detectorWorker.updateProgress.connect(self.progressBar.setValue)
-        self.detectorWorker.updateContext.connect(self.detectorWorker_updateContext)
+        self.detectorWorker.updateContexts.connect(self.detectorWorker_updateContexts)
+        self.detectorWorker.updateProfile.connect(self.detectorWorker_updateProfile)
         self.detectorWorker.done.connect(self.detectorWorker_done)
+        self.detectorWorker.aborted.connect(self.detectorWorker_aborted)
         self.detectorWorker.error.connect(self.worker_error)
         self.detectorWorker.moveToThread(self.detectorThread)
         self.detectorThread.start()
         QMetaObject.invokeMethod(self.detectorWorker, "run")
+        self.updateDetectorActions()
+
+    @Slot()
+    def on_actionPause_triggered(self):
+        if self.detectorWorker is None:
+            return
+        self.detectorWorker.pause()
+        self.updateDetectorActions()
+
+    @Slot()
+    def on_actionResume_triggered(self):
+        if self.detectorWorker is None:
+            return
+        self.detectorWorker.resume()
+        self.updateDetectorActions()
+
+    @Slot()
+    def on_actionCancel_triggered(self):
+        if self.exportWorker is not None:
+            self.exportWorker.cancel()
+        if self.scanWorker is not None:
+            self.scanWorker.cancel()
+        if self.detectorWorker is not None:
+            self.detectorWorker.cancel()
+        self.updateDetectorActions()
 
-    @Slot(str, tuple, list, list)
-    def detectorWorker_updateContext(self, filepath: str, shape: tuple, filled: list, lines: list):
-        self.imageListModel.updateContext(filepath, shape, filled, lines)
+    def updateDetectorActions(self):
+        worker = self.detectorWorker
+        running = worker is not None and not worker.isCancelled()
+        self.ui.actionRun.setEnabled(worker is None)
+        self.ui.actionWatch.setEnabled(worker is None)
+        self.ui.actionPause.setEnabled(running and not worker.isPaused())
+        self.ui.actionResume.setEnabled(running and worker.isPaused())
+        exporting = self.exportWorker is not None and not self.exportWorker.isCancelled()
+        scanning = self.scanWorker is not None and not self.scanWorker.isCancelled()
+        self.ui.actionCancel.setEnabled(running or exporting or scanning)
+        self.ui.actionExport.setEnabled(self.exportWorker is None)
+        self.ui.actionAddFolder.setEnabled(self.scanWorker is None)
+
+    @Slot(list)
+    def detectorWorker_filesAdded(self, filepaths: list[str]):
+        self.imageListModel.addFiles(filepaths)
+
+    @Slot(list)
+    def detectorWorker_updateContexts(self, contexts: list[tuple[str, ImageResult]]):
+        self.imageListModel.updateContexts(contexts)
+
+    @Slot(str, str)
+    def detectorWorker_updateProfile(self, brief: str, summary: str):
+        # median per stage, full table on hover
+        self.profileLabel.setText(brief)
+        self.profileLabel.setToolTip("<pre>{}</pre>".format(html.escape(summary)))
 
     @Slot()
     def detectorWorker_done(self):
@@ -122,36 +276,75 @@ class MainWindow(QMainWindow):
         detected = self.detectorWorker.detected_list
         del self.detectorWorker
         self.detectorWorker = None
+        self.updateDetectorActions()
         QMessageBox.information(self, self.tr("Done"), self.tr("{} images detected.").format(len(detected)))
 
+    @Slot()
+    def detectorWorker_aborted(self):
+        self.detectorThread.exit()
+        self.detectorThread.wait()
+        detected = self.detectorWorker.detected_list
+        del self.detectorWorker
+        self.detectorWorker = None
+        self.updateDetectorActions()
+        if self.progressBar.maximum() == 0:
+            # stop the busy indicator of watching
+            self.progressBar.setRange(0, 1)
+        self.ui.statusbar.showMessage(self.tr("Cancelled: {} images detected.").format(len(detected)))
+
     @Slot()
     def on_actionExport_triggered(self):
-        if self.fileCopyWorker is not None:
+        if self.exportWorker is not None:
             # already running
             return
-        dirname = QFileDialog.getExistingDirectory(self, self.tr("Export directory"))
-        if not dirname:
-            return
         highlighted = self.imageListModel.getHighlighted()
         if not highlighted:
             QMessageBox.warning(self, self.tr("Not highlighted"), self.tr("There is nothing to write out."))
             return
-        self.fileCopyWorker = FileCopyWorker(highlighted, dirname)
-        self.fileCopyWorker.initializeProgress.connect(self.progressBar.setRange)
-        self.fileCopyWorker.updateProgress.connect(self.progressBar.setValue)
-        self.fileCopyWorker.done.connect(self.fileCopyWorker_done)
-        self.fileCopyWorker.error.connect(self.worker_error)
-        self.fileCopyWorker.moveToThread(self.fileCopyThread)
-        self.fileCopyThread.start()
-        QMetaObject.invokeMethod(self.fileCopyWorker, "run")
+        dirname = QFileDialog.getExistingDirectory(self, self.tr("Export directory"))
+        if not dirname:
+            return
+        modes = [self.tr("Copy"), self.tr("Hardlink"), self.tr("Reflink"), self.tr("Move")]
+        mode, ok = QInputDialog.getItem(self, self.tr("Export"), self.tr("Mode:"), modes, 0, False)
+        if not ok:
+            return
+        self.exportWorker = FileExportWorker(highlighted, dirname, export.MODES[modes.index(mode)])
+        self.exportWorker.initializeProgress.connect(self.progressBar.setRange)
+        self.exportWorker.updateProgress.connect(self.progressBar.setValue)
+        self.exportWorker.moved.connect(self.exportWorker_moved)
+        self.exportWorker.done.connect(self.exportWorker_finished)
+        self.exportWorker.aborted.connect(self.exportWorker_finished)
+        self.exportWorker.error.connect(self.worker_error)
+        self.exportWorker.moveToThread(self.exportThread)
+        self.exportThread.start()
+        QMetaObject.invokeMethod(self.exportWorker, "run")
+        self.updateDetectorActions()
+
+    @Slot(list)
+    def exportWorker_moved(self, moved: list[tuple[str, str]]):
+        self.imageListModel.renameFiles(moved)
+        for src, dst in moved:
+            if src == self.currentImagePath:
+                self.currentImagePath = dst
 
     @Slot()
-    def fileCopyWorker_done(self):
-        self.fileCopyThread.exit()
-        self.fileCopyThread.wait()
-        del self.fileCopyWorker
-        self.fileCopyWorker = None
-        QMessageBox.information(self, self.tr("Done"), self.tr("File exported."))
+    def exportWorker_finished(self):
+        self.exportThread.exit()
+        self.exportThread.wait()
+        worker = self.exportWorker
+        self.exportWorker = None
+        self.updateDetectorActions()
+        counts = worker.counts
+        text = self.tr("Exported: {}, linked: {}, moved: {}, skipped (identical): {}, failed: {}").format(
+            counts[export.COPIED], counts[export.LINKED], counts[export.MOVED], counts[export.SKIPPED], len(worker.failures))
+        if worker.isCancelled():
+            text = self.tr("Cancelled.") + " " + text
+        if not worker.failures:
+            QMessageBox.information(self, self.tr("Done"), text)
+            return
+        box = QMessageBox(QMessageBox.Warning, self.tr("Export failed"), text, QMessageBox.Ok, self)
+        box.setDetailedText("\n".join("{}: {}".format(x, y) for x, y in worker.failures))
+        box.exec_()
 
     @Slot(bool)
     def on_actionHideDetected_triggered(self, checked: bool):
@@ -169,9 +362,56 @@ class MainWindow(QMainWindow):
     @Slot(QModelIndex)
     def on_treeView_activated(self, index: QModelIndex):
         filepath = self.imageListModel.at(index.sibling(index.row(), 0))
+        if filepath == self.currentImagePath:
+            # already shown by treeView_currentRowChanged
+            return
         self.currentImagePath = filepath
         self.showImage()
 
+    @Slot(QModelIndex)
+    def on_listView_activated(self, index: QModelIndex):
+        self.on_treeView_activated(index)
+
+    @Slot(QModelIndex, QModelIndex)
+    def treeView_currentRowChanged(self, current: QModelIndex, previous: QModelIndex):
+        if not current.isValid():
+            return
+        self.currentImagePath = self.imageListModel.at(current.sibling(current.row(), 0))
+        self.showImage()
+
+    def prefetchImages(self):
+        row = self.ui.treeView.currentIndex().row()
+        if row < 0:
+            return
+        # neighbours in the order of likely browsing
+        fileList = self.imageListModel.fileList()
+        rows = [row + 1, row - 1, row + 2]
+        filepaths = [fileList[x] for x in rows if 0 <= x < len(fileList)]
+        config = self.config.getConfig()
+        requests = []
+        for filepath in filepaths:
+            requests.append((filepath, self.currentView(), config))
+            if not self.hideDetected:
+                requests.append((filepath, preview.AREA, self.resultConfig(filepath)))
+        self.previewCache.prefetch(requests)
+
+    def resultConfig(self, filepath: str):
+        """
+        :param filepath: image file path
+        :return: settings the current result of the image was detected with (current settings if unknown)
+        """
+        context = self.imageListModel.getContext(filepath)
+        if context is None or context.params is None:
+            return self.config.getConfig()
+        return types.SimpleNamespace(**context.params)
+
+    def currentView(self) -> str:
+        if self.ui.radioButtonImageThreshold.isChecked():
+            return preview.THRESHOLD
+        elif self.ui.radioButtonImageFilled.isChecked():
+            return preview.FILL
+        return preview.ORIGINAL
+
     def showImage(self):
         image = self.loadImage(self.currentImagePath)
         if not image:
@@ -181,46 +421,29 @@ class MainWindow(QMainWindow):
         scene.addItem(item)
         context = self.imageListModel.getContext(self.currentImagePath)
         if not self.hideDetected and context is not None:
-            shape, contours, lines = context
-            contourPen = QPen(QColor(0xff, 0x00, 0x00), 1)
-            for cnt in contours:
-                cnt = [x[0] for x in cnt]
-                x0, y0 = cnt[0]
-                for x, y in cnt[1:]:
-                    scene.addLine(x0, y0, x, y, contourPen)
-                    x0, y0 = x, y
-            linePen = QPen(QColor(0x00, 0xff, 0x00), 3)
-            if lines:
-                for line in lines[0]:
-                    x0, y0, x1, y1 = line
-                    scene.addLine(x0, y0, x1, y1, linePen)
+            # regions of the run the lines come from, not of the settings edited since
+            contours = self.previewCache.get(self.currentImagePath, preview.AREA, self.resultConfig(self.currentImagePath)) or []
+            scene.addItem(OverlayItem(contours, context.lines))
         self.ui.graphicsView.setScene(scene)
         self.ui.graphicsView.fitInView(item.boundingRect(), Qt.KeepAspectRatio)
+        self.prefetchImages()
 
     def loadImage(self, filepath: str):
         if not filepath:
             return None
-        if not os.path.exists(filepath):
+        view = self.currentView()
+        try:
+            img = self.previewCache.get(filepath, view, self.config.getConfig())
+        except ValueError as e:
+            # broken or truncated image
+            self.ui.statusbar.showMessage(str(e))
             return None
-        config = self.config.getConfig()
-        if self.ui.radioButtonImageThreshold.isChecked():
-            # threshold image
-            img = detector.load_binary(filepath, config.input_threshold, config.input_maxvalue)
-            height, width = img.shape
-            self.temp = img.flatten()
-            return QImage(self.temp, width, height, QImage.Format_Grayscale8)
-        elif self.ui.radioButtonImageFilled.isChecked():
-            # filled-image
-            img = detector.load_binary(filepath, config.input_threshold, config.area_threshold)
-            area_contours = detector.detect_area(img)
-            boundingRect = None
-            if area_contours:
-                img = detector.fill_area(img, area_contours, color=0)
-            height, width = img.shape
-            self.temp = img.flatten()
-            return QImage(self.temp, width, height, width, QImage.Format_Grayscale8)
-        # original (default) case
-        return QImage(filepath)
+        if img is None or view == preview.ORIGINAL:
+            return img
+        # threshold or filled image; the cached array must outlive the QImage
+        height, width = img.shape
+        self.temp = img
+        return QImage(img, width, height, width, QImage.Format_Grayscale8)
 
     @Slot(bool)
     def on_radioButtonImageOriginal_clicked(self, checked: bool = False):
@@ -1,7 +1,6 @@
+import os
 import typing
 
-import cv2
-
 from PySide2.QtCore import Qt
 from PySide2.QtCore import QAbstractItemModel
 from PySide2.QtCore import QFileInfo
@@ -11,6 +10,8 @@ from PySide2.QtCore import QUrl
 from PySide2.QtGui import QColor
 from PySide2.QtGui import QPalette
 
+from .result import ImageResult
+
 
 class FetchObject:
     """
@@ -36,9 +37,9 @@ class FetchObject:
 
     def extend(self, size: int) -> None:
         """
-        :param size: extend size
+        :param size: extend size (fetched size is kept)
         """
-        self.size += size
+        self._size += size
 
     def fetchSize(self, more: int=FETCHSIZE) -> int:
         """
@@ -201,21 +202,61 @@ class JPEGFileListModel(AbstractItemModel):
     def __init__(self, parent: QObject = None):
         super().__init__(parent)
         self._fileList = []
+        # filepath -> row
+        self._rows = {}
+        # display names of column 0
+        self._names = []
         self.highlighted = set()
         self.context = {}
+        # ThumbnailLoader for Qt.DecorationRole (None: no thumbnails)
+        self.thumbnails = None
         self.column = FetchObject(3)
         self.palette = QPalette()
         self.isLightMode = self.palette.window().color().lightness() > 127
+        if self.isLightMode:
+            self.highlightColor = QColor(HIGHLIGHT_COLOR_LIGHT)
+        else:
+            self.highlightColor = QColor(HIGHLIGHT_COLOR_DARK)
 
     def fileList(self) -> list[str]:
         return self._fileList
 
+    def setThumbnails(self, thumbnails) -> None:
+        """
+        :param thumbnails: ThumbnailLoader, or None not to show thumbnails
+        """
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.disconnect(self._updateThumbnail)
+        self.thumbnails = thumbnails
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.connect(self._updateThumbnail)
+        self._updateRows(range(self.rowCount()), [Qt.DecorationRole])
+
+    def rowOf(self, filepath: str) -> int:
+        """
+        :param filepath: file path
+        :return: row of the file, or -1 if not listed
+        """
+        return self._rows.get(filepath, -1)
+
     def setFileList(self, fileList: list[str]) -> None:
         self.beginResetModel()
-        self._fileList = fileList
+        self._fileList = []
+        self._rows = {}
+        self._names = []
+        self._append(fileList)
         self.setItemSize(len(self._fileList), 3)
         self.endResetModel()
 
+    def _append(self, files: typing.Iterable[str]) -> None:
+        for filepath in files:
+            if filepath in self._rows:
+                # already exist
+                continue
+            self._rows[filepath] = len(self._fileList)
+            self._fileList.append(filepath)
+            self._names.append(os.path.basename(filepath))
+
     def addUrls(self, urls: list[QUrl]) -> None:
         temp = []
         for url in urls:
@@ -231,27 +272,19 @@ class JPEGFileListModel(AbstractItemModel):
         self.addFiles(temp)
 
     def addFiles(self, files: list[str]) -> None:
-        fileList = self.fileList()
-        row = self.rowCount()
-        temp = []
-        for filepath in files:
-            if filepath in fileList:
-                # already exist
-                continue
-            temp.append(filepath)
-
+        temp = list(dict.fromkeys(x for x in files if x not in self._rows))
         if not temp:
             return
 
-        head = len(self._fileList)
-        last = head + len(temp) - 1
-        self.beginInsertRows(QModelIndex(), head, last)
-        self._fileList.extend(temp)
+        # rows beyond the fetched ones are inserted by fetchMore() when the view reaches them
         if self.row is None:
-            self.row = FetchObject(len(temp))
-        else:
-            self.row.extend(len(temp))
-        self.endInsertRows()
+            self.row = FetchObject(0)
+        fetchedAll = not self.row.canFetchMore()
+        self._append(temp)
+        self.row.extend(len(temp))
+        if fetchedAll:
+            # the end of the list may be shown: insert the next page now
+            self.fetchMore()
 
     def rowCount(self, parent: QModelIndex=QModelIndex()) -> int:
         if parent.isValid():
@@ -279,36 +312,31 @@ class JPEGFileListModel(AbstractItemModel):
                 return super().data(index, role)
             filepath = self._fileList[row]
             if filepath in self.highlighted:
-                if self.isLightMode:
-                    return QColor(HIGHLIGHT_COLOR_LIGHT)
-                else:
-                    return QColor(HIGHLIGHT_COLOR_DARK)
+                return self.highlightColor
             else:
                 return self.palette.base().color()
+        elif role == Qt.DecorationRole:
+            if index.column() != 0 or self.thumbnails is None:
+                return None
+            # loaded in the background for the rows being shown
+            return self.thumbnails.thumbnail(self._fileList[row])
         elif role == Qt.DisplayRole:
             column = index.column()
-            filepath = self._fileList[row]
             if column == 0:
                 # FilePath
-                info = QFileInfo(filepath)
-                return info.fileName()
-            elif column == 1:
+                return self._names[row]
+            filepath = self._fileList[row]
+            result = self.context.get(filepath)
+            if result is None:
+                return ""
+            if column == 1:
                 # FilledRatio
-                if filepath not in self.context:
-                    return ""
-                height, width = self.context[filepath][0]
-                contours = self.context[filepath][1]
-                area = width * height
-                filled = sum(cv2.contourArea(x) / area for x in contours)
-                return "{:0.4f}".format(filled)
-            elif index.column() == 2:
+                return "{:0.4f}".format(result.filled)
+            elif column == 2:
                 # LineCount
-                if filepath not in self.context:
-                    return ""
-                lines = self.context[filepath][2]
-                if lines is None:
+                if result.lines is None:
                     return ""
-                return str(len(lines))
+                return str(len(result.lines))
         return None
 
     def at(self, index: QModelIndex):
@@ -316,6 +344,34 @@ class JPEGFileListModel(AbstractItemModel):
             return None
         return self.fileList()[index.row()]
 
+    def getHighlighted(self) -> list[str]:
+        """
+        :return: highlighted files in the order of the list
+        """
+        return [x for x in self._fileList if x in self.highlighted]
+
+    def renameFiles(self, renamed: list[tuple[str, str]]) -> None:
+        """
+        follow files moved elsewhere, keeping their results
+        :param renamed: list of (old path, new path)
+        """
+        rows = []
+        for old, new in renamed:
+            row = self._rows.get(old)
+            if row is None or new in self._rows:
+                continue
+            del self._rows[old]
+            self._rows[new] = row
+            self._fileList[row] = new
+            self._names[row] = os.path.basename(new)
+            if old in self.context:
+                self.context[new] = self.context.pop(old)
+            if old in self.highlighted:
+                self.highlighted.discard(old)
+                self.highlighted.add(new)
+            rows.append(row)
+        self._updateRows(rows, [Qt.DisplayRole])
+
     def clear(self):
         self.setFileList([])
         self.clearHighlight()
@@ -323,35 +379,56 @@ class JPEGFileListModel(AbstractItemModel):
     def clearHighlight(self):
         self.highlighted = set()
         self.context = {}
-        fileList = self.fileList()
-        if fileList:
+        if self.rowCount():
             begin = self.index(0, 0)
-            end = self.index(len(fileList), 0)
-            self.dataChanged.emit(begin, end, [Qt.BackgroundRole])
+            end = self.index(self.rowCount() - 1, 2)
+            self.dataChanged.emit(begin, end, [Qt.DisplayRole, Qt.BackgroundRole])
 
-    def updateContext(self, filepath: str, shape: tuple, filled: list, lines: list):
-        print(filepath, shape)
-        self.context[filepath] = (shape, filled, lines)
-        if lines:
+    def updateContext(self, filepath: str, result: ImageResult):
+        self.context[filepath] = result
+        if result.detected:
             self.highlighted.add(filepath)
         else:
             self.highlighted.discard(filepath)
         self._updateContext(filepath)
 
-    def getContext(self, filepath: str) -> typing.Optional[tuple[tuple, list, list]]:
-        if filepath not in self.context:
-            return None
-        return self.context[filepath]
+    def updateContexts(self, contexts: list[tuple[str, ImageResult]]):
+        """
+        :param contexts: list of (filepath, result) as updateContext()
+        """
+        rows = []
+        for filepath, result in contexts:
+            self.context[filepath] = result
+            if result.detected:
+                self.highlighted.add(filepath)
+            else:
+                self.highlighted.discard(filepath)
+            rows.append(self.rowOf(filepath))
+        self._updateRows(rows, [Qt.DisplayRole, Qt.BackgroundRole])
+
+    def getContext(self, filepath: str) -> typing.Optional[ImageResult]:
+        return self.context.get(filepath)
 
     def _updateContext(self, filepath: str):
-        fileList = self.fileList()
-        if filepath not in fileList:
-            return
-        i = fileList.index(filepath)
-        begin = self.index(i, 0)
-        end = self.index(i, 2)
-        role = [Qt.DisplayRole, Qt.BackgroundRole]
-        self.dataChanged.emit(begin, end, role)
+        self._updateRows([self.rowOf(filepath)], [Qt.DisplayRole, Qt.BackgroundRole])
+
+    def _updateRows(self, rows: typing.Iterable[int], role: list[int]):
+        """
+        emit dataChanged once per run of consecutive rows
+        :param rows: rows to update (rows not listed or not fetched yet are ignored)
+        :param role: changed roles
+        """
+        count = self.rowCount()
+        rows = sorted(set(x for x in rows if 0 <= x < count))
+        i = 0
+        while i < len(rows):
+            j = i
+            while j + 1 < len(rows) and rows[j + 1] == rows[j] + 1:
+                j += 1
+            begin = self.index(rows[i], 0)
+            end = self.index(rows[j], 2)
+            self.dataChanged.emit(begin, end, role)
+            i = j + 1
 
     def highlight(self, filepath: str):
         self.highlighted.add(filepath)
@@ -361,11 +438,8 @@ class JPEGFileListModel(AbstractItemModel):
         self.highlighted.discard(filepath)
         self._updateHighlight(filepath, False)
 
+    def _updateThumbnail(self, filepath: str):
+        self._updateRows([self.rowOf(filepath)], [Qt.DecorationRole])
+
     def _updateHighlight(self, filepath: str, highlight: bool):
-        fileList = self.fileList()
-        if filepath not in fileList:
-            return
-        i = fileList.index(filepath)
-        begin = self.index(i, 0)
-        end = self.index(i, 2)
-        self.dataChanged.emit(begin, end, [Qt.BackgroundRole])
+        self._updateRows([self.rowOf(filepath)], [Qt.BackgroundRole])
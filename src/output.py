@@ -0,0 +1,109 @@
+import csv
+import json
+import typing
+
+import numpy
+
+from .profiling import FrameProfile
+from .profiling import Profiler
+from .result import ImageResult
+
+
+JSONL = "jsonl"
+CSV = "csv"
+FORMATS = (JSONL, CSV)
+
+CSV_FIELDS = ("path", "width", "height", "detected", "line_count", "lines", "lengths", "filled", "time_ms", "error")
+
+
+def frame_record(filepath: str, result: typing.Union[tuple, Exception], profile: typing.Optional[FrameProfile] = None) -> dict:
+    """
+    1枚の画像の処理結果の記録
+    :param filepath: 入力ファイルパス
+    :param result: `detect_meteor()`の検出結果 or 処理中の例外
+    :param profile: 計測結果（None の場合は処理時間を含めない）
+    :return: `path`・`width`・`height`・`detected`・`lines`（直線の端点）・`lengths`（直線の長さ）・
+        `filled`（塗りつぶし領域の面積比）・`times`（段階ごとの処理時間[ms]）、例外の場合は`path`・`error`
+    """
+    if isinstance(result, Exception):
+        return dict(path=filepath, error=str(result))
+    lines, contours, shape = result
+    summary = ImageResult.from_detection(shape[:2], contours or [], lines)
+    segments = summary.lines if summary.lines is not None else numpy.empty((0, 4), dtype=numpy.int32)
+    lengths = numpy.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    record = dict(
+        path=filepath,
+        width=int(shape[1]),
+        height=int(shape[0]),
+        detected=summary.detected,
+        lines=segments.tolist(),
+        lengths=[round(x, 2) for x in lengths.tolist()],
+        filled=summary.filled,
+    )
+    if profile is not None:
+        record["times"] = {name: round(value * 1000, 3) for name, value in profile.times.items()}
+    return record
+
+
+def csv_row(record: dict) -> dict:
+    """
+    :param record: `frame_record()`の記録
+    :return: CSVの1行（直線は`x0 y0 x1 y1`を`;`区切り、処理時間は合計のみ）
+    """
+    if "error" in record:
+        return record
+    row = dict(record)
+    row["detected"] = int(record["detected"])
+    row["line_count"] = len(record["lines"])
+    row["lines"] = ";".join(" ".join(str(x) for x in line) for line in record["lines"])
+    row["lengths"] = ";".join(str(x) for x in record["lengths"])
+    times = record.get("times")
+    if times:
+        row["time_ms"] = times.get("total", round(sum(times.values()), 3))
+    return row
+
+
+class RecordWriter:
+    """
+    処理結果の逐次出力
+    1枚ごとに書き出してフラッシュするため、処理中でも結果を読み出せ、メモリ使用量は画像数によらず一定
+    `map_detect()`の`profiler`として渡すと、画像ごとの処理時間も出力する
+    """
+
+    def __init__(self, stream: typing.TextIO, format: str = JSONL, profiler: typing.Optional[Profiler] = None):
+        """
+        :param stream: 出力先
+        :param format: 出力形式（`"jsonl"` or `"csv"`）
+        :param profiler: 計測結果の集計先（受け取った計測結果を転送する）
+        """
+        if format not in FORMATS:
+            raise ValueError("unknown output format: {}".format(format))
+        self.stream = stream
+        self.format = format
+        self.profiler = profiler
+        # 結果を受け取る前の計測結果（`map_detect()`は計測結果を渡した直後にその結果を返す）
+        self.profiles = {}
+        self.writer = None
+        if format == CSV:
+            self.writer = csv.DictWriter(stream, CSV_FIELDS, extrasaction="ignore")
+            self.writer.writeheader()
+            stream.flush()
+
+    def add(self, filepath: str, profile: FrameProfile) -> None:
+        self.profiles[filepath] = profile
+        if self.profiler is not None:
+            self.profiler.add(filepath, profile)
+
+    def write(self, filepath: str, result: typing.Union[tuple, Exception]) -> dict:
+        """
+        :param filepath: 入力ファイルパス
+        :param result: `detect_meteor()`の検出結果 or 処理中の例外
+        :return: 出力した記録
+        """
+        record = frame_record(filepath, result, self.profiles.pop(filepath, None))
+        if self.writer is not None:
+            self.writer.writerow(csv_row(record))
+        else:
+            self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+        return record
@@ -0,0 +1,99 @@
+import math
+import typing
+
+import cv2
+import numpy
+
+from PySide2.QtCore import Qt
+from PySide2.QtCore import QPointF
+from PySide2.QtCore import QRectF
+from PySide2.QtGui import QColor
+from PySide2.QtGui import QPainterPath
+from PySide2.QtGui import QPen
+from PySide2.QtGui import QPolygonF
+from PySide2.QtWidgets import QGraphicsItem
+from PySide2.QtWidgets import QStyleOptionGraphicsItem
+
+
+CONTOUR_COLOR = QColor(0xff, 0x00, 0x00)
+LINE_COLOR = QColor(0x00, 0xff, 0x00)
+
+# coarsest level of detail: contours simplified to 2 ** MAX_LEVEL / 2 image pixels
+MAX_LEVEL = 6
+
+
+def _polygon(points: numpy.array) -> QPolygonF:
+    return QPolygonF([QPointF(x, y) for x, y in points.reshape(-1, 2).tolist()])
+
+
+class OverlayItem(QGraphicsItem):
+    """
+    Detected areas and lines drawn over the preview image.
+
+    The contours are drawn as one path instead of an item per segment.
+    Below 1:1 zoom they are simplified to about half a screen pixel, with
+    the path of each level built on first paint, so fitting a large frame
+    into the view draws far fewer points. Every paint draws the whole path;
+    the points outside the exposed area are not culled.
+    """
+
+    def __init__(self, contours: list[numpy.array], lines: typing.Optional[numpy.array], parent: typing.Optional[QGraphicsItem] = None):
+        """
+        :param contours: contours of the areas in image coordinates
+        :param lines: detected lines ``[[start_x, start_y, end_x, end_y], ...]`` or None
+        :param parent: parent item
+        """
+        super().__init__(parent)
+        self.contours = [x for x in contours if len(x) > 0]
+        self.contourPen = QPen(CONTOUR_COLOR, 1)
+        self.contourPen.setCosmetic(True)
+        self.linePen = QPen(LINE_COLOR, 3)
+        self.linePen.setCosmetic(True)
+        self.paths = {}
+        self.linePath = QPainterPath()
+        if lines is not None:
+            for x0, y0, x1, y1 in numpy.asarray(lines).reshape(-1, 4).tolist():
+                self.linePath.moveTo(x0, y0)
+                self.linePath.lineTo(x1, y1)
+        self.rect = self.linePath.boundingRect()
+        if self.contours:
+            points = numpy.concatenate(self.contours).reshape(-1, 2)
+            x0, y0 = points.min(axis=0).tolist()
+            x1, y1 = points.max(axis=0).tolist()
+            self.rect = self.rect.united(QRectF(x0, y0, x1 - x0, y1 - y0))
+
+    def boundingRect(self) -> QRectF:
+        # cosmetic pens are a few screen pixels wide at any zoom
+        return self.rect.adjusted(-2, -2, 2, 2)
+
+    def contourPath(self, level: int) -> QPainterPath:
+        """
+        :param level: level of detail (0: every point, n: simplified to ``2 ** n / 2`` pixels)
+        :return: path of all the contours
+        """
+        path = self.paths.get(level)
+        if path is not None:
+            return path
+        epsilon = 2 ** level / 2 if level > 0 else 0
+        path = QPainterPath()
+        for cnt in self.contours:
+            if epsilon > 0:
+                cnt = cv2.approxPolyDP(cnt, epsilon, True)
+            polygon = _polygon(cnt)
+            path.addPolygon(polygon)
+            path.closeSubpath()
+        self.paths[level] = path
+        return path
+
+    def paint(self, painter, option: QStyleOptionGraphicsItem, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = 0
+        if 0 < lod < 1:
+            level = min(int(math.log2(1 / lod)) + 1, MAX_LEVEL)
+        painter.setBrush(Qt.NoBrush)
+        if self.contours:
+            painter.setPen(self.contourPen)
+            painter.drawPath(self.contourPath(level))
+        if not self.linePath.isEmpty():
+            painter.setPen(self.linePen)
+            painter.drawPath(self.linePath)
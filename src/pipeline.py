@@ -0,0 +1,543 @@
+import collections
+import functools
+import itertools
+import typing
+
+import numpy
+
+from . import detector
+from .cache import ResultCache
+from .cache import file_identity
+from .cache import pack_area
+from .cache import pack_lines
+from .cache import unpack_area
+from .cache import unpack_lines
+from .profiling import FrameProfile
+from .profiling import Profiler
+from .profiling import profile_call
+from .profiling import stage
+
+
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024  # 512MiB
+
+# 各段階とその段階の結果が依存するパラメーター
+STAGE_PARAMS = {
+    "decode": ("scale",),
+    "threshold": ("scale", "input_threshold", "input_maxvalue", "mask"),
+    "area": ("scale", "input_threshold", "input_maxvalue", "mask", "min_pixels", "area_threshold", "area_method"),
+    "fill": ("scale", "input_threshold", "input_maxvalue", "mask", "min_pixels", "area_threshold", "area_method", "buffer_ratio"),
+    "hough": ("scale", "input_threshold", "input_maxvalue", "mask", "min_pixels", "area_threshold", "area_method", "buffer_ratio", "min_residual"),
+}
+
+# 永続キャッシュに保存する段階（画像はサイズが大きいため保存しない）
+PERSISTENT_STAGES = ("area", "hough")
+
+DEFAULT_PARAMS = {
+    "input_threshold": 127,
+    "input_maxvalue": 255,
+    "area_threshold": 0.0001,
+    "buffer_ratio": 1.1,
+    "line_threshold": 100,
+    "area_method": "contour",
+    "prescreen": 1,
+    "mask": None,
+    "min_pixels": 0,
+    "min_residual": 0,
+    "min_change": 0,
+}
+
+Result = tuple[typing.Optional[list[numpy.array]], list[numpy.array], tuple[int, int]]
+
+
+# 段階の結果の取得方法
+COMPUTE = "compute"  # 保持されていなければ計算する
+LOOKUP = "lookup"  # 保持されている結果のみを使う
+PROBE = "probe"  # 保持されているかのみを確認する（area段階の領域は読み込まない）
+
+
+# 先読みしたファイルの内容の`local`でのキー
+_DATA = "data"
+
+
+class _Missing(Exception):
+    """
+    `COMPUTE`以外で結果が保持されていない段階に到達した
+    """
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, numpy.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(x) for x in value)
+    return 0
+
+
+class Pipeline:
+    """
+    段階ごとに結果を再利用する流星検出
+
+    decode → threshold → area → fill → hough → lines の各段階の結果を、
+    その段階が依存するパラメーター（`STAGE_PARAMS`）のみをキーとして保持する。
+    一部のパラメーターだけを変えて再実行した場合は、影響を受ける段階以降のみを再計算する。
+    例えば`line_threshold`のみの変更は、保持している直線の長さによる絞り込みだけで済む。
+
+    結果はメモリ上（`memory_limit`までのLRU）と、area・houghの段階は永続キャッシュにも保持する。
+    """
+
+    def __init__(self, cache: typing.Optional[ResultCache] = None, memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        """
+        :param cache: 永続キャッシュ（未指定の場合はメモリ上のみ）
+        :param memory_limit: メモリ上に保持する結果の最大サイズ[byte]
+        """
+        self.cache = cache
+        self.memory_limit = memory_limit
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.memory_size = 0
+
+    def _remember(self, key: tuple, value, nbytes: int) -> None:
+        # count a fixed overhead per entry so that small results are bounded as well
+        nbytes += 64
+        if nbytes > self.memory_limit:
+            return
+        if key in self.memory:
+            self.memory_size -= self.memory.pop(key)[1]
+        self.memory[key] = (value, nbytes)
+        self.memory_size += nbytes
+        while self.memory_size > self.memory_limit:
+            _, (_, size) = self.memory.popitem(last=False)
+            self.memory_size -= size
+
+    def _stage(self, identity: tuple[str, int, int], name: str, params: dict, local: dict, mode: str = COMPUTE, profile: typing.Optional[FrameProfile] = None):
+        """
+        段階の結果の取得
+        :param identity: `file_identity()`の値
+        :param name: 段階名
+        :param params: 全パラメーター（`scale`を含む）
+        :param local: 1回の検出処理内で使う結果の保持先
+        :param mode: 取得方法（`COMPUTE`以外で保持されていない場合は`_Missing`を送出）
+        :param profile: 計測結果の記録先
+        :return: 段階の結果（`PROBE`のarea段階は空の領域リストとサイズ`(0, 0)`）
+        """
+        stage_params = {x: params[x] for x in STAGE_PARAMS[name]}
+        if stage_params.get("mask") is not None:
+            # 編集されたマスクの結果を使わないよう、マスク画像の更新日時等もキーに含める
+            stage_params["mask"] = file_identity(stage_params["mask"]) or stage_params["mask"]
+        key = (identity, name, tuple(stage_params.values()))
+        if key in local:
+            return local[key]
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            value = self.memory[key][0]
+            local[key] = value
+            if profile is not None:
+                profile.count("memory_hits", 1)
+            return value
+        if mode == PROBE and name == "area":
+            if self.cache is None or not self.cache.contains(identity, name, stage_params):
+                raise _Missing(name)
+            return [], (0, 0)
+        if self.cache is not None and name in PERSISTENT_STAGES:
+            with stage(profile, "cache", params["scale"]):
+                data = self.cache.get(identity, name, stage_params)
+                if data is not None:
+                    value = unpack_area(data) if name == "area" else unpack_lines(data)
+            if data is not None:
+                self._remember(key, value, _nbytes(value))
+                local[key] = value
+                if profile is not None:
+                    profile.count("cache_hits", 1)
+                return value
+        if mode != COMPUTE:
+            raise _Missing(name)
+        value = self._compute(identity, name, params, local, profile)
+        if self.cache is not None and name in PERSISTENT_STAGES:
+            data = pack_area(*value) if name == "area" else pack_lines(value)
+            self.cache.put(identity, name, stage_params, data)
+        self._remember(key, value, _nbytes(value))
+        local[key] = value
+        return value
+
+    def _compute(self, identity: tuple[str, int, int], name: str, params: dict, local: dict, profile: typing.Optional[FrameProfile] = None):
+        # 依存する段階の取得は計測に含めない
+        filepath = identity[0]
+        scale = params["scale"]
+        if name == "decode":
+            with stage(profile, "decode", scale):
+                img = detector.load_image(filepath, scale, local.get(_DATA))
+            if profile is not None:
+                profile.allocate("decode", img)
+            return img
+        # マスクを指定した場合、二値化以降の画像はマスクの外接矩形に切り抜いたもの、
+        # 領域・直線は元の画像の座標で保持する
+        if name == "threshold":
+            img = self._stage(identity, "decode", params, local, profile=profile)
+            with stage(profile, "threshold", scale):
+                sky = None
+                if params["mask"] is not None:
+                    sky = detector.load_mask(params["mask"], img.shape)
+                    img = sky.apply(img)
+                return detector.binarize(img, params["input_threshold"], params["input_maxvalue"]), sky
+        if name == "area":
+            img, sky = self._stage(identity, "threshold", params, local, profile=profile)
+            if not detector.check_pixels(img, params["min_pixels"], scale, "pixels", profile):
+                return [], sky.shape if sky is not None else img.shape
+            if sky is None:
+                with stage(profile, "area", scale):
+                    return detector.detect_area(img, params["area_threshold"], params["area_method"], profile), img.shape
+            with stage(profile, "area", scale):
+                contours = detector.detect_area(img, sky.area_threshold(params["area_threshold"]), params["area_method"], profile)
+            return sky.restore_contours(contours), sky.shape
+        if name == "fill":
+            img, sky = self._stage(identity, "threshold", params, local, profile=profile)
+            contours, _ = self._stage(identity, "area", params, local, profile=profile)
+            if not contours:
+                return img
+            if sky is not None:
+                contours = sky.crop_contours(contours)
+            with stage(profile, "fill", scale):
+                # keep the thresholded image in memory untouched
+                return detector.fill_area(img.copy(), contours, buffer_ratio=params["buffer_ratio"], color=0)
+        if name == "hough":
+            if params["min_pixels"] > 0:
+                # rejected by the area stage, which counted the rejection
+                img, _ = self._stage(identity, "threshold", params, local, profile=profile)
+                if not detector.check_pixels(img, params["min_pixels"], scale):
+                    return None
+            img = self._stage(identity, "fill", params, local, profile=profile)
+            if not detector.check_pixels(img, params["min_residual"], scale, "residual", profile):
+                return None
+            with stage(profile, "hough", scale):
+                segments = detector.detect_segments(img, scale)
+            if profile is not None:
+                profile.count("segments", 0 if segments is None else len(segments))
+            if params["mask"] is not None:
+                _, sky = self._stage(identity, "threshold", params, local, profile=profile)
+                segments = sky.restore_lines(segments)
+            return segments
+        raise ValueError("unknown stage: {}".format(name))
+
+    def _filter(self, segments, params: dict, scale: int, profile: typing.Optional[FrameProfile]):
+        with stage(profile, "filter", scale):
+            lines = detector.filter_lines(segments, params["line_threshold"], scale)
+        if profile is not None:
+            profile.count("lines", 0 if lines is None else len(lines))
+        return lines
+
+    def _detect(self, identity: tuple[str, int, int], params: dict, mode: str, profile: typing.Optional[FrameProfile] = None, data: typing.Optional[bytes] = None, local: typing.Optional[dict] = None, previous: typing.Optional[str] = None) -> Result:
+        if local is None:
+            local = {_DATA: data}
+        prescreen = params["prescreen"]
+        if mode == COMPUTE and params["min_change"] > 0:
+            # 前の画像との比較は保持している結果で判定できない場合のみ行う（棄却した結果は保持しない）
+            first = dict(params, scale=prescreen)
+            try:
+                self._stage(identity, "hough", first, local, LOOKUP)
+                self._stage(identity, "area", first, local, PROBE)
+            except _Missing:
+                img, sky = self._stage(identity, "threshold", first, local, profile=profile)
+                key = (params["input_threshold"], params["input_maxvalue"], params["mask"])
+                if not detector.check_change(identity[0], previous, img, prescreen, key, params["min_change"], profile):
+                    shape = sky.shape if sky is not None else img.shape
+                    return None, [], detector.full_shape(shape, prescreen, identity[0], local.get(_DATA))
+        if prescreen > 1:
+            scaled = dict(params, scale=prescreen)
+            segments = self._stage(identity, "hough", scaled, local, mode, profile)
+            lines = self._filter(segments, params, prescreen, profile)
+            if lines is None:
+                contours, shape = self._stage(identity, "area", scaled, local, mode, profile)
+                return None, [x * prescreen for x in contours], detector.full_shape(shape, prescreen, identity[0], local.get(_DATA))
+        params = dict(params, scale=1)
+        segments = self._stage(identity, "hough", params, local, mode, profile)
+        contours, shape = self._stage(identity, "area", params, local, mode, profile)
+        return self._filter(segments, params, 1, profile), contours, shape
+
+    def stage(self, filepath: str, name: str, scale: int = 1, **kwargs):
+        """
+        段階の結果の取得
+        :param filepath: 入力画像ファイルパス
+        :param name: 段階名（`STAGE_PARAMS`参照）
+        :param scale: 縮小率
+        :param kwargs: `detect_meteor()`のパラメーター
+        :return: 段階の結果（threshold段階は`(2値画像, マスク or None)`、area段階は`(領域リスト, 画像サイズ)`）
+        """
+        identity = file_identity(filepath)
+        if identity is None:
+            raise FileNotFoundError(filepath)
+        params = dict(DEFAULT_PARAMS, scale=scale, **kwargs)
+        return self._stage(identity, name, params, {})
+
+    def detect(self, filepath: str, profile: typing.Optional[FrameProfile] = None, data: typing.Optional[bytes] = None, previous: typing.Optional[str] = None, **kwargs) -> Result:
+        """
+        流星の検出
+        :param filepath: 入力画像ファイルパス
+        :param profile: 計測結果の記録先
+        :param data: 先読みしたファイルの内容
+        :param previous: 前の画像のファイルパス（`min_change`の判定用）
+        :param kwargs: `detect_meteor()`のパラメーター
+        :return: `detect_meteor()`と同じ形式の検出結果
+        """
+        identity = file_identity(filepath)
+        if identity is None:
+            raise FileNotFoundError(filepath)
+        return self._detect(identity, dict(DEFAULT_PARAMS, **kwargs), COMPUTE, profile, data, previous=previous)
+
+    def sweep(self, filepath: str, configs: list[dict], profile: typing.Optional[FrameProfile] = None, data: typing.Optional[bytes] = None) -> list[Result]:
+        """
+        複数のパラメーターでの流星の検出
+        1枚の画像に対して全パラメーターを続けて処理し、デコードは1回、二値化・領域検出・塗りつぶし・直線検出は
+        その段階が依存するパラメーターの組み合わせごとに1回のみ行う
+        段階のパラメーター順に処理し、以降で使わない画像はその都度破棄するため、保持する画像は数枚に収まる
+        :param filepath: 入力画像ファイルパス
+        :param configs: `detect_meteor()`のパラメーターのリスト
+        :param profile: 計測結果の記録先
+        :param data: 先読みしたファイルの内容
+        :return: パラメーターごとの`detect_meteor()`と同じ形式の検出結果
+        """
+        identity = file_identity(filepath)
+        if identity is None:
+            raise FileNotFoundError(filepath)
+        configs = [dict(DEFAULT_PARAMS, **x) for x in configs]
+        order = sorted(range(len(configs)), key=lambda i: sweep_key(configs[i]))
+        local = {_DATA: data}
+        results = [None] * len(configs)
+        for n, i in enumerate(order):
+            results[i] = self._detect(identity, configs[i], COMPUTE, profile, local=local)
+            following = configs[order[n + 1]] if n + 1 < len(order) else None
+            for key in [x for x in local if x != _DATA]:
+                _, name, values = key
+                if name == "fill":
+                    # only used by the hough stage, which is kept
+                    del local[key]
+                elif name == "threshold":
+                    if following is None or values[1:3] != (following["input_threshold"], following["input_maxvalue"]):
+                        del local[key]
+        return results
+
+    def lookup(self, filepath: str, profile: typing.Optional[FrameProfile] = None, **kwargs) -> typing.Optional[Result]:
+        """
+        保持している結果のみでの流星の検出
+        :param filepath: 入力画像ファイルパス
+        :param profile: 計測結果の記録先
+        :param kwargs: `detect_meteor()`のパラメーター
+        :return: `detect_meteor()`と同じ形式の検出結果 or None（再計算が必要な場合）
+        """
+        identity = file_identity(filepath)
+        if identity is None:
+            return None
+        try:
+            return self._detect(identity, dict(DEFAULT_PARAMS, **kwargs), LOOKUP, profile)
+        except _Missing:
+            return None
+
+
+def sweep_key(params: dict) -> tuple:
+    """
+    :param params: `detect_meteor()`のパラメーター
+    :return: 段階を共有するパラメーターが隣り合うように並べるためのキー
+    """
+    names = dict.fromkeys(STAGE_PARAMS["hough"][1:] + ("prescreen", "line_threshold"))
+    # マスクは None と混在しうるため文字列で比較する
+    return tuple(str(params[x]) if x == "mask" else params[x] for x in names)
+
+
+def param_grid(base: dict, grid: dict[str, list]) -> list[dict]:
+    """
+    パラメーターの組み合わせの作成
+    :param base: 基準のパラメーター
+    :param grid: 変化させるパラメーターとその値のリスト
+    :return: `base`の一部を`grid`の全組み合わせで置き換えたパラメーターのリスト（`grid`の最後のパラメーターが最も速く変化する）
+    """
+    unknown = [x for x in grid if x not in DEFAULT_PARAMS]
+    if unknown:
+        raise ValueError("unknown parameter: {}".format(", ".join(unknown)))
+    return [dict(base, **dict(zip(grid, values))) for values in itertools.product(*grid.values())]
+
+
+# ワーカープロセスごとのPipeline（キャッシュファイルパスごと）
+_pipelines = {}
+
+
+def _pipeline(cache_path: typing.Optional[str]) -> Pipeline:
+    pipeline = _pipelines.get(cache_path)
+    if pipeline is None:
+        cache = ResultCache(cache_path) if cache_path is not None else None
+        # 同じ画像を続けて処理することはないため、メモリ上には保持しない
+        pipeline = Pipeline(cache, memory_limit=0)
+        _pipelines[cache_path] = pipeline
+    return pipeline
+
+
+def detect_file(cache_path: typing.Optional[str], filepath: str, **kwargs) -> Result:
+    """
+    `map_files()`用の流星検出
+    プロセスごとに`Pipeline`を1つ作り、段階の結果を永続キャッシュ経由で再利用する
+    :param cache_path: キャッシュファイルパス（None の場合はキャッシュを使わない）
+    :param filepath: 入力画像ファイルパス
+    :param kwargs: `detect_meteor()`のパラメーター
+    :return: `detect_meteor()`と同じ形式の検出結果
+    """
+    return _pipeline(cache_path).detect(filepath, **kwargs)
+
+
+def sweep_file(cache_path: typing.Optional[str], configs: list[dict], filepath: str, profile: typing.Optional[FrameProfile] = None, data: typing.Optional[bytes] = None) -> list[typing.Optional[numpy.array]]:
+    """
+    `map_files()`用の複数パラメーターでの流星検出（`Pipeline.sweep()`参照）
+    プロセス間の受け渡しを小さくするため、検出した直線のみを返す
+    :param cache_path: キャッシュファイルパス（None の場合はキャッシュを使わない）
+    :param configs: `detect_meteor()`のパラメーターのリスト
+    :param filepath: 入力画像ファイルパス
+    :param profile: 計測結果の記録先
+    :param data: 先読みしたファイルの内容
+    :return: パラメーターごとの検出した直線 or None
+    """
+    results = _pipeline(cache_path).sweep(filepath, configs, profile=profile, data=data)
+    return [lines for lines, _, _ in results]
+
+
+# `min_change`の判定で前の画像と同じワーカープロセスで処理する連続したファイルの数
+CHANGE_CHUNK_SIZE = 16
+
+# `map_detect()`でキャッシュの結果が続いた場合に、処理中の画像の完了を待って結果を返すまでの件数
+LOOKUP_AHEAD = 64
+
+
+def _with_previous(filepaths: typing.Iterable[str]) -> typing.Iterator[tuple[str, typing.Optional[str]]]:
+    previous = None
+    for filepath in filepaths:
+        yield filepath, previous
+        previous = filepath
+
+
+def map_detect(filepaths: typing.Iterable[str], params: dict, cache: typing.Optional[ResultCache] = None, ordered: bool = True, profiler: typing.Optional[Profiler] = None, **kwargs) -> typing.Iterator[tuple[str, typing.Union[Result, Exception]]]:
+    """
+    キャッシュを使った複数ファイルの流星検出
+    キャッシュの結果のみで判定できる画像は即座に返し、それ以外を`map_files()`で処理する
+    :param filepaths: 入力ファイルパス
+    :param params: `detect_meteor()`のパラメーター
+    :param cache: 永続キャッシュ（未指定の場合は`detect_meteor()`をそのまま実行）
+    :param ordered: `True`の場合は入力順、`False`の場合は得られた順に結果を返す
+    :param profiler: 画像ごとの計測結果の集計先（None の場合は計測しない）
+    :param kwargs: `map_files()`のパラメーター
+    :return: `(ファイルパス, 処理結果)`のイテレーター
+    """
+    if cache is None:
+        func = functools.partial(detector.detect_meteor, **params)
+    else:
+        func = functools.partial(detect_file, cache.filepath, **params)
+    # 処理する画像ごとの入力順で直前の画像（`min_change`の判定用）
+    previous = None
+    if params.get("min_change", 0) > 0:
+        previous = {}
+        kwargs.setdefault("arguments", lambda x: dict(previous=previous.pop(x, None)))
+        # 直前の画像の判定用の縮小画像はワーカープロセスごとに保持するため、連続した画像をまとめて渡す
+        kwargs.setdefault("chunk_size", CHANGE_CHUNK_SIZE)
+    if profiler is not None:
+        # 計測結果はワーカープロセスから処理結果と一緒に受け取る
+        func = functools.partial(profile_call, func)
+
+    def unwrap(results):
+        for filepath, result in results:
+            if profiler is not None and not isinstance(result, Exception):
+                result, profile = result
+                profiler.add(filepath, profile)
+            yield filepath, result
+
+    def sequence():
+        for filepath, last in _with_previous(filepaths):
+            previous[filepath] = last
+            yield filepath
+
+    if cache is None:
+        yield from unwrap(detector.map_files(func, filepaths if previous is None else sequence(), ordered=ordered, **kwargs))
+        return
+
+    pipeline = Pipeline(cache, memory_limit=0)
+    # キャッシュで判定できた結果と処理待ちの画像を入力順に並べておく（`ordered=False`の場合は前者のみ）
+    pending = collections.deque()
+    source = _with_previous(filepaths)
+    exhausted = False
+
+    def lookup(filepath: str):
+        if profiler is None:
+            return pipeline.lookup(filepath, **params)
+        profile = FrameProfile()
+        with profile.stage("total"):
+            result = pipeline.lookup(filepath, profile=profile, **params)
+        if result is None:
+            return None
+        return result, profile
+
+    def misses():
+        nonlocal exhausted
+        hits = 0
+        for filepath, last in source:
+            try:
+                result = lookup(filepath)
+            except Exception as e:
+                if not kwargs.get("return_exceptions", False):
+                    raise
+                result = e
+            if result is not None or ordered:
+                pending.append((filepath, result))
+            if result is not None:
+                hits += 1
+                if hits >= LOOKUP_AHEAD:
+                    # キャッシュの結果が続く場合は入力を打ち切り、処理中の画像と合わせて結果を返す
+                    return
+                continue
+            hits = 0
+            if previous is not None:
+                previous[filepath] = last
+            yield filepath
+        exhausted = True
+
+    def ready():
+        while pending and pending[0][1] is not None:
+            yield pending.popleft()
+
+    # キャッシュの結果が続いて`map_files()`を作り直す場合もプロセスは使い回す
+    executor = None
+    if kwargs.get("jobs", 1) > 1:
+        executor = detector.create_pool(kwargs["jobs"], kwargs.get("mp_context"))
+    try:
+        while not exhausted:
+            results = detector.map_files(func, misses(), ordered=ordered, executor=executor, **kwargs)
+            try:
+                for filepath, result in unwrap(results):
+                    yield from unwrap(ready())
+                    if ordered:
+                        pending.popleft()
+                    yield filepath, result
+            finally:
+                results.close()
+            yield from unwrap(ready())
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        cache.flush()
+
+
+def map_sweep(filepaths: typing.Iterable[str], configs: list[dict], cache: typing.Optional[ResultCache] = None, profiler: typing.Optional[Profiler] = None, **kwargs) -> typing.Iterator[tuple[str, typing.Union[list[typing.Optional[numpy.array]], Exception]]]:
+    """
+    複数ファイル・複数パラメーターの流星検出
+    画像ごとに全パラメーターを処理するため、各画像の読み込みは1回で済む
+    :param filepaths: 入力ファイルパス
+    :param configs: `detect_meteor()`のパラメーターのリスト（`param_grid()`参照）
+    :param cache: 永続キャッシュ（ワーカーはこのファイルにarea・houghの段階を保存し、同じパラメーターでの再実行時に再利用する）
+    :param profiler: 画像ごとの計測結果の集計先（None の場合は計測しない）
+    :param kwargs: `map_files()`のパラメーター
+    :return: `(ファイルパス, パラメーターごとの検出した直線 or None)`の入力順のイテレーター
+    """
+    func = functools.partial(sweep_file, cache.filepath if cache is not None else None, configs)
+    if profiler is not None:
+        func = functools.partial(profile_call, func)
+    for filepath, result in detector.map_files(func, filepaths, **kwargs):
+        if profiler is not None and not isinstance(result, Exception):
+            result, profile = result
+            profiler.add(filepath, profile)
+        yield filepath, result
@@ -0,0 +1,175 @@
+import collections
+import concurrent.futures
+import threading
+import typing
+
+import numpy
+
+from PySide2.QtGui import QImage
+
+from . import detector
+from .cache import file_identity
+from .pipeline import DEFAULT_MEMORY_LIMIT
+
+
+# views of the image and the configuration they depend on
+ORIGINAL = "original"
+DECODE = "decode"
+THRESHOLD = "threshold"
+AREA = "area"  # contours of the areas, not an image
+FILL = "fill"
+
+VIEW_PARAMS = {
+    ORIGINAL: (),
+    DECODE: (),
+    THRESHOLD: ("input_threshold", "input_maxvalue", "mask"),
+    AREA: ("input_threshold", "input_maxvalue", "mask", "area_threshold", "area_method"),
+    FILL: ("input_threshold", "input_maxvalue", "mask", "area_threshold", "area_method", "buffer_ratio"),
+}
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, QImage):
+        return value.sizeInBytes()
+    if isinstance(value, list):
+        return sum(x.nbytes for x in value)
+    return value.nbytes
+
+
+class PreviewCache:
+    """
+    Memory-bounded LRU of the images shown in the preview.
+
+    Images are keyed by the file identity (path, size, mtime), the view and
+    only the configuration values the view depends on, so switching views or
+    changing unrelated settings reuses what has already been decoded.
+    ``prefetch()`` prepares images on a background thread; ``get()`` waits for
+    an image which is being prefetched instead of decoding it twice.
+    """
+
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT, workers: int = 1):
+        self.memory_limit = memory_limit
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="preview")
+
+    def close(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+        self.executor.shutdown(wait=True)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_size = 0
+
+    @staticmethod
+    def key(identity: tuple[str, int, int], view: str, config) -> tuple:
+        values = []
+        for name in VIEW_PARAMS[view]:
+            value = getattr(config, name)
+            if name == "mask" and value:
+                # the mask file may be edited or replaced at the same path
+                value = file_identity(value) or value
+            values.append(value)
+        return (identity, view) + tuple(values)
+
+    def get(self, filepath: str, view: str, config) -> typing.Union[QImage, numpy.ndarray, None]:
+        """
+        :param filepath: image file path
+        :param view: one of ``ORIGINAL``, ``DECODE``, ``THRESHOLD``, ``AREA`` and ``FILL``
+        :param config: ``Config``
+        :return: ``QImage`` for ``ORIGINAL``, list of contours for ``AREA``, grayscale array otherwise,
+            or None if the file is missing (``ValueError`` if it cannot be decoded)
+        """
+        identity = file_identity(filepath)
+        if identity is None:
+            return None
+        return self._get(identity, view, config)
+
+    def prefetch(self, requests: list[tuple[str, str, typing.Any]]) -> None:
+        """
+        Prepare images in the background, dropping earlier requests not started yet.
+        :param requests: ``(filepath, view, config)`` in order of priority
+        """
+        keys = {}
+        for filepath, view, config in requests:
+            identity = file_identity(filepath)
+            if identity is not None:
+                keys.setdefault(self.key(identity, view, config), config)
+        with self.lock:
+            for key, future in list(self.pending.items()):
+                if key not in keys and future.cancel():
+                    del self.pending[key]
+            for key, config in keys.items():
+                if key in self.memory or key in self.pending:
+                    continue
+                identity, view = key[:2]
+                self.pending[key] = self.executor.submit(self._load, key, identity, view, config)
+
+    def _get(self, identity: tuple[str, int, int], view: str, config):
+        key = self.key(identity, view, config)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key][0]
+            future = self.pending.get(key)
+            if future is not None and future.cancel():
+                # not started yet: load it here rather than waiting behind other requests
+                del self.pending[key]
+                future = None
+        if future is not None:
+            try:
+                return future.result()
+            except concurrent.futures.CancelledError:
+                pass
+        return self._load(key, identity, view, config)
+
+    def _load(self, key: tuple, identity: tuple[str, int, int], view: str, config):
+        try:
+            value = self._compute(identity, view, config)
+            self._remember(key, value)
+            return value
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _compute(self, identity: tuple[str, int, int], view: str, config):
+        filepath = identity[0]
+        if view == ORIGINAL:
+            return QImage(filepath)
+        if view == DECODE:
+            return detector.load_image(filepath)
+        if view == THRESHOLD:
+            img = self._get(identity, DECODE, config)
+            if config.mask:
+                # previews stay full-frame, with the masked-out region blacked out
+                img = detector.load_mask(config.mask, img.shape).mask(img)
+            return detector.binarize(img, config.input_threshold, config.input_maxvalue)
+        if view == AREA:
+            img = self._get(identity, THRESHOLD, config)
+            return detector.detect_area(img, config.area_threshold, config.area_method)
+        if view == FILL:
+            img = self._get(identity, THRESHOLD, config)
+            contours = self._get(identity, AREA, config)
+            if not contours:
+                return img
+            # keep the cached threshold image untouched
+            return detector.fill_area(img.copy(), contours, buffer_ratio=config.buffer_ratio, color=0)
+        raise ValueError("unknown view: {}".format(view))
+
+    def _remember(self, key: tuple, value) -> None:
+        nbytes = _nbytes(value)
+        if nbytes > self.memory_limit:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_size -= self.memory.pop(key)[1]
+            self.memory[key] = (value, nbytes)
+            self.memory_size += nbytes
+            while self.memory_size > self.memory_limit:
+                _, (_, size) = self.memory.popitem(last=False)
+                self.memory_size -= size
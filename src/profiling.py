@@ -0,0 +1,212 @@
+import contextlib
+import time
+import typing
+
+import numpy
+
+
+# 計測しない場合に使う何もしないコンテキスト
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile: "FrameProfile", name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        times = self.profile.times
+        times[self.name] = times.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class FrameProfile:
+    """
+    1枚の画像の処理の計測結果
+    段階ごとの処理時間[s]・件数（輪郭数、直線数等）・確保した配列のサイズ[byte]を記録する
+    プロセス間で受け渡せるよう、値は組み込み型のみで保持する
+    """
+
+    __slots__ = ("times", "counts", "nbytes")
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.nbytes = {}
+
+    def stage(self, name: str, scale: int = 1) -> _StageTimer:
+        """
+        :param name: 段階名
+        :param scale: 縮小率（縮小画像の処理は`decode@1/4`のように別の段階として記録する）
+        :return: 囲んだ処理の時間を段階の処理時間に加算するコンテキスト
+        """
+        if scale != 1:
+            name = "{}@1/{}".format(name, scale)
+        return _StageTimer(self, name)
+
+    def count(self, name: str, value: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def allocate(self, name: str, value) -> None:
+        """
+        :param name: 段階名
+        :param value: 確保した配列（またはそのリスト）
+        """
+        if isinstance(value, (list, tuple)):
+            nbytes = sum(x.nbytes for x in value)
+        else:
+            nbytes = value.nbytes
+        self.nbytes[name] = self.nbytes.get(name, 0) + nbytes
+
+    def total(self) -> float:
+        if "total" in self.times:
+            return self.times["total"]
+        return sum(self.times.values())
+
+
+def stage(profile: typing.Optional[FrameProfile], name: str, scale: int = 1):
+    """
+    :param profile: 計測結果の記録先（None の場合は計測しない）
+    :param name: 段階名
+    :param scale: 縮小率
+    :return: 囲んだ処理の時間を計測するコンテキスト
+    """
+    if profile is None:
+        return _NULL_STAGE
+    return profile.stage(name, scale)
+
+
+def profile_call(func: typing.Callable, filepath: str, **kwargs) -> tuple[typing.Any, FrameProfile]:
+    """
+    計測付きの呼び出し（`map_files()`用）
+    :param func: `profile`引数で`FrameProfile`を受け取る処理関数
+    :param filepath: 入力ファイルパス
+    :param kwargs: 処理関数のその他の引数
+    :return: (処理結果, 計測結果)
+    """
+    profile = FrameProfile()
+    with profile.stage("total"):
+        result = func(filepath, profile=profile, **kwargs)
+    return result, profile
+
+
+class Profiler:
+    """
+    複数画像の計測結果の集計
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self.frames = []
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def add(self, filepath: str, profile: FrameProfile) -> None:
+        self.frames.append((filepath, profile))
+
+    def stages(self) -> list[str]:
+        """
+        :return: 記録された段階名（最初に記録された順、`total`は最後）
+        """
+        names = {}
+        for _, profile in self.frames:
+            names.update(dict.fromkeys(profile.times))
+        if "total" in names:
+            del names["total"]
+            names["total"] = None
+        return list(names)
+
+    def times(self, name: str) -> numpy.array:
+        """
+        :param name: 段階名
+        :return: その段階を処理した画像ごとの処理時間[s]
+        """
+        return numpy.array([x.times[name] for _, x in self.frames if name in x.times])
+
+    def slowest(self, count: int = 10) -> list[tuple[str, float]]:
+        """
+        :param count: 件数
+        :return: 処理時間の長い順の(ファイルパス, 処理時間[s])
+        """
+        totals = [(filepath, profile.total()) for filepath, profile in self.frames]
+        totals.sort(key=lambda x: x[1], reverse=True)
+        return totals[:count]
+
+    def brief(self) -> str:
+        """
+        :return: 段階ごとの処理時間の中央値の1行表示
+        """
+        items = []
+        for name in self.stages():
+            items.append("{} {:.1f}ms".format(name, numpy.median(self.times(name)) * 1000))
+        return "{} images: {}".format(len(self.frames), ", ".join(items))
+
+    def summary(self, slowest: int = 10) -> str:
+        """
+        :param slowest: 表示する処理時間の長い画像の件数
+        :return: 段階ごとの処理時間の分布・件数・配列サイズと処理時間の長い画像の表示
+        """
+        if not self.frames:
+            return "no images profiled"
+        header = "{:<20} {:>7}".format("stage", "images")
+        header += "".join(" {:>9}".format("p{}[ms]".format(x)) for x in self.PERCENTILES)
+        header += " {:>9} {:>9}".format("max[ms]", "total[s]")
+        lines = [header]
+        for name in self.stages():
+            times = self.times(name)
+            line = "{:<20} {:>7}".format(name, len(times))
+            line += "".join(" {:>9.2f}".format(x * 1000) for x in numpy.percentile(times, self.PERCENTILES))
+            line += " {:>9.2f} {:>9.2f}".format(times.max() * 1000, times.sum())
+            lines.append(line)
+        counts = {}
+        nbytes = {}
+        for _, profile in self.frames:
+            for name, value in profile.counts.items():
+                counts.setdefault(name, []).append(value)
+            for name, value in profile.nbytes.items():
+                nbytes.setdefault(name, []).append(value)
+        if counts:
+            lines.append("")
+            lines.append("{:<20} {:>9} {:>9} {:>9}".format("count", "mean", "max", "total"))
+            for name, values in counts.items():
+                lines.append("{:<20} {:>9.1f} {:>9} {:>9}".format(name, numpy.mean(values), max(values), sum(values)))
+        if nbytes:
+            lines.append("")
+            lines.append("{:<20} {:>9} {:>9}".format("allocated", "mean[MiB]", "max[MiB]"))
+            for name, values in nbytes.items():
+                lines.append("{:<20} {:>9.2f} {:>9.2f}".format(name, numpy.mean(values) / 1024 / 1024, max(values) / 1024 / 1024))
+        if slowest > 0:
+            lines.append("")
+            lines.append("slowest:")
+            for filepath, total in self.slowest(slowest):
+                lines.append("{:>9.2f} ms  {}".format(total * 1000, filepath))
+        return "\n".join(lines)
+
+
+class CountTotals:
+    """
+    複数画像の件数（輪郭数・事前判定の棄却数等）の合計
+    画像ごとの計測結果を保持しないため、画像数によらずメモリ使用量は一定
+    `map_detect()`の`profiler`として渡し、受け取った計測結果は`profiler`にも転送する
+    """
+
+    def __init__(self, profiler: typing.Optional[Profiler] = None):
+        """
+        :param profiler: 計測結果の集計先
+        """
+        self.profiler = profiler
+        self.frames = 0
+        self.counts = {}
+
+    def add(self, filepath: str, profile: FrameProfile) -> None:
+        self.frames += 1
+        for name, value in profile.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+        if self.profiler is not None:
+            self.profiler.add(filepath, profile)
@@ -0,0 +1,100 @@
+import collections
+import concurrent.futures
+import time
+import typing
+
+
+DEFAULT_DEPTH = 4
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024  # 256MiB
+DEFAULT_THREADS = 2
+
+
+def read_file(filepath: str) -> typing.Optional[bytes]:
+    """
+    :param filepath: ファイルパス
+    :return: ファイルの内容 or None（読み込めなかった場合）
+    """
+    try:
+        with open(filepath, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class ReadAhead:
+    """
+    ファイルの先読み
+
+    I/Oスレッドで`depth`件先までファイルの内容を読み込んでおき、ネットワークドライブ等の
+    読み込み待ちを検出処理の裏に隠す。
+    読み込み済みで未処理の内容と読み込み中のもの（それまでの平均サイズで見積もる）の合計は
+    `memory_limit`までに制限する（1件は常に読み込む）。
+    """
+
+    def __init__(self, depth: int = DEFAULT_DEPTH, memory_limit: int = DEFAULT_MEMORY_LIMIT, threads: int = DEFAULT_THREADS):
+        """
+        :param depth: 先読みする最大件数
+        :param memory_limit: 先読みした内容の最大合計サイズ[byte]
+        :param threads: I/Oスレッド数
+        """
+        self.depth = max(depth, 1)
+        self.memory_limit = memory_limit
+        self.threads = max(threads, 1)
+        # 統計
+        self.files = 0
+        self.bytes = 0
+        self.stalled = 0.0
+
+    def average_size(self) -> int:
+        if self.files == 0:
+            return 0
+        return self.bytes // self.files
+
+    def read(self, filepaths: typing.Iterable[str]) -> typing.Iterator[tuple[str, typing.Optional[bytes]]]:
+        """
+        :param filepaths: ファイルパス
+        :return: `(ファイルパス, ファイルの内容 or None)`のイテレーター（入力順）
+        """
+        filepaths = iter(filepaths)
+        queue = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(self.threads, thread_name_prefix="read-ahead")
+
+        def buffered() -> int:
+            average = self.average_size()
+            total = 0
+            for _, future in queue:
+                if future.done() and future.result() is not None:
+                    total += len(future.result())
+                else:
+                    total += average
+            return total
+
+        def fill() -> bool:
+            # 先読みの追加（入力が尽きたらFalse）
+            while len(queue) < self.depth:
+                if queue and buffered() + self.average_size() > self.memory_limit:
+                    break
+                filepath = next(filepaths, None)
+                if filepath is None:
+                    return False
+                queue.append((filepath, executor.submit(read_file, filepath)))
+            return True
+
+        try:
+            remaining = fill()
+            while queue:
+                filepath, future = queue.popleft()
+                if not future.done():
+                    start = time.perf_counter()
+                    concurrent.futures.wait([future])
+                    self.stalled += time.perf_counter() - start
+                data = future.result()
+                if data is not None:
+                    self.files += 1
+                    self.bytes += len(data)
+                # 呼び出し側の処理中も先読みが進むよう、返す前に補充する
+                if remaining:
+                    remaining = fill()
+                yield filepath, data
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,45 @@
+import typing
+
+import cv2
+import numpy
+
+
+class ImageResult:
+    """
+    1枚の画像の検出結果の要約
+    画像一覧の表示に必要な値のみを保持し、領域の輪郭は保持しない（プレビュー時に検出時のパラメーターで再計算する）
+    """
+
+    __slots__ = ("shape", "filled", "lines", "params")
+
+    def __init__(self, shape: tuple[int, int], filled: float, lines: typing.Optional[numpy.array], params: typing.Optional[dict] = None):
+        """
+        :param shape: 画像サイズ`(height, width)`
+        :param filled: 塗りつぶし領域の面積比
+        :param lines: 流星と判定した直線の端点`[[start_x, start_y, end_x, end_y], ...]` or None
+        :param params: 検出時の`detect_meteor()`のパラメーター（同じ処理の結果の間で共有する） or None
+        """
+        self.shape = shape
+        self.filled = filled
+        self.lines = lines
+        self.params = params
+
+    @classmethod
+    def from_detection(cls, shape: tuple[int, int], contours: list[numpy.array], lines: typing.Optional[list[numpy.array]], params: typing.Optional[dict] = None) -> "ImageResult":
+        """
+        :param shape: 画像サイズ`(height, width)`
+        :param contours: 領域リスト
+        :param lines: `detect_meteor()`の検出直線リスト or None
+        :param params: 検出時の`detect_meteor()`のパラメーター
+        :return: 検出結果の要約
+        """
+        height, width = shape
+        area = width * height
+        filled = sum(cv2.contourArea(x) for x in contours) / area if area else 0.0
+        if lines is not None:
+            lines = numpy.array(lines, dtype=numpy.int32).reshape(-1, 4)
+        return cls(tuple(shape), float(filled), lines, params)
+
+    @property
+    def detected(self) -> bool:
+        return self.lines is not None and len(self.lines) > 0
@@ -0,0 +1,48 @@
+import os
+import typing
+
+
+JPEG_SUFFIXES = (".jpg", ".jpeg")
+
+
+def is_jpeg(filepath: str) -> bool:
+    return filepath.lower().endswith(JPEG_SUFFIXES)
+
+
+def scan_jpegs(directory: str, recursive: bool = True, onerror: typing.Optional[typing.Callable[[OSError], None]] = None) -> typing.Iterator[str]:
+    """
+    ディレクトリ以下のJPEGファイルの列挙
+    `os.scandir()`で1ディレクトリずつ読みながら返すため、全体の一覧を作る前に処理を始められる
+    各ディレクトリ内は名前順に、サブディレクトリはその位置で深さ優先に辿る
+    :param directory: ディレクトリ
+    :param recursive: サブディレクトリも辿るか
+    :param onerror: 読めなかったディレクトリの例外を受け取る関数（未指定の場合は無視する）
+    :return: ファイルパスのイテレーター
+    """
+    # 読み終えていないディレクトリの残りのエントリー（名前の降順、末尾から取り出す）
+    stack = [[directory]]
+    while stack:
+        entries = stack[-1]
+        if not entries:
+            stack.pop()
+            continue
+        entry = entries.pop()
+        if isinstance(entry, str):
+            path = entry
+        elif entry.is_dir(follow_symlinks=False):
+            if not recursive:
+                continue
+            path = entry.path
+        else:
+            if is_jpeg(entry.name):
+                yield entry.path
+            continue
+        try:
+            with os.scandir(path) as it:
+                children = list(it)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+        children.sort(key=lambda x: x.name, reverse=True)
+        stack.append(children)
@@ -0,0 +1,333 @@
+import collections
+import concurrent.futures
+import datetime
+import os
+import struct
+import typing
+
+import cv2
+import numpy
+
+from . import detector
+from .detector import _stage
+from .profiling import FrameProfile
+
+
+# 背景の推定方法
+SEQUENCE_METHODS = ("previous", "median", "max")
+
+# 撮影日時を探すファイル先頭の範囲（Exifは先頭のAPP1セグメントに入る）
+EXIF_READ_SIZE = 128 * 1024
+
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_SUBSEC_ORIGINAL = 0x9291
+
+
+def _read_ifd(tiff: bytes, offset: int, order: str) -> dict[int, tuple[int, int, bytes]]:
+    """
+    :param tiff: TIFFヘッダーからのExifデータ
+    :param offset: IFDの位置
+    :param order: バイト順（`<` or `>`）
+    :return: タグ番号ごとの(型, 個数, 値または値の位置の4バイト)
+    """
+    count, = struct.unpack_from(order + "H", tiff, offset)
+    entries = {}
+    for i in range(count):
+        tag, kind, n = struct.unpack_from(order + "HHI", tiff, offset + 2 + i * 12)
+        entries[tag] = (kind, n, tiff[offset + 10 + i * 12:offset + 14 + i * 12])
+    return entries
+
+
+def _read_ascii(tiff: bytes, entry: typing.Optional[tuple[int, int, bytes]], order: str) -> typing.Optional[str]:
+    if entry is None or entry[0] != 2:
+        return None
+    _, count, value = entry
+    if count > 4:
+        start, = struct.unpack(order + "I", value)
+        value = tiff[start:start + count]
+    return value[:count].split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+
+
+def _exif_datetime(data: bytes) -> typing.Optional[float]:
+    """
+    :param data: JPEGファイルの先頭部分
+    :return: Exifの撮影日時（DateTimeOriginal、無い場合はDateTime）のタイムスタンプ or None
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 詰め物
+            pos += 1
+            continue
+        if marker == 0xDA:
+            # 画像データの開始
+            return None
+        length, = struct.unpack_from(">H", data, pos + 2)
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b"Exif\x00\x00":
+            return _tiff_datetime(data[pos + 10:pos + 2 + length])
+        pos += 2 + length
+    return None
+
+
+def _tiff_datetime(tiff: bytes) -> typing.Optional[float]:
+    if tiff[:2] == b"II":
+        order = "<"
+    elif tiff[:2] == b"MM":
+        order = ">"
+    else:
+        return None
+    try:
+        ifd0 = _read_ifd(tiff, struct.unpack_from(order + "I", tiff, 4)[0], order)
+        text = None
+        subsec = None
+        if _TAG_EXIF_IFD in ifd0:
+            exif = _read_ifd(tiff, struct.unpack(order + "I", ifd0[_TAG_EXIF_IFD][2])[0], order)
+            text = _read_ascii(tiff, exif.get(_TAG_DATETIME_ORIGINAL), order)
+            subsec = _read_ascii(tiff, exif.get(_TAG_SUBSEC_ORIGINAL), order)
+        if not text:
+            text = _read_ascii(tiff, ifd0.get(_TAG_DATETIME), order)
+        if not text:
+            return None
+        timestamp = datetime.datetime.strptime(text, "%Y:%m:%d %H:%M:%S").timestamp()
+    except (struct.error, ValueError, OverflowError):
+        return None
+    if subsec and subsec.isdigit():
+        timestamp += float("0." + subsec)
+    return timestamp
+
+
+def capture_time(filepath: str) -> float:
+    """
+    撮影日時
+    :param filepath: 画像ファイルパス
+    :return: Exifの撮影日時のタイムスタンプ（秒未満はSubSecTimeOriginal）、無い場合はファイルの更新日時
+    """
+    try:
+        with open(filepath, "rb") as f:
+            timestamp = _exif_datetime(f.read(EXIF_READ_SIZE))
+        if timestamp is not None:
+            return timestamp
+        return os.stat(filepath).st_mtime
+    except OSError:
+        return float("inf")
+
+
+def order_frames(filepaths: typing.Iterable[str]) -> list[str]:
+    """
+    :param filepaths: 画像ファイルパス
+    :return: 撮影日時順（同じ日時はパス順）に並べたファイルパス
+    """
+    return sorted(filepaths, key=lambda x: (capture_time(x), x))
+
+
+class Background:
+    """
+    連続した画像の背景（直前の画像・直近`length`枚の中央値・最大値）
+    いずれも1枚ごとに最も古い画像を除いて新しい画像を加える差分更新で、窓内の画像を毎回並べ直さない
+    * median: 画素ごとに窓内の値を昇順に並べた`length`枚の画像を保持し、最も古い値の削除と新しい値の挿入を
+      `cv2.min()`・`cv2.max()`の組み合わせで行う（画像1枚あたり約5×`length`回の画素演算）
+    * max: 2つのスタックによる窓内の最大値（古い側は後ろからの累積最大値、新しい側は全体の最大値を保持する。
+      画像1枚あたり平均約3回の画素演算）
+    """
+
+    def __init__(self, method: str = "median", length: int = 5):
+        """
+        :param method: 推定方法（`SEQUENCE_METHODS`のいずれか）
+        :param length: 中央値・最大値をとる画像の枚数（`previous`の場合は1）
+        """
+        if method not in SEQUENCE_METHODS:
+            raise ValueError("unknown background method: {}".format(method))
+        if length < 1:
+            raise ValueError("length must be positive: {}".format(length))
+        self.method = method
+        self.length = 1 if method == "previous" else length
+        # 追加順の画像（最も古い値の削除用）
+        self.frames = collections.deque()
+        # median: 画素ごとに昇順に並べた画像
+        self.ranked = []
+        # max: 古い側の累積最大値（末尾が最も古い画像から最新までの最大値）と新しい側の最大値・枚数
+        self.older = []
+        self.newer = None
+        self.newer_count = 0
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def shape(self) -> typing.Optional[tuple[int, int]]:
+        return self.frames[0].shape if self.frames else None
+
+    def reset(self) -> None:
+        self.frames.clear()
+        self.ranked = []
+        self.older = []
+        self.newer = None
+        self.newer_count = 0
+
+    def update(self, img: numpy.array) -> None:
+        """
+        :param img: 追加する画像（グレースケール、保持するため以降は変更しないこと）
+        """
+        if self.frames and self.frames[0].shape != img.shape:
+            self.reset()
+        evict = len(self.frames) == self.length
+        if self.method == "median":
+            self._update_ranked(img, self.frames[0] if evict else None)
+        elif self.method == "max":
+            self._update_max(img, evict)
+        if evict:
+            self.frames.popleft()
+        self.frames.append(img)
+
+    def _update_ranked(self, img: numpy.array, oldest: typing.Optional[numpy.array]) -> None:
+        ranked = self.ranked
+        if oldest is not None:
+            # 最も古い値以上の位置では1つ後ろの値に詰める（同じ値が複数ある場合も1つのみ除く）
+            ranked = [cv2.max(ranked[i], cv2.min(ranked[i + 1], cv2.compare(ranked[i], oldest, cv2.CMP_GE))) for i in range(len(ranked) - 1)]
+        # 挿入位置の前後で1つずつずらしながら新しい値を挿入する
+        inserted = []
+        for i in range(len(ranked) + 1):
+            value = img if i == len(ranked) else cv2.min(ranked[i], img)
+            inserted.append(value if i == 0 else cv2.max(ranked[i - 1], value))
+        self.ranked = inserted
+
+    def _update_max(self, img: numpy.array, evict: bool) -> None:
+        if evict:
+            if not self.older:
+                # 新しい側を新しい順にたどった累積最大値を古い側に移す（最も古い画像のものが末尾）
+                running = None
+                for x in reversed(list(self.frames)[-self.newer_count:]):
+                    running = x if running is None else cv2.max(running, x)
+                    self.older.append(running)
+                self.newer = None
+                self.newer_count = 0
+            self.older.pop()
+        self.newer = img if self.newer is None else cv2.max(self.newer, img)
+        self.newer_count += 1
+
+    def model(self) -> typing.Optional[numpy.array]:
+        """
+        :return: 背景画像（`length`枚に満たない場合はそれまでの画像の中央値・最大値） or None（画像が無い場合）
+        """
+        if not self.frames:
+            return None
+        if self.method == "median":
+            return self.ranked[(len(self.ranked) - 1) // 2]
+        if self.method == "max":
+            if not self.older:
+                return self.newer
+            return cv2.max(self.older[-1], self.newer)
+        return self.frames[-1]
+
+
+def difference(img: numpy.array, background: numpy.array, input_threshold: float = 127, input_maxvalue: float = 255, contrast: float = 32, margin: int = 2) -> numpy.array:
+    """
+    背景との差分の2値画像
+    :param img: グレースケール画像
+    :param background: 背景画像（`Background.model()`）
+    :param input_threshold: 入力閾値
+    :param input_maxvalue: 閾値最大値
+    :param contrast: 背景より明るい画素とする差の閾値
+    :param margin: 背景を膨張させる画素数（画像間の星の移動を差分に残さないため）
+    :return: 入力閾値より明るく、かつ周囲`margin`画素の背景との差が`contrast`を超える画素の2値画像
+    """
+    if margin > 0:
+        background = cv2.dilate(background, numpy.ones((2 * margin + 1, 2 * margin + 1), numpy.uint8))
+    _, changed = cv2.threshold(cv2.subtract(img, background), contrast, 255, cv2.THRESH_BINARY)
+    return cv2.bitwise_and(detector.binarize(img, input_threshold, input_maxvalue), changed)
+
+
+def _decode(filepath: str, mask: typing.Optional[str], profile) -> tuple[numpy.array, typing.Optional[detector.SkyMask]]:
+    with _stage(profile, "decode"):
+        img = detector.load_image(filepath)
+    if profile is not None:
+        profile.allocate("decode", img)
+    sky = None
+    if mask is not None:
+        with _stage(profile, "threshold"):
+            sky = detector.load_mask(mask, img.shape)
+            img = sky.apply(img)
+    return img, sky
+
+
+def map_sequence(filepaths: typing.Iterable[str], params: dict, method: str = "median", length: int = 5, contrast: float = 32, margin: int = 2,
+                 jobs: int = 1, profiler=None, return_exceptions: bool = False) -> typing.Iterator[tuple[str, typing.Union[tuple, Exception]]]:
+    """
+    連続した画像の背景差分による流星検出
+    入力順（`order_frames()`で撮影日時順にしたもの）に背景を更新しながら、各画像と直前までの背景との差分
+    （`difference()`）から`detect_meteor_image()`で検出する。星・雲・地上は差分に残らないため、
+    塗りつぶしと直線検出の対象は新たに明るくなった部分のみとなる。最初の画像は背景が無いため差分をとらずに処理する。
+    デコードと検出はスレッドで並行して行い、背景の更新のみ入力順に行う
+    :param filepaths: 入力ファイルパス（撮影順）
+    :param params: `detect_meteor()`のパラメーター（`prescreen`・`min_change`は使わない）
+    :param method: 背景の推定方法（`Background`参照）
+    :param length: 背景の推定に使う画像の枚数
+    :param contrast: 背景より明るい画素とする差の閾値
+    :param margin: 背景を膨張させる画素数
+    :param jobs: スレッド数
+    :param profiler: 画像ごとの計測結果の集計先（None の場合は計測しない）
+    :param return_exceptions: 処理できなかった画像の例外を結果として返すか（`False`の場合は送出する）
+    :return: 入力順の`(ファイルパス, (検出した直線 or None, 塗りつぶした領域, 画像サイズ))`のイテレーター
+    """
+    background = Background(method, length)
+    mask = params.get("mask")
+    kwargs = dict(buffer_ratio=params.get("buffer_ratio", 1.1), line_threshold=params.get("line_threshold", 100),
+                  area_method=params.get("area_method", "contour"), min_pixels=params.get("min_pixels", 0), min_residual=params.get("min_residual", 0))
+    area_threshold = params.get("area_threshold", 0.0001)
+    input_threshold = params.get("input_threshold", 127)
+    input_maxvalue = params.get("input_maxvalue", 255)
+    depth = 2 * max(jobs, 1)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1))
+    try:
+        iterator = iter(filepaths)
+        decoding = collections.deque()
+        detecting = collections.deque()
+
+        def fill():
+            while len(decoding) < depth:
+                filepath = next(iterator, None)
+                if filepath is None:
+                    return
+                profile = FrameProfile() if profiler is not None else None
+                decoding.append((filepath, profile, executor.submit(_decode, filepath, mask, profile)))
+
+        def result(filepath: str, profile, future):
+            try:
+                value = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return filepath, e
+            if profile is not None:
+                profiler.add(filepath, profile)
+            return filepath, value
+
+        fill()
+        while decoding or detecting:
+            if decoding and len(detecting) < depth:
+                filepath, profile, future = decoding.popleft()
+                fill()
+                try:
+                    img, sky = future.result()
+                except Exception:
+                    detecting.append((filepath, profile, future))
+                    continue
+                model = background.model() if background.shape == img.shape else None
+                with _stage(profile, "difference"):
+                    if model is None:
+                        binary = detector.binarize(img, input_threshold, input_maxvalue)
+                    else:
+                        binary = difference(img, model, input_threshold, input_maxvalue, contrast, margin)
+                with _stage(profile, "background"):
+                    background.update(img)
+                detecting.append((filepath, profile, executor.submit(detector._detect_masked, binary, sky, area_threshold=area_threshold, profile=profile, **kwargs)))
+                continue
+            yield result(*detecting.popleft())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,191 @@
+import collections
+import os
+import sqlite3
+import threading
+import typing
+
+from PySide2.QtCore import QBuffer
+from PySide2.QtCore import QByteArray
+from PySide2.QtCore import QIODevice
+from PySide2.QtCore import QObject
+from PySide2.QtCore import Qt
+from PySide2.QtCore import Signal
+from PySide2.QtCore import Slot
+from PySide2.QtGui import QImage
+from PySide2.QtGui import QImageReader
+from PySide2.QtGui import QPixmap
+
+from .cache import ResultCache
+from .cache import file_identity
+
+
+# longest side of the generated thumbnails [px]
+THUMBNAIL_SIZE = 256
+# quality of the thumbnails stored in the disk cache
+THUMBNAIL_QUALITY = 85
+# stage name of the thumbnails in ResultCache
+STAGE = "thumbnail"
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024  # 64MiB
+# requests kept waiting; older ones are dropped and requested again when shown
+MAX_PENDING = 256
+
+
+def make_thumbnail(filepath: str, size: int = THUMBNAIL_SIZE) -> typing.Optional[QImage]:
+    """
+    Decode a reduced image; JPEG is scaled while decoding (libjpeg DCT scaling).
+    :param filepath: image file path
+    :param size: longest side of the thumbnail
+    :return: thumbnail, or None if the file cannot be read
+    """
+    reader = QImageReader(filepath)
+    original = reader.size()
+    if original.isValid() and max(original.width(), original.height()) > size:
+        reader.setScaledSize(original.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        return None
+    return image
+
+
+def encode_thumbnail(image: QImage) -> bytes:
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "JPEG", THUMBNAIL_QUALITY)
+    buffer.close()
+    return data.data()
+
+
+class ThumbnailLoader(QObject):
+    """
+    Thumbnails generated on background threads and kept in the disk cache.
+
+    ``thumbnail()`` returns a thumbnail already in memory, or schedules it and
+    emits ``thumbnailReady`` once it is available. The latest requests are
+    served first, so the rows the user scrolled to are shown before the
+    ones scrolled past. Thumbnails are stored in ``ResultCache`` keyed by the
+    file identity (path, size, mtime), so unchanged files are decoded once.
+    The cache is read and written only on the loader threads, each with its
+    own connection, so painting the view never waits for the disk.
+    """
+
+    thumbnailReady = Signal(str)
+    # filepath, image (null if the file cannot be read)
+    _loaded = Signal(str, QImage)
+
+    def __init__(self, cache: typing.Optional[ResultCache] = None, size: int = THUMBNAIL_SIZE,
+                 memory_limit: int = DEFAULT_MEMORY_LIMIT, workers: typing.Optional[int] = None,
+                 parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.cache = cache
+        self.size = size
+        self.params = dict(size=size, quality=THUMBNAIL_QUALITY)
+        self.memory_limit = memory_limit
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+        self.pending = set()
+        # files which could not be read; not requested again
+        self.failed = set()
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self._loaded.connect(self.loaded, Qt.QueuedConnection)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.threads = [threading.Thread(target=self._run, name="thumbnail", daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def clear(self):
+        self.memory.clear()
+        self.memory_size = 0
+        self.failed.clear()
+
+    def thumbnail(self, filepath: str) -> typing.Optional[QPixmap]:
+        """
+        :param filepath: image file path
+        :return: thumbnail, or None if not loaded yet
+        """
+        item = self.memory.get(filepath)
+        if item is not None:
+            self.memory.move_to_end(filepath)
+            return item[0]
+        if filepath in self.pending or filepath in self.failed:
+            return None
+        self.pending.add(filepath)
+        with self.condition:
+            self.queue.append(filepath)
+            while len(self.queue) > MAX_PENDING:
+                self.pending.discard(self.queue.popleft())
+            self.condition.notify()
+        return None
+
+    def _run(self):
+        # sqlite3 connections cannot be shared between threads
+        cache = None
+        if self.cache is not None:
+            try:
+                cache = ResultCache(self.cache.filepath, self.cache.max_size)
+            except (OSError, sqlite3.Error):
+                cache = None
+        try:
+            while True:
+                with self.condition:
+                    while not self.queue and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    filepath = self.queue.pop()
+                image = self._load(filepath, cache)
+                self._loaded.emit(filepath, image if image is not None else QImage())
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def _load(self, filepath: str, cache: typing.Optional[ResultCache]) -> typing.Optional[QImage]:
+        identity = file_identity(filepath)
+        if identity is None:
+            return None
+        if cache is not None:
+            try:
+                data = cache.get(identity, STAGE, self.params)
+            except sqlite3.Error:
+                data = None
+            if data is not None:
+                image = QImage.fromData(data)
+                if not image.isNull():
+                    return image
+        image = make_thumbnail(filepath, self.size)
+        if image is not None and cache is not None:
+            try:
+                cache.put(identity, STAGE, self.params, encode_thumbnail(image))
+            except sqlite3.Error:
+                pass
+        return image
+
+    @Slot(str, QImage)
+    def loaded(self, filepath: str, image: QImage):
+        self.pending.discard(filepath)
+        if image.isNull():
+            self.failed.add(filepath)
+            return
+        # QPixmap must be created in the GUI thread
+        pixmap = QPixmap.fromImage(image)
+        nbytes = image.sizeInBytes()
+        if filepath in self.memory:
+            self.memory_size -= self.memory.pop(filepath)[1]
+        self.memory[filepath] = (pixmap, nbytes)
+        self.memory_size += nbytes
+        while self.memory_size > self.memory_limit and len(self.memory) > 1:
+            _, (_, size) = self.memory.popitem(last=False)
+            self.memory_size -= size
+        self.thumbnailReady.emit(filepath)
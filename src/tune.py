@@ -0,0 +1,253 @@
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import typing
+
+from .config import Config
+from .pipeline import map_sweep
+
+
+# 探索するパラメーターと候補値（設定ダイアログで表示できる精度の値）
+SEARCH_SPACE = {
+    "input_threshold": (64, 80, 96, 112, 127, 144, 160, 176, 192, 208, 224),
+    "area_threshold": (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01),
+    "buffer_ratio": (1.0, 1.1, 1.2, 1.3, 1.5, 1.7, 2.0),
+    "line_threshold": (25, 50, 75, 100, 150, 200, 300, 400),
+}
+
+# `Config`の属性のうち`detect_meteor()`のパラメーター
+PARAMS = ("input_threshold", "input_maxvalue", "area_threshold", "buffer_ratio", "line_threshold", "area_method", "prescreen", "mask",
+          "min_pixels", "min_residual", "min_change")
+
+POSITIVE_LABELS = ("1", "true", "yes", "meteor")
+NEGATIVE_LABELS = ("0", "false", "no", "none", "other")
+
+
+class Score:
+    """
+    1つのパラメーターの判定結果の集計
+    """
+
+    __slots__ = ("tp", "fp", "fn", "tn")
+
+    def __init__(self):
+        self.tp = 0
+        self.fp = 0
+        self.fn = 0
+        self.tn = 0
+
+    def add(self, detected: bool, label: bool) -> None:
+        if detected and label:
+            self.tp += 1
+        elif detected:
+            self.fp += 1
+        elif label:
+            self.fn += 1
+        else:
+            self.tn += 1
+
+    @property
+    def precision(self) -> float:
+        return self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+
+    @property
+    def recall(self) -> float:
+        return self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+
+    def fscore(self, beta: float = 1.0) -> float:
+        """
+        :param beta: 再現率の重み（1より大きい場合は見逃しを、小さい場合は誤検出を重く扱う）
+        :return: F値
+        """
+        b2 = beta * beta
+        denominator = (1 + b2) * self.tp + b2 * self.fn + self.fp
+        return (1 + b2) * self.tp / denominator if denominator else 0.0
+
+
+def load_labels(filepath: str) -> list[tuple[str, bool]]:
+    """
+    ラベル付きの画像一覧の読み込み
+    `パス,ラベル`のCSVファイル（ラベルは`1`/`0`、`true`/`false`、`yes`/`no`、`meteor`/`other`等）。
+    相対パスはCSVファイルのディレクトリからのパスとし、ラベルとして読めない行（見出し等）は無視する
+    :param filepath: CSVファイルパス
+    :return: (画像ファイルパス, 流星が写っているか)のリスト
+    """
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    labels = []
+    with open(filepath, newline="", encoding="utf-8") as fp:
+        for row in csv.reader(fp):
+            if len(row) < 2:
+                continue
+            label = row[1].strip().lower()
+            if label in POSITIVE_LABELS:
+                value = True
+            elif label in NEGATIVE_LABELS:
+                value = False
+            else:
+                continue
+            labels.append((os.path.join(dirname, row[0].strip()), value))
+    return labels
+
+
+def sample_candidates(base: dict, count: int, rng: random.Random, space: dict = SEARCH_SPACE) -> list[dict]:
+    """
+    探索するパラメーターの選択
+    :param base: 基準のパラメーター（必ず候補に含める）
+    :param count: 候補数（探索範囲の組み合わせの数を上限とする）
+    :param rng: 乱数生成器
+    :param space: 探索するパラメーターと候補値
+    :return: パラメーターのリスト
+    """
+    names = list(space)
+    combinations = math.prod(len(x) for x in space.values())
+    count = min(count, combinations + 1)
+    candidates = [dict(base)]
+    seen = {tuple(base[x] for x in names)}
+    # 組み合わせの通し番号から重複なく選ぶ
+    for index in rng.sample(range(combinations), combinations):
+        if len(candidates) >= count:
+            break
+        values = []
+        for name in reversed(names):
+            index, i = divmod(index, len(space[name]))
+            values.append(space[name][i])
+        values = tuple(reversed(values))
+        if values in seen:
+            continue
+        seen.add(values)
+        candidates.append(dict(base, **dict(zip(names, values))))
+    return candidates
+
+
+def stratify(labels: list[tuple[str, bool]], rng: random.Random) -> list[tuple[str, bool]]:
+    """
+    :param labels: ラベル付きの画像一覧
+    :param rng: 乱数生成器
+    :return: どの先頭部分でも流星の有無の比率が全体と同程度になるように並べ替えた一覧
+    """
+    groups = [[x for x in labels if x[1]], [x for x in labels if not x[1]]]
+    keyed = []
+    for group in groups:
+        rng.shuffle(group)
+        keyed.extend(((i + 0.5) / len(group), x) for i, x in enumerate(group))
+    keyed.sort(key=lambda x: x[0])
+    return [x for _, x in keyed]
+
+
+def tune(labels: list[tuple[str, bool]], base: dict, candidates: int = 64, eta: int = 3, min_frames: int = 16, beta: float = 1.0, seed: int = 0,
+         cache=None, progress: typing.Optional[typing.Callable[[int, int, int], None]] = None,
+         onerror: typing.Optional[typing.Callable[[str, Exception], None]] = None, **kwargs) -> list[tuple[dict, Score]]:
+    """
+    ラベル付きの画像に対するパラメーターの探索（Successive Halving）
+    少数の画像で全候補を評価し、F値の上位`1/eta`のみを画像数を`eta`倍に増やして評価することを繰り返す。
+    各段で追加した画像のみを`map_sweep()`で残りの全候補について処理するため、
+    各画像の読み込みは1回で済み、候補間で共通する段階の結果は共有される
+    :param labels: ラベル付きの画像一覧
+    :param base: 基準のパラメーター（探索しないパラメーターの値）
+    :param candidates: 最初に評価する候補数
+    :param eta: 各段で残す候補の割合の逆数
+    :param min_frames: 最初の段で評価する最小の画像数
+    :param beta: F値の再現率の重み
+    :param seed: 候補の選択と画像の並びの乱数の種
+    :param cache: 永続キャッシュ（`map_sweep()`参照）
+    :param progress: 各段の開始時に`(段, 候補数, 画像数)`で呼び出す関数
+    :param onerror: 処理できなかった画像の`(ファイルパス, 例外)`を受け取る関数（その画像は集計から除く）
+    :param kwargs: `map_files()`のパラメーター
+    :return: 全画像を評価した候補の(パラメーター, 集計)のF値の降順のリスト
+    """
+    rng = random.Random(seed)
+    configs = sample_candidates(base, candidates, rng)
+    frames = stratify(labels, rng)
+    rungs = 1
+    if eta > 1:
+        # 各段で画像が増えるよう、最初の段の画像数が`min_frames`を下回らない範囲で段数を決める
+        rungs += max(min(int(math.log(len(configs), eta)), int(math.log(max(len(frames) / max(min_frames, 1), 1), eta))), 0)
+    budgets = [math.ceil(len(frames) / eta ** (rungs - 1 - i)) for i in range(rungs)]
+    survivors = list(range(len(configs)))
+    scores = [Score() for _ in configs]
+    evaluated = 0
+    for rung, budget in enumerate(budgets):
+        if progress is not None:
+            progress(rung, len(survivors), budget)
+        added = dict(frames[evaluated:budget])
+        if added:
+            for filepath, result in map_sweep(list(added), [configs[i] for i in survivors], cache, return_exceptions=True, **kwargs):
+                if isinstance(result, Exception):
+                    if onerror is not None:
+                        onerror(filepath, result)
+                    continue
+                for i, lines in zip(survivors, result):
+                    scores[i].add(lines is not None, added[filepath])
+        evaluated = max(evaluated, budget)
+        survivors.sort(key=lambda i: (scores[i].fscore(beta), scores[i].precision), reverse=True)
+        if rung < len(budgets) - 1:
+            survivors = survivors[:max(math.ceil(len(survivors) / eta), 1)]
+    return [(configs[i], scores[i]) for i in survivors]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="search detection parameters with the best precision/recall on labeled frames")
+    parser.add_argument("labels", help="CSV file of 'path,label' (label: 1/0, true/false, meteor/other)")
+    parser.add_argument("-o", "--output", default=None, help="write the best parameters to a config file (JSON)")
+    parser.add_argument("--config", default=None, help="config file of the parameters which are not searched (default: defaults)")
+    parser.add_argument("--candidates", type=int, default=64, help="number of parameter combinations evaluated first")
+    parser.add_argument("--eta", type=int, default=3, help="keep the best 1/ETA combinations on each round, with ETA times as many frames")
+    parser.add_argument("--min-frames", type=int, default=16, help="minimum number of frames of the first round")
+    parser.add_argument("--beta", type=float, default=1.0, help="weight of recall in the F-score (>1: fewer misses, <1: fewer false detections)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10, help="number of combinations reported")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (0: number of CPUs)")
+    parser.add_argument("--cache", default=None, help="result cache file (default: platform cache directory)")
+    parser.add_argument("--cache-size", type=float, default=1024, help="maximum result cache size [MiB]")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+
+    args = parser.parse_args(argv[1:])
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    labels = load_labels(args.labels)
+    if not labels:
+        parser.error("no labeled frames in {}".format(args.labels))
+    config = Config()
+    if args.config is not None:
+        config.load(args.config)
+    base = {x: getattr(config, x) for x in PARAMS}
+    positives = sum(x for _, x in labels)
+    print("frames: {} (meteor: {}, other: {})".format(len(labels), positives, len(labels) - positives), file=sys.stderr)
+
+    cache = None
+    if not args.no_cache:
+        from .cache import ResultCache
+        cache = ResultCache(args.cache, max_size=int(args.cache_size * 1024 * 1024))
+
+    def progress(rung: int, candidates: int, frames: int):
+        print("round {}: {} candidates on {} frames".format(rung + 1, candidates, frames), file=sys.stderr)
+
+    def onerror(filepath: str, e: Exception):
+        print("skipped {}: {}: {}".format(filepath, type(e).__name__, e), file=sys.stderr)
+
+    try:
+        ranking = tune(labels, base, args.candidates, args.eta, args.min_frames, args.beta, args.seed, cache, progress, onerror, jobs=jobs)
+    finally:
+        if cache is not None:
+            cache.trim()
+            cache.close()
+
+    names = list(SEARCH_SPACE)
+    print("  ".join(["{:>4}".format("#")] + ["{:>15}".format(x) for x in names] + ["{:>9}".format(x) for x in ("precision", "recall", "F")]))
+    for rank, (params, score) in enumerate(ranking[:args.top], 1):
+        line = ["{:>4}".format(rank)] + ["{:>15}".format(params[x]) for x in names]
+        line += ["{:>9.3f}".format(x) for x in (score.precision, score.recall, score.fscore(args.beta))]
+        print("  ".join(line))
+    best, score = ranking[0]
+    if args.output is not None:
+        for name in PARAMS:
+            setattr(config, name, best[name])
+        config.save(args.output)
+        print("saved: {}".format(args.output), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -48,6 +48,28 @@ class Ui_ConfigDialog(object):
 
         self.formLayout.setWidget(1, QFormLayout.FieldRole, self.spinBox_threshold_maxvalue)
 
+        self.label_threshold_mask = QLabel(self.groupBox_threshold)
+        self.label_threshold_mask.setObjectName(u"label_threshold_mask")
+        self.label_threshold_mask.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout.setWidget(2, QFormLayout.LabelRole, self.label_threshold_mask)
+
+        self.horizontalLayout_threshold_mask = QHBoxLayout()
+        self.horizontalLayout_threshold_mask.setObjectName(u"horizontalLayout_threshold_mask")
+        self.lineEdit_threshold_mask = QLineEdit(self.groupBox_threshold)
+        self.lineEdit_threshold_mask.setObjectName(u"lineEdit_threshold_mask")
+        self.lineEdit_threshold_mask.setClearButtonEnabled(True)
+
+        self.horizontalLayout_threshold_mask.addWidget(self.lineEdit_threshold_mask)
+
+        self.toolButton_threshold_mask = QToolButton(self.groupBox_threshold)
+        self.toolButton_threshold_mask.setObjectName(u"toolButton_threshold_mask")
+
+        self.horizontalLayout_threshold_mask.addWidget(self.toolButton_threshold_mask)
+
+
+        self.formLayout.setLayout(2, QFormLayout.FieldRole, self.horizontalLayout_threshold_mask)
+
 
         self.gridLayout.addWidget(self.groupBox_threshold, 0, 0, 1, 1)
 
@@ -56,7 +78,7 @@ class Ui_ConfigDialog(object):
         self.buttonBox.setOrientation(Qt.Vertical)
         self.buttonBox.setStandardButtons(QDialogButtonBox.Cancel|QDialogButtonBox.Ok|QDialogButtonBox.Reset)
 
-        self.gridLayout.addWidget(self.buttonBox, 0, 1, 3, 1)
+        self.gridLayout.addWidget(self.buttonBox, 0, 1, 4, 1)
 
         self.groupBox_fillarea = QGroupBox(ConfigDialog)
         self.groupBox_fillarea.setObjectName(u"groupBox_fillarea")
@@ -90,6 +112,19 @@ class Ui_ConfigDialog(object):
 
         self.formLayout_2.setWidget(1, QFormLayout.FieldRole, self.doubleSpinBox_fillarea_fillbuffer)
 
+        self.label_fillarea_method = QLabel(self.groupBox_fillarea)
+        self.label_fillarea_method.setObjectName(u"label_fillarea_method")
+        self.label_fillarea_method.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_2.setWidget(2, QFormLayout.LabelRole, self.label_fillarea_method)
+
+        self.comboBox_fillarea_method = QComboBox(self.groupBox_fillarea)
+        self.comboBox_fillarea_method.addItem("")
+        self.comboBox_fillarea_method.addItem("")
+        self.comboBox_fillarea_method.setObjectName(u"comboBox_fillarea_method")
+
+        self.formLayout_2.setWidget(2, QFormLayout.FieldRole, self.comboBox_fillarea_method)
+
 
         self.gridLayout.addWidget(self.groupBox_fillarea, 1, 0, 1, 1)
 
@@ -110,9 +145,108 @@ class Ui_ConfigDialog(object):
 
         self.formLayout_3.setWidget(0, QFormLayout.FieldRole, self.doubleSpinBox_meteordetection_linethreshold)
 
+        self.label_meteordetection_minpixels = QLabel(self.groupBox)
+        self.label_meteordetection_minpixels.setObjectName(u"label_meteordetection_minpixels")
+        self.label_meteordetection_minpixels.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_3.setWidget(1, QFormLayout.LabelRole, self.label_meteordetection_minpixels)
+
+        self.spinBox_meteordetection_minpixels = QSpinBox(self.groupBox)
+        self.spinBox_meteordetection_minpixels.setObjectName(u"spinBox_meteordetection_minpixels")
+        self.spinBox_meteordetection_minpixels.setMaximum(100000)
+        self.spinBox_meteordetection_minpixels.setSingleStep(50)
+
+        self.formLayout_3.setWidget(1, QFormLayout.FieldRole, self.spinBox_meteordetection_minpixels)
+
+        self.label_meteordetection_minresidual = QLabel(self.groupBox)
+        self.label_meteordetection_minresidual.setObjectName(u"label_meteordetection_minresidual")
+        self.label_meteordetection_minresidual.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_3.setWidget(2, QFormLayout.LabelRole, self.label_meteordetection_minresidual)
+
+        self.spinBox_meteordetection_minresidual = QSpinBox(self.groupBox)
+        self.spinBox_meteordetection_minresidual.setObjectName(u"spinBox_meteordetection_minresidual")
+        self.spinBox_meteordetection_minresidual.setMaximum(100000)
+        self.spinBox_meteordetection_minresidual.setSingleStep(50)
+
+        self.formLayout_3.setWidget(2, QFormLayout.FieldRole, self.spinBox_meteordetection_minresidual)
+
+        self.label_meteordetection_minchange = QLabel(self.groupBox)
+        self.label_meteordetection_minchange.setObjectName(u"label_meteordetection_minchange")
+        self.label_meteordetection_minchange.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_3.setWidget(3, QFormLayout.LabelRole, self.label_meteordetection_minchange)
+
+        self.spinBox_meteordetection_minchange = QSpinBox(self.groupBox)
+        self.spinBox_meteordetection_minchange.setObjectName(u"spinBox_meteordetection_minchange")
+        self.spinBox_meteordetection_minchange.setMaximum(10000)
+        self.spinBox_meteordetection_minchange.setSingleStep(1)
+
+        self.formLayout_3.setWidget(3, QFormLayout.FieldRole, self.spinBox_meteordetection_minchange)
+
 
         self.gridLayout.addWidget(self.groupBox, 2, 0, 1, 1)
 
+        self.groupBox_process = QGroupBox(ConfigDialog)
+        self.groupBox_process.setObjectName(u"groupBox_process")
+        self.formLayout_4 = QFormLayout(self.groupBox_process)
+        self.formLayout_4.setObjectName(u"formLayout_4")
+        self.label_process_jobs = QLabel(self.groupBox_process)
+        self.label_process_jobs.setObjectName(u"label_process_jobs")
+        self.label_process_jobs.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_4.setWidget(0, QFormLayout.LabelRole, self.label_process_jobs)
+
+        self.spinBox_process_jobs = QSpinBox(self.groupBox_process)
+        self.spinBox_process_jobs.setObjectName(u"spinBox_process_jobs")
+        self.spinBox_process_jobs.setMaximum(256)
+
+        self.formLayout_4.setWidget(0, QFormLayout.FieldRole, self.spinBox_process_jobs)
+
+        self.label_process_prescreen = QLabel(self.groupBox_process)
+        self.label_process_prescreen.setObjectName(u"label_process_prescreen")
+        self.label_process_prescreen.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_4.setWidget(1, QFormLayout.LabelRole, self.label_process_prescreen)
+
+        self.comboBox_process_prescreen = QComboBox(self.groupBox_process)
+        self.comboBox_process_prescreen.addItem("")
+        self.comboBox_process_prescreen.addItem("")
+        self.comboBox_process_prescreen.addItem("")
+        self.comboBox_process_prescreen.addItem("")
+        self.comboBox_process_prescreen.setObjectName(u"comboBox_process_prescreen")
+
+        self.formLayout_4.setWidget(1, QFormLayout.FieldRole, self.comboBox_process_prescreen)
+
+        self.label_process_readahead = QLabel(self.groupBox_process)
+        self.label_process_readahead.setObjectName(u"label_process_readahead")
+        self.label_process_readahead.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_4.setWidget(2, QFormLayout.LabelRole, self.label_process_readahead)
+
+        self.spinBox_process_readahead = QSpinBox(self.groupBox_process)
+        self.spinBox_process_readahead.setObjectName(u"spinBox_process_readahead")
+        self.spinBox_process_readahead.setMaximum(64)
+
+        self.formLayout_4.setWidget(2, QFormLayout.FieldRole, self.spinBox_process_readahead)
+
+        self.label_process_readaheadmemory = QLabel(self.groupBox_process)
+        self.label_process_readaheadmemory.setObjectName(u"label_process_readaheadmemory")
+        self.label_process_readaheadmemory.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.formLayout_4.setWidget(3, QFormLayout.LabelRole, self.label_process_readaheadmemory)
+
+        self.spinBox_process_readaheadmemory = QSpinBox(self.groupBox_process)
+        self.spinBox_process_readaheadmemory.setObjectName(u"spinBox_process_readaheadmemory")
+        self.spinBox_process_readaheadmemory.setMinimum(16)
+        self.spinBox_process_readaheadmemory.setMaximum(4096)
+        self.spinBox_process_readaheadmemory.setSingleStep(64)
+
+        self.formLayout_4.setWidget(3, QFormLayout.FieldRole, self.spinBox_process_readaheadmemory)
+
+
+        self.gridLayout.addWidget(self.groupBox_process, 3, 0, 1, 1)
+
 
         self.retranslateUi(ConfigDialog)
         self.buttonBox.accepted.connect(ConfigDialog.accept)
@@ -126,13 +260,43 @@ class Ui_ConfigDialog(object):
         self.groupBox_threshold.setTitle(QCoreApplication.translate("ConfigDialog", u"cv2.threshold", None))
         self.label_threshold_threshold.setText(QCoreApplication.translate("ConfigDialog", u"Threshold:", None))
         self.label_threshold_maxvalue.setText(QCoreApplication.translate("ConfigDialog", u"MaxValue:", None))
+        self.label_threshold_mask.setText(QCoreApplication.translate("ConfigDialog", u"Mask:", None))
+        self.lineEdit_threshold_mask.setPlaceholderText(QCoreApplication.translate("ConfigDialog", u"(whole frame)", None))
+        self.toolButton_threshold_mask.setText(QCoreApplication.translate("ConfigDialog", u"...", None))
         self.groupBox_fillarea.setTitle(QCoreApplication.translate("ConfigDialog", u"FillArea", None))
         self.label_fillarea_areathreshold.setText(QCoreApplication.translate("ConfigDialog", u"AreaThreshold:", None))
         self.doubleSpinBox_fillarea_areathreshold.setSuffix(QCoreApplication.translate("ConfigDialog", u"%", None))
         self.label_fillarea_fillbuffer.setText(QCoreApplication.translate("ConfigDialog", u"FillBuffer:", None))
         self.doubleSpinBox_fillarea_fillbuffer.setSuffix(QCoreApplication.translate("ConfigDialog", u"x", None))
+        self.label_fillarea_method.setText(QCoreApplication.translate("ConfigDialog", u"Method:", None))
+        self.comboBox_fillarea_method.setItemText(0, QCoreApplication.translate("ConfigDialog", u"Contour", None))
+        self.comboBox_fillarea_method.setItemText(1, QCoreApplication.translate("ConfigDialog", u"Components", None))
+
         self.groupBox.setTitle(QCoreApplication.translate("ConfigDialog", u"MeteorDetection", None))
         self.label_meteordetection_linethreshold.setText(QCoreApplication.translate("ConfigDialog", u"LineThreshold:", None))
         self.doubleSpinBox_meteordetection_linethreshold.setSuffix(QCoreApplication.translate("ConfigDialog", u"px", None))
+        self.label_meteordetection_minpixels.setText(QCoreApplication.translate("ConfigDialog", u"MinPixels:", None))
+        self.spinBox_meteordetection_minpixels.setSpecialValueText(QCoreApplication.translate("ConfigDialog", u"Off", None))
+        self.spinBox_meteordetection_minpixels.setSuffix(QCoreApplication.translate("ConfigDialog", u" px", None))
+        self.label_meteordetection_minresidual.setText(QCoreApplication.translate("ConfigDialog", u"MinResidual:", None))
+        self.spinBox_meteordetection_minresidual.setSpecialValueText(QCoreApplication.translate("ConfigDialog", u"Off", None))
+        self.spinBox_meteordetection_minresidual.setSuffix(QCoreApplication.translate("ConfigDialog", u" px", None))
+        self.label_meteordetection_minchange.setText(QCoreApplication.translate("ConfigDialog", u"MinChange:", None))
+        self.spinBox_meteordetection_minchange.setSpecialValueText(QCoreApplication.translate("ConfigDialog", u"Off", None))
+        self.spinBox_meteordetection_minchange.setSuffix(QCoreApplication.translate("ConfigDialog", u" blocks", None))
+        self.groupBox_process.setTitle(QCoreApplication.translate("ConfigDialog", u"Process", None))
+        self.label_process_jobs.setText(QCoreApplication.translate("ConfigDialog", u"Jobs:", None))
+        self.spinBox_process_jobs.setSpecialValueText(QCoreApplication.translate("ConfigDialog", u"Auto", None))
+        self.label_process_prescreen.setText(QCoreApplication.translate("ConfigDialog", u"PreScreen:", None))
+        self.comboBox_process_prescreen.setItemText(0, QCoreApplication.translate("ConfigDialog", u"Off", None))
+        self.comboBox_process_prescreen.setItemText(1, QCoreApplication.translate("ConfigDialog", u"1/2", None))
+        self.comboBox_process_prescreen.setItemText(2, QCoreApplication.translate("ConfigDialog", u"1/4", None))
+        self.comboBox_process_prescreen.setItemText(3, QCoreApplication.translate("ConfigDialog", u"1/8", None))
+
+        self.label_process_readahead.setText(QCoreApplication.translate("ConfigDialog", u"ReadAhead:", None))
+        self.spinBox_process_readahead.setSpecialValueText(QCoreApplication.translate("ConfigDialog", u"Off", None))
+        self.label_process_readaheadmemory.setText(QCoreApplication.translate("ConfigDialog", u"ReadAheadMemory:", None))
+        self.spinBox_process_readaheadmemory.setSuffix(QCoreApplication.translate("ConfigDialog", u" MiB", None))
+
     # retranslateUi
 
@@ -24,10 +24,26 @@ class Ui_MainWindow(object):
         self.actionReset.setObjectName(u"actionReset")
         self.actionAdd = QAction(MainWindow)
         self.actionAdd.setObjectName(u"actionAdd")
+        self.actionAddFolder = QAction(MainWindow)
+        self.actionAddFolder.setObjectName(u"actionAddFolder")
         self.actionClear = QAction(MainWindow)
         self.actionClear.setObjectName(u"actionClear")
+        self.actionThumbnails = QAction(MainWindow)
+        self.actionThumbnails.setObjectName(u"actionThumbnails")
+        self.actionThumbnails.setCheckable(True)
         self.actionRun = QAction(MainWindow)
         self.actionRun.setObjectName(u"actionRun")
+        self.actionWatch = QAction(MainWindow)
+        self.actionWatch.setObjectName(u"actionWatch")
+        self.actionPause = QAction(MainWindow)
+        self.actionPause.setObjectName(u"actionPause")
+        self.actionPause.setEnabled(False)
+        self.actionResume = QAction(MainWindow)
+        self.actionResume.setObjectName(u"actionResume")
+        self.actionResume.setEnabled(False)
+        self.actionCancel = QAction(MainWindow)
+        self.actionCancel.setObjectName(u"actionCancel")
+        self.actionCancel.setEnabled(False)
         self.actionExport = QAction(MainWindow)
         self.actionExport.setObjectName(u"actionExport")
         self.actionAboutQt = QAction(MainWindow)
@@ -38,6 +54,9 @@ class Ui_MainWindow(object):
         self.actionHideDetected.setObjectName(u"actionHideDetected")
         self.actionHideDetected.setCheckable(True)
         self.actionHideDetected.setChecked(False)
+        self.actionProfile = QAction(MainWindow)
+        self.actionProfile.setObjectName(u"actionProfile")
+        self.actionProfile.setCheckable(True)
         self.centralwidget = QWidget(MainWindow)
         self.centralwidget.setObjectName(u"centralwidget")
         self.gridLayout = QGridLayout(self.centralwidget)
@@ -51,7 +70,21 @@ class Ui_MainWindow(object):
         self.treeView.setDragEnabled(False)
         self.treeView.setDragDropMode(QAbstractItemView.DropOnly)
         self.treeView.setDefaultDropAction(Qt.IgnoreAction)
+        self.treeView.setUniformRowHeights(True)
         self.splitter.addWidget(self.treeView)
+        self.listView = QListView(self.splitter)
+        self.listView.setObjectName(u"listView")
+        self.listView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.listView.setDragDropMode(QAbstractItemView.DropOnly)
+        self.listView.setDefaultDropAction(Qt.IgnoreAction)
+        self.listView.setIconSize(QSize(160, 120))
+        self.listView.setMovement(QListView.Static)
+        self.listView.setResizeMode(QListView.Adjust)
+        self.listView.setLayoutMode(QListView.Batched)
+        self.listView.setGridSize(QSize(176, 150))
+        self.listView.setViewMode(QListView.IconMode)
+        self.listView.setUniformItemSizes(True)
+        self.splitter.addWidget(self.listView)
         self.widget = QWidget(self.splitter)
         self.widget.setObjectName(u"widget")
         self.verticalLayout = QVBoxLayout(self.widget)
@@ -114,11 +147,18 @@ class Ui_MainWindow(object):
         self.menubar.addAction(self.menuHelp.menuAction())
         self.menuFile.addAction(self.actionExit)
         self.menuImage.addAction(self.actionAdd)
+        self.menuImage.addAction(self.actionAddFolder)
         self.menuImage.addAction(self.actionClear)
+        self.menuImage.addAction(self.actionThumbnails)
         self.menuProc.addAction(self.actionConfig)
         self.menuProc.addAction(self.actionRun)
+        self.menuProc.addAction(self.actionWatch)
+        self.menuProc.addAction(self.actionPause)
+        self.menuProc.addAction(self.actionResume)
+        self.menuProc.addAction(self.actionCancel)
         self.menuProc.addAction(self.actionExport)
         self.menuProc.addAction(self.actionHideDetected)
+        self.menuProc.addAction(self.actionProfile)
         self.menuHelp.addAction(self.actionAboutQt)
 
         self.retranslateUi(MainWindow)
@@ -131,15 +171,22 @@ class Ui_MainWindow(object):
         self.actionExit.setText(QCoreApplication.translate("MainWindow", u"Exit", None))
         self.actionReset.setText(QCoreApplication.translate("MainWindow", u"Reset", None))
         self.actionAdd.setText(QCoreApplication.translate("MainWindow", u"Add", None))
+        self.actionAddFolder.setText(QCoreApplication.translate("MainWindow", u"Add folder", None))
         self.actionClear.setText(QCoreApplication.translate("MainWindow", u"Clear", None))
+        self.actionThumbnails.setText(QCoreApplication.translate("MainWindow", u"Thumbnails", None))
         self.actionRun.setText(QCoreApplication.translate("MainWindow", u"Run", None))
 #if QT_CONFIG(shortcut)
         self.actionRun.setShortcut(QCoreApplication.translate("MainWindow", u"F5", None))
 #endif // QT_CONFIG(shortcut)
+        self.actionWatch.setText(QCoreApplication.translate("MainWindow", u"Watch", None))
+        self.actionPause.setText(QCoreApplication.translate("MainWindow", u"Pause", None))
+        self.actionResume.setText(QCoreApplication.translate("MainWindow", u"Resume", None))
+        self.actionCancel.setText(QCoreApplication.translate("MainWindow", u"Cancel", None))
         self.actionExport.setText(QCoreApplication.translate("MainWindow", u"Export", None))
         self.actionAboutQt.setText(QCoreApplication.translate("MainWindow", u"AboutQt", None))
         self.actionConfig.setText(QCoreApplication.translate("MainWindow", u"Config", None))
         self.actionHideDetected.setText(QCoreApplication.translate("MainWindow", u"HideDetected", None))
+        self.actionProfile.setText(QCoreApplication.translate("MainWindow", u"Profile", None))
         self.radioButtonImageOriginal.setText(QCoreApplication.translate("MainWindow", u"Original", None))
         self.radioButtonImageThreshold.setText(QCoreApplication.translate("MainWindow", u"Threshold", None))
         self.radioButtonImageFilled.setText(QCoreApplication.translate("MainWindow", u"Filled", None))
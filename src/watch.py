@@ -0,0 +1,291 @@
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+import typing
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # 未インストールの場合はディレクトリの定期走査で監視する
+    FileSystemEventHandler = None
+    Observer = None
+
+from .detector import R
+from .detector import create_pool
+from .scan import is_jpeg
+
+
+# JPEGの終端マーカー（EOI）
+JPEG_EOI = b"\xff\xd9"
+
+
+def is_complete(filepath: str) -> bool:
+    """
+    JPEGファイルの書き込みが終わっているか
+    :param filepath: ファイルパス
+    :return: 終端マーカーで終わっているか（末尾の0埋めは無視する）
+    """
+    try:
+        with open(filepath, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - 64, 0))
+            tail = f.read()
+    except OSError:
+        return False
+    return tail.rstrip(b"\x00").endswith(JPEG_EOI)
+
+
+class FolderWatcher:
+    """
+    ディレクトリに追加されるJPEGファイルの監視
+
+    `watchdog`がインストールされている場合はOSの通知（inotify等）で、それ以外は
+    ディレクトリの定期走査（更新日時の変わったディレクトリのみ）で新しいファイルを見つける。
+    新しいファイルは、サイズが変わらず終端マーカーで終わっていることを確認してから返す。
+    終端マーカーが無いままサイズが`settle`秒変わらないファイルも、書き込みが終わったものとして返す。
+    """
+
+    def __init__(self, directory: str, recursive: bool = True, interval: float = 0.25, settle: float = 2.0, existing: bool = False, polling: bool = False):
+        """
+        :param directory: 監視するディレクトリ
+        :param recursive: サブディレクトリも監視するか
+        :param interval: ファイルの状態を確認する間隔[s]
+        :param settle: 終端マーカーの無いファイルを書き込み済みとみなすまでの時間[s]
+        :param existing: 監視開始時点で存在するファイルも返すか
+        :param polling: `watchdog`を使わずに定期走査で監視するか
+        """
+        self.directory = os.path.abspath(directory)
+        self.recursive = recursive
+        self.interval = interval
+        self.settle = settle
+        self.seen = set()
+        # 書き込み中かもしれないファイル: パス → [サイズ, 更新日時, 最終変化時刻, closeされたか]
+        self.candidates = {}
+        self.directories = {}
+        self.events = queue.Queue()
+        self.notified = threading.Event()
+        self.observer = None
+        if Observer is not None and not polling:
+            handler = FileSystemEventHandler()
+            handler.on_any_event = self._on_event
+            self.observer = Observer()
+            self.observer.schedule(handler, self.directory, recursive=recursive)
+            self.observer.start()
+        # 通知を受け始めてから走査して、その間に追加されたファイルを取りこぼさない
+        self._scan(time.monotonic(), initial=not existing)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self) -> typing.Iterator[str]:
+        while True:
+            yield from self.poll(self.interval)
+
+    def close(self) -> None:
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def discard(self, filepaths: typing.Iterable[str]) -> None:
+        """
+        処理済みのファイルを監視対象から外す
+        :param filepaths: ファイルパス
+        """
+        for filepath in filepaths:
+            filepath = os.path.abspath(filepath)
+            self.seen.add(filepath)
+            self.candidates.pop(filepath, None)
+
+    def poll(self, timeout: float = 0.0) -> list[str]:
+        """
+        書き込みの終わった新しいファイルの取得
+        :param timeout: 該当するファイルが無い場合に待つ最大時間[s]
+        :return: ファイルパスのリスト
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if self.observer is None:
+                self._scan(now)
+            else:
+                self._drain()
+            ready = self._check(now)
+            if ready or now >= deadline:
+                return ready
+            wait = min(self.interval, deadline - now)
+            if self.observer is None:
+                time.sleep(wait)
+            else:
+                # 書き込み中のファイルがcloseされた場合もすぐに確認する
+                self.notified.wait(wait)
+
+    def _on_event(self, event) -> None:
+        # watchdogのスレッドから呼ばれる
+        if event.is_directory:
+            return
+        closed = event.event_type == "closed"
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path and event.event_type != "deleted":
+                self.events.put((os.fsdecode(path), closed))
+        self.notified.set()
+
+    def _drain(self) -> None:
+        self.notified.clear()
+        now = time.monotonic()
+        while True:
+            try:
+                filepath, closed = self.events.get_nowait()
+            except queue.Empty:
+                return
+            self._add(filepath, now)
+            if closed and filepath in self.candidates:
+                self.candidates[filepath][3] = True
+
+    def _add(self, filepath: str, now: float) -> None:
+        if filepath in self.seen or filepath in self.candidates or not is_jpeg(filepath):
+            return
+        self.candidates[filepath] = [-1, -1, now, False]
+
+    def _scan(self, now: float, initial: bool = False) -> None:
+        """
+        更新日時の変わったディレクトリの走査
+        更新日時の分解能が粗いファイルシステムでも取りこぼさないよう、最近更新されたディレクトリは毎回走査する
+        """
+        stack = [self.directory]
+        while stack:
+            dirname = stack.pop()
+            try:
+                mtime = os.stat(dirname).st_mtime
+            except OSError:
+                self.directories.pop(dirname, None)
+                continue
+            if self.directories.get(dirname) == mtime and time.time() - mtime > 2.0:
+                stack.extend(x for x in self.directories if os.path.dirname(x) == dirname)
+                continue
+            self.directories[dirname] = mtime
+            try:
+                entries = list(os.scandir(dirname))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        stack.append(entry.path)
+                elif initial:
+                    self.seen.add(entry.path)
+                else:
+                    self._add(entry.path, now)
+
+    def _check(self, now: float) -> list[str]:
+        ready = []
+        for filepath, state in list(self.candidates.items()):
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                # 一時ファイルがリネームされた等
+                del self.candidates[filepath]
+                continue
+            size, mtime, changed, closed = state
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                state[:3] = [st.st_size, st.st_mtime_ns, now]
+                if not closed:
+                    continue
+            if st.st_size == 0:
+                continue
+            if is_complete(filepath) or now - state[2] >= self.settle:
+                del self.candidates[filepath]
+                self.seen.add(filepath)
+                ready.append(filepath)
+        ready.sort()
+        return ready
+
+
+def with_previous() -> typing.Callable[[str], dict]:
+    """
+    `map_watch()`の`arguments`用に、直前に追加されたファイルを`previous`として渡す関数を作る（`min_change`の判定用）
+    前のファイルを同じプロセスで処理した場合のみ比較するため、並列処理では比較しない画像もある
+    :return: ファイルパスを受け取り、`dict(previous=直前のファイルパス or None)`を返す関数
+    """
+    last = None
+
+    def arguments(filepath: str) -> dict:
+        nonlocal last
+        previous, last = last, filepath
+        return dict(previous=previous)
+
+    return arguments
+
+
+def map_watch(func: typing.Callable[[str], R], watcher: FolderWatcher, jobs: int = 1, stop: typing.Optional[threading.Event] = None, idle: typing.Optional[typing.Callable[[], None]] = None, mp_context=None, return_exceptions: bool = False, arguments: typing.Optional[typing.Callable[[str], dict]] = None) -> typing.Iterator[tuple[str, typing.Union[R, Exception]]]:
+    """
+    監視中のディレクトリに追加されたファイルを順次処理する
+    `map_files()`と異なり、新しいファイルを待っている間も完了した処理の結果をすぐに返す
+    :param func: 処理関数（プロセス間で受け渡すためpickle可能であること）
+    :param watcher: ディレクトリの監視
+    :param jobs: 並列数（1以下の場合はプロセスを使わず逐次実行）
+    :param stop: 設定されたら監視を終了する（処理中のファイルの結果は返す）
+    :param idle: 返す結果が無いまま待った後に呼び出す関数
+    :param mp_context: `multiprocessing`のコンテキスト（未指定の場合はプラットフォーム既定）
+    :param return_exceptions: `True`の場合は処理中の例外を送出せず処理結果として返す
+    :param arguments: ファイルパスを受け取り、処理関数に追加で渡す引数を返す関数（追加された順に呼び出す）
+    :return: `(ファイルパス, 処理結果)`のイテレーター
+    """
+    def stopped() -> bool:
+        return stop is not None and stop.is_set()
+
+    def wait() -> None:
+        if idle is not None:
+            idle()
+
+    def options(filepath: str) -> dict:
+        return {} if arguments is None else arguments(filepath)
+
+    if jobs <= 1:
+        while not stopped():
+            filepaths = watcher.poll(watcher.interval)
+            if not filepaths:
+                wait()
+            for filepath in filepaths:
+                try:
+                    value = func(filepath, **options(filepath))
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    value = e
+                yield filepath, value
+        return
+    executor = create_pool(jobs, mp_context)
+    running = {}
+    try:
+        while not stopped():
+            # 処理中のものがある間は新しいファイルを待たずに結果を確認する
+            for filepath in watcher.poll(0.0 if running else watcher.interval):
+                running[executor.submit(func, filepath, **options(filepath))] = filepath
+            if not running:
+                wait()
+                continue
+            done, _ = concurrent.futures.wait(running, timeout=watcher.interval, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                wait()
+            for future in done:
+                filepath = running.pop(future)
+                if return_exceptions:
+                    yield filepath, future.exception() or future.result()
+                else:
+                    yield filepath, future.result()
+        for future in concurrent.futures.as_completed(list(running)):
+            filepath = running.pop(future)
+            if return_exceptions:
+                yield filepath, future.exception() or future.result()
+            else:
+                yield filepath, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -1,14 +1,29 @@
-import io
+import functools
+import multiprocessing
 import os
-import shutil
+import sqlite3
+import threading
+import time
 import traceback
 
 from PySide2.QtCore import Signal
 from PySide2.QtCore import Slot
 from PySide2.QtCore import QObject
 
-from .configdialog import Config
+from . import export
+from .cache import ResultCache
+from .config import Config
 from .detector import detect_meteor
+from .model import FetchObject
+from .pipeline import map_detect
+from .profiling import Profiler
+from .profiling import profile_call
+from .reader import ReadAhead
+from .result import ImageResult
+from .scan import scan_jpegs
+from .watch import FolderWatcher
+from .watch import map_watch
+from .watch import with_previous
 
 
 class Worker(QObject):
@@ -25,60 +40,344 @@ class Worker(QObject):
         super().__init__(parent)
 
 
-class FileCopyWorker(Worker):
-    def __init__(self, filelist: list[str], dest: str, parent=None):
+class DirectoryScanWorker(Worker):
+    """
+    Find JPEG files under a directory with ``scan.scan_jpegs()``.
+
+    The first model page is emitted as soon as it is found so the list fills
+    at once; later files are batched by time, and the model shows them page by
+    page as the view reaches them. ``cancel()`` is called directly from the
+    GUI thread.
+    """
+
+    # [filepath, ...]
+    filesFound = Signal(list)
+
+    # files of the first filesFound
+    CHUNK_SIZE = FetchObject.FETCHSIZE
+    # interval of filesFound [s]
+    UPDATE_INTERVAL = 0.2
+
+    def __init__(self, directory: str, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.count = 0
+        # [(path, message), ...] of the directories which could not be read
+        self.failures = []
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _onerror(self, e: OSError):
+        self.failures.append((e.filename, e.strerror))
+
+    @Slot()
+    def run(self):
+        chunk = []
+        updated = time.monotonic()
+        for filepath in scan_jpegs(self.directory, onerror=self._onerror):
+            if self._cancelled.is_set():
+                break
+            chunk.append(filepath)
+            now = time.monotonic()
+            if now - updated >= self.UPDATE_INTERVAL or (self.count == 0 and len(chunk) >= self.CHUNK_SIZE):
+                updated = now
+                self.count += len(chunk)
+                self.filesFound.emit(chunk)
+                self.message.emit(self.tr("Scanning: {} files").format(self.count))
+                chunk = []
+        if chunk:
+            self.count += len(chunk)
+            self.filesFound.emit(chunk)
+        if self._cancelled.is_set():
+            self.aborted.emit()
+        else:
+            self.done.emit()
+
+
+class FileExportWorker(Worker):
+    """
+    Export files in parallel with ``export.export_files()``.
+
+    ``cancel()`` is called directly from the GUI thread; files already being
+    written are finished. Files which could not be exported are collected in
+    ``failures`` instead of being dropped.
+    """
+
+    # [(source, destination), ...] of the moved files
+    moved = Signal(list)
+
+    # minimum interval of updateProgress [s]
+    UPDATE_INTERVAL = 0.05
+
+    def __init__(self, filelist: list[str], dest: str, mode: str = export.COPY, threads: int = export.DEFAULT_THREADS, parent=None):
         super().__init__(parent)
         self.filelist = filelist
         self.dest = dest
+        self.mode = mode
+        self.threads = threads
+        self.counts = dict.fromkeys((export.COPIED, export.LINKED, export.MOVED, export.SKIPPED), 0)
+        # [(filepath, message), ...]
+        self.failures = []
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled.is_set()
 
     @Slot()
     def run(self):
         self.initializeProgress.emit(0, len(self.filelist))
-        for i, filepath in enumerate(self.filelist, 1):
-            self.updateProgress.emit(i)
-            if not os.path.exists(filepath):
-                continue
-            dstpath = os.path.join(self.dest, os.path.basename(filepath))
-            try:
-                shutil.copyfile(filepath, dstpath)
-            except OSError:
-                pass
-        self.done.emit()
+        moved = []
+        updated = 0.0
+        i = 0
+        try:
+            results = export.export_files(self.filelist, self.dest, self.mode, self.threads, stop=self._cancelled)
+            for i, (filepath, result) in enumerate(results, 1):
+                if isinstance(result, Exception):
+                    self.failures.append((filepath, str(result)))
+                else:
+                    dstpath, status = result
+                    self.counts[status] += 1
+                    if status == export.MOVED:
+                        moved.append((filepath, dstpath))
+                now = time.monotonic()
+                if now - updated >= self.UPDATE_INTERVAL:
+                    updated = now
+                    self.updateProgress.emit(i)
+        except OSError as e:
+            # destination cannot be created
+            self.failures.append((self.dest, str(e)))
+        self.updateProgress.emit(i)
+        if moved:
+            self.moved.emit(moved)
+        if self._cancelled.is_set():
+            self.aborted.emit()
+        else:
+            self.done.emit()
 
 
 class MeteorDetectWorker(Worker):
+    """
+    Detect meteors over a process pool.
+
+    ``pause()``, ``resume()`` and ``cancel()`` are called directly from the GUI
+    thread because ``run()`` keeps this worker's thread busy until it returns.
+    At most one image per pool process is still in flight when they take effect.
+    """
 
-    updateContext = Signal(str, tuple, list, list)
+    # [(filepath, ImageResult), ...]
+    updateContexts = Signal(list)
+    # one-line summary, full summary
+    updateProfile = Signal(str, str)
 
-    def __init__(self, filelist: list[str], config: Config, parent=None):
+    # minimum interval of updateContexts and updateProgress [s]
+    UPDATE_INTERVAL = 0.05
+    # minimum interval of updateProfile [s]
+    PROFILE_INTERVAL = 1.0
+
+    def __init__(self, filelist: list[str], config: Config, profile: bool = False, parent=None):
         super().__init__(parent)
         self.filelist = filelist
         self.config = config
         self.detected_list = []
+        self.profiler = Profiler() if profile else None
+        self._profileReported = 0.0
+        # results and progress not emitted yet
+        self._contexts = []
+        self._progress = None
+        self._flushed = 0.0
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        # parameters of this run, fixed on first use so results keep the settings they were produced with
+        self._params = None
+
+    def jobs(self) -> int:
+        if self.config.jobs > 0:
+            return self.config.jobs
+        return os.cpu_count() or 1
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # wake up paused run()
+        self._running.set()
+
+    def isPaused(self) -> bool:
+        return not self._running.is_set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def params(self) -> dict:
+        if self._params is not None:
+            return self._params
+        self._params = dict(
+            input_threshold=self.config.input_threshold,
+            input_maxvalue=self.config.input_maxvalue,
+            area_threshold=self.config.area_threshold,
+            buffer_ratio=self.config.buffer_ratio,
+            line_threshold=self.config.line_threshold,
+            area_method=self.config.area_method,
+            prescreen=self.config.prescreen,
+            mask=self.config.mask,
+            min_pixels=self.config.min_pixels,
+            min_residual=self.config.min_residual,
+            min_change=self.config.min_change
+        )
+        return self._params
+
+    def reportProfile(self, force: bool = False):
+        if self.profiler is None or not self.profiler.frames:
+            return
+        now = time.monotonic()
+        if not force and now - self._profileReported < self.PROFILE_INTERVAL:
+            return
+        self._profileReported = now
+        self.updateProfile.emit(self.profiler.brief(), self.profiler.summary())
+
+    def addResult(self, filepath: str, result):
+        if isinstance(result, Exception):
+            message = "".join(traceback.format_exception(type(result), result, result.__traceback__))
+            self.error.emit(message)
+            return
+        lines, contours, shape = result
+        # contours are not kept; the preview computes them again on demand
+        self._contexts.append((filepath, ImageResult.from_detection(shape, contours, lines, self.params())))
+        if lines is not None:
+            self.detected_list.append(filepath)
+
+    def setProgress(self, value: int):
+        self._progress = value
+
+    def flush(self, force: bool = False):
+        """
+        Emit the results and progress collected since the last flush,
+        at most once per UPDATE_INTERVAL unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._flushed < self.UPDATE_INTERVAL:
+            return
+        self._flushed = now
+        self.emitPending()
+        self.reportProfile(force)
+
+    def emitPending(self):
+        if self._contexts:
+            contexts, self._contexts = self._contexts, []
+            self.updateContexts.emit(contexts)
+        if self._progress is not None:
+            self.updateProgress.emit(self._progress)
+            self._progress = None
+
+    def waitRunning(self):
+        if not self._running.is_set():
+            # show everything done before pausing
+            self.flush(force=True)
+        self._running.wait()
 
     @Slot()
     def run(self):
         self.initializeProgress.emit(0, len(self.filelist))
-        for i, filepath in enumerate(self.filelist, 1):
-            self.updateProgress.emit(i)
-            if not os.path.exists(filepath):
-                continue
-            try:
-                lines, contours, shape = detect_meteor(
-                    filepath,
-                    input_threshold=self.config.input_threshold,
-                    input_maxvalue=self.config.input_maxvalue,
-                    area_threshold=self.config.area_threshold,
-                    buffer_ratio=self.config.buffer_ratio,
-                    line_threshold=self.config.line_threshold
-                )
-                self.updateContext.emit(filepath, shape, contours, lines)
-            except:
-                buf = io.StringIO()
-                traceback.print_exc(file=buf)
-                buf.seek(0)
-                message = buf.read()
-                self.error.emit(message)
-            if lines is not None:
-                self.detected_list.append(filepath)
-        self.done.emit()
+        params = self.params()
+        jobs = self.jobs()
+        filelist = [x for x in self.filelist if os.path.exists(x)]
+        skipped = len(self.filelist) - len(filelist)
+        # spawn: forking a process which owns Qt threads is not safe
+        options = dict(jobs=jobs, ordered=False, backlog=jobs,
+                       mp_context=multiprocessing.get_context("spawn"), return_exceptions=True)
+        try:
+            cache = ResultCache()
+        except (OSError, sqlite3.Error):
+            cache = None
+        if self.config.read_ahead > 0:
+            options["read_ahead"] = ReadAhead(self.config.read_ahead, self.config.read_ahead_memory * 1024 * 1024)
+        results = map_detect(filelist, params, cache, profiler=self.profiler, **options)
+        try:
+            for i, (filepath, result) in enumerate(results, skipped + 1):
+                self.setProgress(i)
+                self.addResult(filepath, result)
+                self.flush()
+                self.waitRunning()
+                if self._cancelled.is_set():
+                    break
+        finally:
+            # stop feeding the pool and wait for the images in progress
+            results.close()
+            if cache is not None:
+                cache.trim()
+                cache.close()
+        self.flush(force=True)
+        if self._cancelled.is_set():
+            self.aborted.emit()
+        else:
+            self.done.emit()
+
+
+class MeteorWatchWorker(MeteorDetectWorker):
+    """
+    Detect meteors in images written to a directory until cancelled.
+
+    Each image is reported with ``filesAdded`` before its ``updateContexts``.
+    While paused, new images are queued and processed on ``resume()``.
+    """
+
+    # [filepath, ...]
+    filesAdded = Signal(list)
+
+    def __init__(self, directory: str, config: Config, profile: bool = False, parent=None):
+        super().__init__([], config, profile, parent)
+        self.directory = directory
+        self._added = []
+
+    def emitPending(self):
+        if self._added:
+            added, self._added = self._added, []
+            self.filesAdded.emit(added)
+        super().emitPending()
+
+    @Slot()
+    def run(self):
+        # busy indicator
+        self.initializeProgress.emit(0, 0)
+        jobs = self.jobs()
+        func = functools.partial(detect_meteor, **self.params())
+        if self.profiler is not None:
+            func = functools.partial(profile_call, func)
+        try:
+            watcher = FolderWatcher(self.directory)
+        except OSError as e:
+            self.error.emit(str(e))
+            self.aborted.emit()
+            return
+        # flush the last results of a burst while waiting for new images
+        # compare each image with the one written before it (MinChange)
+        arguments = with_previous() if self.params()["min_change"] > 0 else None
+        results = map_watch(func, watcher, jobs=jobs, stop=self._cancelled, idle=self.flush,
+                            mp_context=multiprocessing.get_context("spawn"), return_exceptions=True, arguments=arguments)
+        try:
+            for filepath, result in results:
+                if self.profiler is not None and not isinstance(result, Exception):
+                    result, profile = result
+                    self.profiler.add(filepath, profile)
+                self._added.append(filepath)
+                self.addResult(filepath, result)
+                self.flush()
+                self.waitRunning()
+        finally:
+            results.close()
+            watcher.close()
+        self.flush(force=True)
+        self.aborted.emit()